@@ -0,0 +1,133 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+# Dot-atom local part of at most 64 characters, then a dotted hostname ending in an alphabetic TLD
+ATOM = r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+"
+EMAIL_PATTERN = (rf"(?=[^@]{{1,64}}@){ATOM}(?:\.{ATOM})*"
+                 r"@(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,63}")
+MAX_EMAIL_LENGTH = 254
+
+# Seconds to wait for one DNS answer
+MX_TIMEOUT = float(os.environ.get('MX_TIMEOUT', 3))
+
+
+def valid_emails(emails):
+    """Boolean array: True where the address is syntactically deliverable"""
+    emails = emails.fillna('').astype(str).str.strip()
+    matches = emails.str.fullmatch(EMAIL_PATTERN).fillna(False).to_numpy(dtype=bool)
+    return matches & (emails.str.len().to_numpy() <= MAX_EMAIL_LENGTH)
+
+
+def email_domains(emails):
+    """Lower-cased domain of every address ('' where there is no @)"""
+    return emails.fillna('').astype(str).str.strip().str.rpartition('@')[2].str.lower()
+
+
+def address_resolver(domain):
+    """A domain with an A/AAAA record can receive mail (RFC 5321 implicit MX)
+
+    Returns True, False if the name does not exist, or None if DNS could not answer.
+    """
+    try:
+        socket.getaddrinfo(domain, 25, proto=socket.IPPROTO_TCP)
+        return True
+    except socket.gaierror as e:
+        if e.errno == socket.EAI_NONAME:
+            return False
+        return None
+    except OSError:
+        return None
+
+
+def mx_resolver(domain):
+    """MX lookup with dnspython, falling back to the implicit MX when there is no MX record"""
+    import dns.exception
+    import dns.resolver
+    try:
+        dns.resolver.resolve(domain, 'MX', lifetime=MX_TIMEOUT)
+        return True
+    except dns.resolver.NXDOMAIN:
+        return False
+    except dns.resolver.NoAnswer:
+        return address_resolver(domain)
+    except dns.exception.DNSException:
+        return None
+
+
+def default_resolver():
+    """mx_resolver if dnspython is installed, otherwise address_resolver"""
+    try:
+        import dns.resolver  # noqa: F401
+        return mx_resolver
+    except ImportError:
+        return address_resolver
+
+
+class DomainChecker:
+    """Per-domain deliverability answers from a pluggable resolver, cached for ttl seconds
+
+    resolver is any callable taking a domain and returning True (accepts
+    mail), False (definitely does not) or None (unknown); tests can pass a
+    dict lookup. Only False answers make recipients invalid.
+    """
+
+    def __init__(self, resolver=None, ttl=3600, workers=16):
+        self.resolver = resolver or default_resolver()
+        self.ttl = ttl
+        self.workers = workers
+        self.lookups = 0
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def check(self, domains):
+        """{domain: answer} for every distinct domain, resolving cache misses in parallel"""
+        now = time.monotonic()
+        answers = {}
+        missing = []
+        with self._lock:
+            for domain in set(domains):
+                cached = self._cache.get(domain)
+                if cached is not None and cached[1] > now:
+                    answers[domain] = cached[0]
+                else:
+                    missing.append(domain)
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(missing))) as pool:
+                resolved = dict(zip(missing, pool.map(self._resolve, missing)))
+            expires = time.monotonic() + self.ttl
+            with self._lock:
+                self.lookups += len(missing)
+                for domain, answer in resolved.items():
+                    self._cache[domain] = (answer, expires)
+            answers.update(resolved)
+        return answers
+
+    def undeliverable(self, domains):
+        """The domains that cannot receive mail"""
+        return {domain for domain, answer in self.check(domains).items() if answer is False}
+
+    def _resolve(self, domain):
+        try:
+            return self.resolver(domain)
+        except Exception:
+            return None
+
+
+def spread_by_domain(prepared):
+    """Reorder a prepared chunk round-robin across recipient domains
+
+    The first row of every domain comes first, then every second row, and so
+    on, so consecutive sends hit different providers instead of queueing
+    behind one domain's rate limit.
+    """
+    codes, _ = pd.factorize(email_domains(prepared['recruiter_email']))
+    rank = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+    return prepared.iloc[np.lexsort((codes, rank))]
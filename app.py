@@ -1,28 +1,124 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file, Response
+import atexit
 import os
-import pandas as pd
 from datetime import datetime
 import json
-from demo import EmailAutomation
 import threading
+from demo import EmailAutomation
+from template_engine import EmailTemplate
+from contacts import build_dataset, load_dataset, open_contacts
+from send_queue import CANCELLED, COMPLETED, RUNNING, SendQueue
+from campaign_state import CampaignRegistry
+from scheduler import CampaignScheduler
+from rate_limiter import SenderQuotas
+from retry import RetryPolicy
+from recipient_index import RecipientIndex
+from address_validation import DomainChecker, valid_emails
+from preflight import screen
+from process_engine import SHARD_KEYS
+from metrics import REGISTRY
+from profiler import CampaignProfiles
+from preview import SEARCH_COLUMNS, preview_page
+from smtp_pool import close_all_pools
 import time
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'  # Change this to a random secret key
 
+# Number of pooled SMTP sessions kept per sender account
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 4))
+
+# Parallel send workers per campaign (each holds its own SMTP session)
+CAMPAIGN_WORKERS = int(os.environ.get('CAMPAIGN_WORKERS', 1))
+MAX_CAMPAIGN_WORKERS = int(os.environ.get('MAX_CAMPAIGN_WORKERS', 16))
+
+# Sends allowed back to back before the max_rate ceiling kicks in
+RATE_BURST = int(os.environ.get('RATE_BURST', 5))
+
+# 'threaded' runs one OS thread per worker; 'async' runs every session on one event loop;
+# 'process' splits the list across worker processes, each running `workers` threads
+SEND_ENGINES = ('threaded', 'async', 'process')
+
+# Worker processes per campaign for the 'process' engine
+CAMPAIGN_PROCESSES = int(os.environ.get('CAMPAIGN_PROCESSES', 0)) or os.cpu_count() or 1
+MAX_CAMPAIGN_PROCESSES = int(os.environ.get('MAX_CAMPAIGN_PROCESSES', 8))
+
+# Campaigns sending at the same time; further campaigns queue until a slot frees up
+MAX_CONCURRENT_CAMPAIGNS = int(os.environ.get('MAX_CONCURRENT_CAMPAIGNS', 2))
+
+# Per-sender caps shared by all of that sender's campaigns (unset means unlimited)
+SENDER_HOURLY_QUOTA = int(os.environ.get('SENDER_HOURLY_QUOTA', 0)) or None
+SENDER_DAILY_QUOTA = int(os.environ.get('SENDER_DAILY_QUOTA', 0)) or None
+sender_quotas = SenderQuotas(hourly=SENDER_HOURLY_QUOTA, daily=SENDER_DAILY_QUOTA)
+
+# Tries per recipient for temporary failures (4xx replies, dropped connections), backing off exponentially
+RETRY_MAX_ATTEMPTS = int(os.environ.get('RETRY_MAX_ATTEMPTS', 4))
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', 30))
+retry_policy = RetryPolicy(max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY)
+
+# SQLite file holding per-recipient send state so campaigns survive restarts
+SEND_QUEUE_DB = os.environ.get('SEND_QUEUE_DB', 'campaigns.db')
+
+# Hard bounces are always suppressed in later campaigns; set to 0 to allow re-contacting reached addresses
+SUPPRESS_CONTACTED = os.environ.get('SUPPRESS_CONTACTED', '1') != '0'
+
+# Look up each recipient domain's mail servers before sending (answers cached per domain)
+MX_CHECK = os.environ.get('MX_CHECK', '0') == '1'
+
+# Opened by setup_services() when the server starts, not at import: the 'process'
+# engine's spawned shards re-import this module and must not open the database
+# or start scheduler threads of their own
+campaign_scheduler = None
+send_queue = None
+recipient_index = None
+domain_checker = None
+
 # Global variables for email automation
 email_automation = None
-campaign_status = {
-    'running': False,
-    'progress': 0,
-    'total': 0,
-    'sent': 0,
-    'failed': 0,
-    'current_email': '',
-    'start_time': None,
-    'end_time': None,
-    'results': None
-}
+# Screening of the previewed upload, reused across preview pages until the upload or suppressions change
+preview_screening = {'key': None, 'screening': None}
+# Progress of every campaign this process has run; safe to read while sends are in flight
+campaigns = CampaignRegistry()
+# Sampling profilers switched on per campaign, and the profile files they write
+profiles = CampaignProfiles()
+# Held while a campaign is checked, registered and queued
+launch_lock = threading.Lock()
+
+# The sampling profiler only sees this process's threads, not the 'process' engine's shards
+PROCESS_PROFILE_ERROR = ("Profiling samples the threads of the web server process, but the 'process' engine "
+                         "sends from separate worker processes; use the threaded or async engine to profile a campaign")
+
+# Snapshot fields pushed to /campaign_events; results (with failed_emails) stay on /campaign_status
+PROGRESS_FIELDS = ('campaign_id', 'sender_email', 'queued', 'running', 'paused', 'cancelled', 'total',
+                   'progress', 'sent', 'failed', 'current_email', 'start_time', 'end_time', 'error')
+
+# Minimum gap between events on one SSE stream; changes in between are coalesced
+SSE_MIN_INTERVAL = float(os.environ.get('SSE_MIN_INTERVAL', 0.5))
+SSE_HEARTBEAT_SECONDS = 15
+
+def setup_services():
+    """Create the campaign database, scheduler and working directories"""
+    global campaign_scheduler, send_queue, recipient_index, domain_checker
+    campaign_scheduler = CampaignScheduler(MAX_CONCURRENT_CAMPAIGNS)
+    send_queue = SendQueue(SEND_QUEUE_DB)
+    # Sends of the past day still count against the sender caps after a restart
+    sender_quotas.seed(send_queue.sent_times(time.time() - 86400))
+    recipient_index = RecipientIndex(SEND_QUEUE_DB, suppress_contacted=SUPPRESS_CONTACTED)
+    domain_checker = DomainChecker() if MX_CHECK else None
+    # Say QUIT on pooled SMTP sessions when the server exits
+    atexit.register(close_all_pools)
+
+    # Create necessary directories
+    os.makedirs('uploads', exist_ok=True)
+    os.makedirs('templates', exist_ok=True)
+    os.makedirs('static/css', exist_ok=True)
+    os.makedirs('static/js', exist_ok=True)
+
+def campaign_state(campaign_id=None):
+    """State for campaign_id, or the most recently started campaign; None if unknown"""
+    if campaign_id:
+        return campaigns.get(campaign_id)
+    return campaigns.current()
 
 @app.route('/')
 def index():
@@ -49,7 +145,10 @@ def configure():
             return render_template('configure.html')
         
         try:
-            email_automation = EmailAutomation(sender_email, sender_password, sender_name)
+            email_automation = EmailAutomation(sender_email, sender_password, sender_name,
+                                               pool_size=SMTP_POOL_SIZE)
+            if app.config.get('email_template'):
+                email_automation.template = EmailTemplate.from_config(app.config['email_template'])
             flash('Email configuration saved successfully!', 'success')
             return redirect(url_for('upload'))
         except Exception as e:
@@ -77,18 +176,22 @@ def upload():
             os.makedirs('uploads', exist_ok=True)
             file.save(filepath)
             
-            # Validate CSV structure
+            # Validate CSV structure once and cache a columnar copy for preview and sending
             try:
-                df = pd.read_csv(filepath)
-                required_columns = ['company_name', 'role', 'recruiter_email']
-                if not all(col in df.columns for col in required_columns):
-                    flash(f'CSV must contain columns: {required_columns}', 'error')
+                try:
+                    source = build_dataset(filepath)
+                except ValueError as e:
+                    flash(str(e), 'error')
                     os.remove(filepath)
                     return render_template('upload.html')
                 
                 # Store file info in session or global variable
                 app.config['current_csv'] = filepath
-                flash(f'File uploaded successfully! Found {len(df)} contacts.', 'success')
+                invalid = len(screen(source, domain_checker=domain_checker).invalid)
+                message = f'File uploaded successfully! Found {source.row_count} contacts.'
+                if invalid:
+                    message += f' {invalid} invalid address{"" if invalid == 1 else "es"} will be skipped.'
+                flash(message, 'success')
                 return redirect(url_for('preview'))
                 
             except Exception as e:
@@ -172,27 +275,55 @@ def preview():
         return redirect(url_for('upload'))
     
     try:
-        df = pd.read_csv(csv_file)
-        # Show first 10 rows for preview
-        preview_data = df.head(10).to_dict('records')
-        total_rows = len(df)
+        # Pages are sliced out of the columnar dataset by row offset; the total comes from its metadata
+        source = load_dataset(csv_file) or build_dataset(csv_file)
+        query = request.args.get('q', '')
+        filters = {key: request.args.get(key, '') for key in SEARCH_COLUMNS}
+        page = preview_page(source, request.args.get('page', 1, type=int), query, filters)
+        screening = preview_screening_for(csv_file, source)
+        skipped = len(screening.invalid) + len(screening.duplicates) + len(screening.suppressed)
+        email_valid = valid_emails(page.rows['recruiter_email'])
         return render_template('preview.html', 
-                             preview_data=preview_data, 
-                             total_rows=total_rows,
-                             columns=df.columns.tolist())
+                             preview_data=page.rows.to_dict('records'), 
+                             row_numbers=(page.rows.index + 1).tolist(),
+                             email_valid=email_valid.tolist(),
+                             page=page.page,
+                             pages=page.pages,
+                             page_size=page.page_size,
+                             matches=page.matches,
+                             query=query,
+                             filters=filters,
+                             # Non-empty search fields, carried over to the page links
+                             search_args={key: value for key, value in {'q': query, **filters}.items() if value},
+                             total_rows=source.row_count,
+                             columns=source.columns,
+                             valid_rows=screening.total - len(screening.invalid),
+                             invalid_rows=len(screening.invalid),
+                             duplicate_rows=len(screening.duplicates),
+                             suppressed_rows=len(screening.suppressed),
+                             sendable_rows=screening.total - skipped,
+                             top_domains=list(screening.domains.head(10).items()))
     except Exception as e:
         flash(f'Error reading CSV file: {str(e)}', 'error')
         return redirect(url_for('upload'))
 
+def preview_screening_for(csv_file, source):
+    """Screening of the upload, recomputed only when the file or the suppression list changed"""
+    key = (csv_file, source.meta['source_mtime_ns'], recipient_index.version)
+    if preview_screening['key'] != key:
+        preview_screening['screening'] = screen(source, recipient_index, domain_checker=domain_checker)
+        preview_screening['key'] = key
+    return preview_screening['screening']
+
 @app.route('/campaign')
 def campaign():
     """Campaign management page"""
-    return render_template('campaign.html', status=campaign_status)
+    return render_template('campaign.html', status=campaigns.current().snapshot())
 
 @app.route('/start_campaign', methods=['POST'])
 def start_campaign():
     """Start email campaign"""
-    global campaign_status, email_automation
+    global email_automation
     
     if email_automation is None:
         return jsonify({'error': 'Please configure email settings first'}), 400
@@ -201,181 +332,377 @@ def start_campaign():
     if not csv_file or not os.path.exists(csv_file):
         return jsonify({'error': 'No CSV file found. Please upload a file first.'}), 400
     
-    if campaign_status['running']:
-        return jsonify({'error': 'Campaign is already running'}), 400
-    
     # Get campaign parameters
     test_mode = request.json.get('test_mode', True)
     delay_seconds = request.json.get('delay_seconds', 2)
     resume_path = request.json.get('resume_path', app.config.get('current_resume', 'Nirmal_Boghara_FTE_Resume.pdf'))
+    workers = max(1, min(int(request.json.get('workers') or CAMPAIGN_WORKERS), MAX_CAMPAIGN_WORKERS))
+    max_rate = request.json.get('max_rate')
+    domain_rate = request.json.get('domain_rate')
+    burst = max(1, int(request.json.get('burst') or RATE_BURST))
+    engine = request.json.get('engine', 'threaded')
+    if engine not in SEND_ENGINES:
+        return jsonify({'error': f'Unknown send engine: {engine}'}), 400
+    processes = max(1, min(int(request.json.get('processes') or CAMPAIGN_PROCESSES), MAX_CAMPAIGN_PROCESSES))
+    shard_by = request.json.get('shard_by', 'domain')
+    if shard_by not in SHARD_KEYS:
+        return jsonify({'error': f'Unknown shard key: {shard_by}'}), 400
+    profile = bool(request.json.get('profile', False))
+    if profile and engine == 'process':
+        return jsonify({'error': PROCESS_PROFILE_ERROR}), 400
     
     # Check if resume exists
     if resume_path and not os.path.exists(resume_path):
         resume_path = None
     
-    # Reset campaign status
-    campaign_status.update({
-        'running': True,
-        'progress': 0,
-        'sent': 0,
-        'failed': 0,
-        'current_email': '',
-        'start_time': datetime.now().isoformat(),
-        'end_time': None,
-        'results': None
+    # The CSV may have changed since the template was saved
+    try:
+        email_automation.template.validate(current_csv_columns())
+    except ValueError as e:
+        return jsonify({'error': f'Email template does not match the CSV: {str(e)}'}), 400
+    
+    settings = {
+        'test_mode': test_mode,
+        'delay_seconds': delay_seconds,
+        'resume_path': resume_path,
+        'workers': workers,
+        'max_rate': max_rate,
+        'domain_rate': domain_rate,
+        'burst': burst,
+        'engine': engine,
+        'processes': processes,
+        'shard_by': shard_by
+    }
+    # The sender is kept with the settings so a resume sends (and is charged) as the same account
+    campaign_id = send_queue.create_campaign(csv_file, {**settings, 'sender_email': email_automation.sender_email})
+    launch_campaign(campaign_id, csv_file, settings, email_automation, profile=profile)
+    
+    queued = campaign_scheduler.active_count() > campaign_scheduler.max_concurrent
+    message = 'Campaign queued behind other campaigns' if queued else 'Campaign started successfully'
+    return jsonify({'message': message, 'campaign_id': campaign_id})
+
+@app.route('/resume_campaign', methods=['POST'])
+def resume_campaign():
+    """Resume an interrupted campaign, skipping every recipient already checkpointed"""
+    data = request.get_json(silent=True) or {}
+    campaign_id = data.get('campaign_id')
+    if not campaign_id:
+        resumable = send_queue.resumable_campaigns()
+        if not resumable:
+            return jsonify({'error': 'No campaign to resume'}), 404
+        campaign_id = resumable[0]['id']
+    return resume_campaign_by_id(campaign_id)
+
+@app.route('/campaigns/<campaign_id>/resume', methods=['POST'])
+def resume_campaign_by_id(campaign_id):
+    """Un-pause a paused campaign, or restart a stopped one from its checkpoint"""
+    state = campaigns.get(campaign_id)
+    if state is not None and state.control.paused:
+        state.control.resume()
+        state.update(paused=False)
+        return jsonify({'message': 'Campaign resumed', 'campaign_id': campaign_id})
+    
+    if email_automation is None:
+        return jsonify({'error': 'Please configure email settings first'}), 400
+    
+    campaign = send_queue.get_campaign(campaign_id)
+    if campaign is None:
+        return jsonify({'error': 'No campaign to resume'}), 404
+    if campaign['status'] == COMPLETED:
+        return jsonify({'error': 'Campaign already completed'}), 400
+    if not os.path.exists(campaign['csv_path']):
+        return jsonify({'error': 'The CSV file for this campaign no longer exists'}), 400
+    if campaign_scheduler.is_active(campaign_id):
+        return jsonify({'error': 'Campaign is already running'}), 400
+    settings = campaign['settings']
+    sender_email = settings.pop('sender_email', None)
+    if sender_email and sender_email.strip().lower() != email_automation.sender_email.strip().lower():
+        return jsonify({'error': f'This campaign was started from {sender_email}; '
+                                 f'configure that sender to resume it'}), 400
+    
+    send_queue.set_status(campaign_id, RUNNING)
+    try:
+        launch_campaign(campaign_id, campaign['csv_path'], settings, email_automation)
+    except ValueError:
+        # Lost a race with another resume of the same campaign
+        return jsonify({'error': 'Campaign is already running'}), 400
+    return jsonify({'message': 'Campaign resumed', 'campaign_id': campaign_id})
+
+@app.route('/campaigns/<campaign_id>/pause', methods=['POST'])
+def pause_campaign(campaign_id):
+    """Pause sending after the message in flight; SMTP sessions are closed until it resumes"""
+    state = campaigns.get(campaign_id)
+    if state is None or not (state.running or state.queued):
+        return jsonify({'error': 'Campaign is not running'}), 400
+    state.control.pause()
+    state.update(paused=True)
+    return jsonify({'message': 'Campaign paused', 'campaign_id': campaign_id})
+
+@app.route('/campaigns/<campaign_id>/cancel', methods=['POST'])
+def cancel_campaign(campaign_id):
+    """Stop sending after the message in flight; the checkpoint is kept for a later resume"""
+    state = campaigns.get(campaign_id)
+    if state is None:
+        return jsonify({'error': 'Unknown campaign'}), 404
+    if not (state.running or state.queued):
+        return jsonify({'error': 'Campaign is not running'}), 400
+    state.control.cancel()
+    state.update(paused=False, cancelled=True)
+    return jsonify({'message': 'Campaign stopped', 'campaign_id': campaign_id})
+
+@app.route('/campaigns/<campaign_id>/profile/start', methods=['POST'])
+def start_profile(campaign_id):
+    """Start sampling a running campaign's stacks; costs nothing while off"""
+    state = campaigns.get(campaign_id)
+    campaign = send_queue.get_campaign(campaign_id)
+    if campaign is not None and campaign['settings'].get('engine') == 'process':
+        return jsonify({'error': PROCESS_PROFILE_ERROR}), 400
+    if state is None or not state.running:
+        return jsonify({'error': 'Campaign is not running'}), 400
+    if not profiles.start(campaign_id, state.control.thread_ids):
+        return jsonify({'error': 'Campaign is already being profiled'}), 400
+    return jsonify({'message': 'Profiling started', 'campaign_id': campaign_id})
+
+@app.route('/campaigns/<campaign_id>/profile/stop', methods=['POST'])
+def stop_profile(campaign_id):
+    """Stop sampling and save the profile; returns the top functions and download links"""
+    profiler = profiles.stop(campaign_id)
+    if profiler is None:
+        return jsonify({'error': 'Campaign is not being profiled'}), 400
+    seen = sum(profiler.stacks.values()) or 1
+    return jsonify({
+        'message': 'Profiling stopped',
+        'campaign_id': campaign_id,
+        'samples': profiler.samples,
+        'top_functions': [{'function': label, 'own': round(own / seen, 4), 'total': round(total / seen, 4)}
+                          for label, own, total in profiler.top_functions(10)],
+        'summary_url': url_for('download_profile', campaign_id=campaign_id, format='summary'),
+        'folded_url': url_for('download_profile', campaign_id=campaign_id, format='folded')
     })
+
+@app.route('/campaigns/<campaign_id>/profile')
+def download_profile(campaign_id):
+    """Download a campaign's profile: ?format=summary (top functions) or folded (flame graph input)"""
+    kind = request.args.get('format', 'summary')
+    if kind not in ('summary', 'folded'):
+        return jsonify({'error': f'Unknown profile format: {kind}'}), 400
+    if profiles.running(campaign_id):
+        # Still sampling: hand out what has been collected so far
+        profiles.write(campaign_id)
+    path = profiles.path(campaign_id, kind)
+    if not os.path.exists(path):
+        return jsonify({'error': 'No profile for this campaign'}), 404
+    return send_file(os.path.abspath(path), mimetype='text/plain', as_attachment=True,
+                     download_name=os.path.basename(path))
+
+@app.route('/resumable_campaigns')
+def resumable_campaigns():
+    """Campaigns that stopped before finishing, with their checkpointed progress"""
+    resumable = []
+    for campaign in send_queue.resumable_campaigns():
+        if campaign_scheduler.is_active(campaign['id']):
+            continue
+        progress = send_queue.progress(campaign['id'])
+        campaign.update({'sent': progress['sent'], 'failed': progress['failed']})
+        resumable.append(campaign)
+    return jsonify(resumable)
+
+def launch_campaign(campaign_id, csv_file, settings, automation, profile=False):
+    """Queue a campaign on the scheduler; it sends from the durable queue once a slot is free
+
+    Raises ValueError if campaign_id is already queued or running.
+    """
+    prior = send_queue.progress(campaign_id)
+    
+    def update_progress(processed, stats, current_email):
+        """Called by the send engine under its lock after every recipient"""
+        state.record_progress(processed, stats['sent_successfully'], stats['failed_to_send'], current_email,
+                              stats['total_emails'])
     
-    # Start campaign in background thread
     def run_campaign():
-        global campaign_status
+        if state.control.cancelled:
+            # Cancelled while still queued; nothing was sent
+            state.update(queued=False, end_time=datetime.now().isoformat())
+            send_queue.set_status(campaign_id, CANCELLED)
+            return
+        state.control.join_thread()
+        if profile:
+            profiles.start(campaign_id, state.control.thread_ids)
         try:
-            # Read CSV to get total count
-            df = pd.read_csv(csv_file)
-            total_emails = len(df)
-            campaign_status['total'] = total_emails
-            
-            # Create a custom email automation that updates progress
-            class ProgressEmailAutomation(EmailAutomation):
-                def send_bulk_emails(self, csv_file_path, resume_path=None, delay_seconds=2, test_mode=True):
-                    global campaign_status
-                    try:
-                        df = pd.read_csv(csv_file_path)
-                        required_columns = ['company_name', 'role', 'recruiter_email']
-                        if not all(col in df.columns for col in required_columns):
-                            raise ValueError(f"CSV must contain columns: {required_columns}")
-                        
-                        has_recruiter_name = 'recruiter_first_name' in df.columns
-                        stats = {
-                            'total_emails': len(df),
-                            'sent_successfully': 0,
-                            'failed_to_send': 0,
-                            'start_time': datetime.now(),
-                            'failed_emails': []
-                        }
-                        
-                        if not test_mode:
-                            if not self.connect_to_smtp():
-                                return stats
-                        
-                        for index, row in df.iterrows():
-                            company_name = row['company_name']
-                            role = row['role']
-                            recruiter_email = row['recruiter_email']
-                            recruiter_first_name = row.get('recruiter_first_name') if has_recruiter_name else None
-                            
-                            # Update progress
-                            campaign_status['current_email'] = recruiter_email
-                            campaign_status['progress'] = index + 1
-                            campaign_status['sent'] = stats['sent_successfully']
-                            campaign_status['failed'] = stats['failed_to_send']
-                            
-                            # Debug logging
-                            print(f"Progress: {index + 1}/{len(df)} - {recruiter_email}")
-                            
-                            subject, html_body, text_body = self.create_personalized_email(
-                                company_name, role, recruiter_email, recruiter_first_name, resume_path
-                            )
-                            
-                            if test_mode:
-                                self.logger.info(f"TEST MODE - Would send to {recruiter_email} ({company_name} - {role})")
-                                stats['sent_successfully'] += 1
-                            else:
-                                if self.send_email(recruiter_email, subject, html_body, text_body, resume_path):
-                                    stats['sent_successfully'] += 1
-                                else:
-                                    stats['failed_to_send'] += 1
-                                    stats['failed_emails'].append(recruiter_email)
-                                
-                                time.sleep(delay_seconds)
-                            
-                            # Update final counts
-                            campaign_status['sent'] = stats['sent_successfully']
-                            campaign_status['failed'] = stats['failed_to_send']
-                        
-                        if not test_mode:
-                            self.disconnect_from_smtp()
-                        
-                        stats['end_time'] = datetime.now()
-                        stats['duration_seconds'] = int((stats['end_time'] - stats['start_time']).total_seconds())
-                        return stats
-                        
-                    except Exception as e:
-                        self.logger.error(f"Error in bulk email campaign: {str(e)}")
-                        return stats
+            # The cached dataset already knows its row count
+            total_emails = open_contacts(csv_file).row_count
+            state.update(queued=False, running=True, total=total_emails, start_time=datetime.now().isoformat())
             
-            # Use the progress-aware email automation
-            progress_automation = ProgressEmailAutomation(
-                email_automation.sender_email,
-                email_automation.sender_password,
-                email_automation.sender_name
-            )
-            
-            results = progress_automation.send_bulk_emails(
+            results = automation.send_bulk_emails(
                 csv_file_path=csv_file,
-                resume_path=resume_path,
-                delay_seconds=delay_seconds,
-                test_mode=test_mode
+                total_rows=total_emails,
+                progress_callback=update_progress,
+                send_queue=send_queue,
+                campaign_id=campaign_id,
+                quota=sender_quotas.get(automation.sender_email),
+                control=state.control,
+                retry_policy=retry_policy,
+                recipient_index=recipient_index,
+                domain_checker=domain_checker,
+                **settings
             )
             
-            campaign_status.update({
-                'running': False,
-                'end_time': datetime.now().isoformat(),
-                'results': results,
-                'sent': results['sent_successfully'],
-                'failed': results['failed_to_send'],
-                'total': results['total_emails']
-            })
+            state.update(
+                running=False,
+                paused=False,
+                cancelled=results.get('cancelled', False),
+                end_time=datetime.now().isoformat(),
+                # Set when send processes failed; the campaign stays resumable
+                error=results.get('error'),
+                results=results,
+                sent=results['sent_successfully'],
+                failed=results['failed_to_send'],
+                total=results['total_emails']
+            )
         except Exception as e:
-            campaign_status.update({
-                'running': False,
-                'end_time': datetime.now().isoformat(),
-                'error': str(e)
-            })
-    
-    thread = threading.Thread(target=run_campaign)
-    thread.daemon = True
-    thread.start()
+            state.update(
+                queued=False,
+                running=False,
+                paused=False,
+                end_time=datetime.now().isoformat(),
+                error=str(e)
+            )
+        finally:
+            state.control.leave_thread()
+            # A profile still running when the campaign ends is written out for download
+            profiles.stop(campaign_id)
     
-    return jsonify({'message': 'Campaign started successfully'})
+    # Check, register and queue in one step, so a second launch of the same
+    # campaign can't replace the running one's state and control
+    with launch_lock:
+        if campaign_scheduler.is_active(campaign_id):
+            raise ValueError(f"Campaign {campaign_id} is already queued or running")
+        state = campaigns.start(
+            campaign_id,
+            sender_email=automation.sender_email,
+            queued=True,
+            progress=prior['sent'] + prior['failed'],
+            sent=prior['sent'],
+            failed=prior['failed']
+        )
+        campaign_scheduler.submit(campaign_id, run_campaign)
+    return state
 
 @app.route('/stop_campaign', methods=['POST'])
 def stop_campaign():
-    """Stop email campaign"""
-    global campaign_status
-    campaign_status['running'] = False
-    return jsonify({'message': 'Campaign stopped'})
+    """Stop email campaign (the most recent one unless campaign_id is given)"""
+    data = request.get_json(silent=True) or {}
+    state = campaign_state(data.get('campaign_id'))
+    if state is None or state.campaign_id is None:
+        return jsonify({'error': 'Unknown campaign'}), 404
+    return cancel_campaign(state.campaign_id)
 
-@app.route('/campaign_status')
-def get_campaign_status():
-    """Get current campaign status"""
-    # Create a JSON-safe copy of campaign status
-    status_copy = {
-        'running': campaign_status.get('running', False),
-        'progress': campaign_status.get('progress', 0),
-        'total': campaign_status.get('total', 0),
-        'sent': campaign_status.get('sent', 0),
-        'failed': campaign_status.get('failed', 0),
-        'current_email': campaign_status.get('current_email', ''),
-        'start_time': campaign_status.get('start_time'),
-        'end_time': campaign_status.get('end_time'),
-        'results': campaign_status.get('results')
-    }
+@app.route('/campaign_events')
+def campaign_events():
+    """Server-Sent Events stream of campaign progress
+
+    Follows the most recent campaign unless ?campaign_id= is given. Each
+    event carries only the PROGRESS_FIELDS that changed since the last one
+    (the first carries all of them). Events are at least SSE_MIN_INTERVAL
+    apart, so a fast campaign coalesces many updates into one event.
+    """
+    campaign_id = request.args.get('campaign_id')
+    if campaign_state(campaign_id) is None:
+        return jsonify({'error': 'Unknown campaign'}), 404
     
-    # Convert duration to seconds if it exists
-    if 'duration' in campaign_status and campaign_status['duration']:
-        if hasattr(campaign_status['duration'], 'total_seconds'):
-            status_copy['duration'] = int(campaign_status['duration'].total_seconds())
-        else:
-            status_copy['duration'] = str(campaign_status['duration'])
+    def stream():
+        seen_version = None
+        last_sent = {}
+        while True:
+            version = campaigns.wait(seen_version, timeout=SSE_HEARTBEAT_SECONDS)
+            changed = version != seen_version
+            seen_version = version
+            snapshot = campaign_state(campaign_id).snapshot()
+            state = {field: getattr(snapshot, field) for field in PROGRESS_FIELDS}
+            state['completed'] = snapshot.results is not None
+            
+            delta = {key: value for key, value in state.items()
+                     if key not in last_sent or last_sent[key] != value}
+            if changed and delta:
+                last_sent.update(delta)
+                yield f"data: {json.dumps(delta)}\n\n"
+            else:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+            time.sleep(SSE_MIN_INTERVAL)
     
-    # Handle results duration if it exists
-    if status_copy.get('results') and 'duration' in status_copy['results']:
-        if hasattr(status_copy['results']['duration'], 'total_seconds'):
-            status_copy['results']['duration'] = int(status_copy['results']['duration'].total_seconds())
-        elif 'duration_seconds' in status_copy['results']:
-            status_copy['results']['duration'] = status_copy['results']['duration_seconds']
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def status_json(state):
+    """JSON-safe dict of a campaign's current snapshot"""
+    status = state.snapshot()._asdict()
     
-    return jsonify(status_copy)
+    # results is shared with the snapshot, so swap in a JSON-safe duration on a shallow copy
+    results = status['results']
+    if results and hasattr(results.get('duration'), 'total_seconds'):
+        status['results'] = {**results, 'duration': int(results['duration'].total_seconds())}
+    return status
+
+@app.route('/campaign_status')
+def get_campaign_status():
+    """Get current campaign status (or ?campaign_id=) from one consistent snapshot"""
+    state = campaign_state(request.args.get('campaign_id'))
+    if state is None:
+        return jsonify({'error': 'Unknown campaign'}), 404
+    return jsonify(status_json(state))
+
+@app.route('/campaigns')
+def list_campaigns():
+    """Every campaign run by this process, plus per-sender quota usage"""
+    summaries = []
+    for state in campaigns.all():
+        status = state.snapshot()._asdict()
+        del status['results']
+        summaries.append(status)
+    return jsonify({
+        'campaigns': summaries,
+        'active': campaign_scheduler.active_count(),
+        'max_concurrent': campaign_scheduler.max_concurrent,
+        'quotas': {
+            'hourly': SENDER_HOURLY_QUOTA,
+            'daily': SENDER_DAILY_QUOTA,
+            'usage': sender_quotas.usage()
+        }
+    })
+
+@app.route('/campaigns/<campaign_id>/status')
+def campaign_status_by_id(campaign_id):
+    """Status of one campaign, independent of any other running campaign"""
+    state = campaigns.get(campaign_id)
+    if state is None:
+        return jsonify({'error': 'Unknown campaign'}), 404
+    return jsonify(status_json(state))
+
+def campaign_metrics():
+    """Campaign gauges for /metrics, read from the registry at scrape time"""
+    counts = {'queued': 0, 'running': 0, 'paused': 0}
+    recipients = []
+    for state in campaigns.active():
+        status = state.snapshot()
+        if status.paused:
+            counts['paused'] += 1
+        elif status.running:
+            counts['running'] += 1
+        else:
+            counts['queued'] += 1
+        recipients.append(({'campaign_id': status.campaign_id}, status.total - status.progress))
+    yield ('email_campaigns', 'gauge', 'Campaigns queued, running or paused',
+           [('email_campaigns', {'state': state}, count) for state, count in counts.items()])
+    yield ('email_campaign_remaining', 'gauge', 'Recipients not yet processed in each active campaign',
+           [('email_campaign_remaining', labels, value) for labels, value in recipients])
+
+REGISTRY.add_collector(campaign_metrics)
+
+@app.route('/metrics')
+def metrics():
+    """Send-path counters and stage latencies in the Prometheus text format"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/test_connection', methods=['POST'])
 def test_connection():
@@ -392,11 +719,12 @@ def test_connection():
         temp_automation = EmailAutomation(
             data['sender_email'], 
             data['sender_password'], 
-            data.get('sender_name', 'Nirmal Boghara')
+            data.get('sender_name', 'Nirmal Boghara'),
+            pool_size=SMTP_POOL_SIZE
         )
         
+        # The check leaves the logged-in session in the shared pool for later sends
         if temp_automation.connect_to_smtp():
-            temp_automation.disconnect_from_smtp()
             return jsonify({'message': 'Connection successful!'})
         else:
             return jsonify({'error': 'Connection failed'}), 400
@@ -416,16 +744,13 @@ def send_test_email():
         return jsonify({'error': 'Test email address required'}), 400
     
     try:
-        if not email_automation.connect_to_smtp():
-            return jsonify({'error': 'Failed to connect to SMTP server'}), 400
-        
         # Create test email
         subject, html_body, text_body = email_automation.create_personalized_email(
             "Test Company", "Test Role", test_email, "Test Recruiter"
         )
         
+        # send_email borrows a pooled session, so repeat clicks skip the handshake
         success = email_automation.send_email(test_email, subject, html_body, text_body)
-        email_automation.disconnect_from_smtp()
         
         if success:
             return jsonify({'message': 'Test email sent successfully!'})
@@ -441,13 +766,20 @@ def email_template():
     return render_template('email_template.html')
 
 
+def current_csv_columns():
+    """Column names of the uploaded CSV, or None if nothing is uploaded"""
+    csv_file = app.config.get('current_csv')
+    if not csv_file or not os.path.exists(csv_file):
+        return None
+    return open_contacts(csv_file).columns
+
 @app.route('/save_email_template', methods=['POST'])
 def save_email_template():
     """Save custom email template"""
+    global email_automation
     data = request.get_json()
     
-    # Store email template in app config
-    app.config['email_template'] = {
+    template_config = {
         'subject_template': data.get('subject_template', 'Excited for {role} Position at {company_name}'),
         'html_template': data.get('html_template', ''),
         'text_template': data.get('text_template', ''),
@@ -456,6 +788,18 @@ def save_email_template():
         'signature': data.get('signature', '')
     }
     
+    # Compile once here and check every placeholder against the uploaded CSV
+    try:
+        template = EmailTemplate.from_config(template_config)
+        template.validate(current_csv_columns())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Store email template in app config
+    app.config['email_template'] = template_config
+    if email_automation is not None:
+        email_automation.template = template
+    
     return jsonify({'message': 'Email template saved successfully!'})
 
 @app.route('/get_email_template')
@@ -497,13 +841,8 @@ def preview_email():
     else:
         return jsonify({'error': 'Email automation not configured'}), 400
 
-# Create necessary directories
-os.makedirs('uploads', exist_ok=True)
-os.makedirs('templates', exist_ok=True)
-os.makedirs('static/css', exist_ok=True)
-os.makedirs('static/js', exist_ok=True)
-
 if __name__ == '__main__':
+    setup_services()
     port = int(os.environ.get('PORT', 5001))
     app.run(debug=False, host='0.0.0.0', port=port)
 
@@ -0,0 +1,352 @@
+import asyncio
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiosmtplib
+
+from campaign_state import CampaignControl
+from metrics import CONNECTS, MESSAGES, RECONNECTS, RETRIES, SMTP_CONNECT, SMTP_SEND, STAGE_SECONDS
+from rate_limiter import LONG_WAIT_SECONDS, RateLimiter, recipient_domain
+from retry import DelayQueue, RetryPolicy, breaks_session, classify, is_bounce
+from send_engine import RENDER_WORKERS, RETRY_POLL_INTERVAL, StageTimer
+from send_queue import FAILED, REJECTED, RETRYING, SENT
+
+
+# Rows pulled off the row iterator per trip to the loader thread
+ROW_BATCH_SIZE = 500
+
+
+class AsyncSendEngine:
+    """Run a whole campaign on one event loop with many in-flight SMTP sessions
+
+    Mirrors SendEngine: same row tuples, same stats dict and the same
+    progress_callback, so the dashboard cannot tell the two apart. Messages
+    are rendered to bytes on a small thread pool ahead of the sessions, so
+    building MIME never stalls the loop, and the rows themselves are pulled
+    in batches on a loader thread, since that is where CSV chunks are parsed,
+    prepared and enqueued in SQLite. Transient failures wait out their
+    backoff on a delay queue, not in a session.
+    """
+
+    def __init__(self, automation, sessions=10, rate_limiter=None, delay_seconds=0,
+                 progress_callback=None, test_mode=True, checkpoint=None, control=None,
+                 retry_policy=None, render_workers=RENDER_WORKERS):
+        self.automation = automation
+        self.sessions = max(1, int(sessions))
+        self.render_workers = max(1, int(render_workers))
+        self.limiter = rate_limiter or RateLimiter()
+        self.delay_seconds = delay_seconds
+        self.progress_callback = progress_callback
+        self.test_mode = test_mode
+        self.checkpoint = checkpoint
+        self.control = control or CampaignControl()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.logger = automation.logger
+        self._retries = DelayQueue()
+        self.timing = StageTimer()
+        self._processed = 0
+        self._outstanding = 0
+        self._render_cpu = 0.0
+        self._prepare_cpu = 0.0
+
+    def run(self, rows, stats, resume_path=None):
+        """Blocking entry point: run the campaign to completion and return stats"""
+        return asyncio.run(self.run_async(rows, stats, resume_path))
+
+    async def run_async(self, rows, stats, resume_path=None):
+        self._stats = stats
+        self._resume_path = resume_path
+        # A resumed campaign starts from the results already checkpointed
+        self._processed = stats['sent_successfully'] + stats['failed_to_send']
+        # Prepared rows waiting to be rendered
+        row_queue = asyncio.Queue(maxsize=self.sessions * 4)
+        # Rendered (row, attempt, payload) items; attempt counts from 1
+        ready_queue = asyncio.Queue(maxsize=self.sessions * 4)
+
+        campaign_threads = set(self.control.thread_ids)
+        executor = ThreadPoolExecutor(max_workers=self.render_workers, thread_name_prefix='render-worker',
+                                      initializer=self.control.join_thread)
+        # One thread, so the row generator is never run from two threads at once
+        loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='row-loader',
+                                    initializer=self.control.join_thread)
+        # Checkpoints may flush a batch to SQLite; one thread keeps them in order and off the loop
+        self._checkpoints = ThreadPoolExecutor(max_workers=1, thread_name_prefix='checkpoint-writer',
+                                               initializer=self.control.join_thread)
+        renderers = [asyncio.create_task(self._renderer(row_queue, ready_queue, executor))
+                     for _ in range(self.render_workers)]
+        workers = [asyncio.create_task(self._session(ready_queue)) for _ in range(self.sessions)]
+        loop = asyncio.get_running_loop()
+        rows = iter(rows)
+        loading = None
+        # The loop thread only dispatches rows and drives every session
+        cpu_started = time.thread_time()
+        try:
+            loading = loop.run_in_executor(loader, self._load_rows, rows)
+            while not self.control.cancelled:
+                batch = await loading
+                if not batch:
+                    break
+                # The next batch (and any chunk it needs parsed) loads while this one is dispatched
+                loading = loop.run_in_executor(loader, self._load_rows, rows)
+                for row in batch:
+                    if self.control.cancelled:
+                        break
+                    await self._feed_retries(ready_queue)
+                    self._outstanding += 1
+                    await row_queue.put(row)
+            # Fresh rows are exhausted; keep feeding retries until every row has a final result
+            while not self.control.cancelled and self._outstanding > 0:
+                item = self._retries.pop_due()
+                if item is None:
+                    await asyncio.sleep(RETRY_POLL_INTERVAL)
+                else:
+                    await ready_queue.put(item)
+        finally:
+            # Stop the renderers first so everything they rendered still reaches a session
+            for _ in renderers:
+                await row_queue.put(None)
+            await asyncio.gather(*renderers)
+            for _ in workers:
+                await ready_queue.put(None)
+            await asyncio.gather(*workers)
+            if loading is not None and not loading.done():
+                # Cancelled mid-load; let the chunk finish rather than abandon the generator in a thread
+                await asyncio.wait([loading])
+            loader.shutdown()
+            executor.shutdown()
+            # Every result is handed to the send queue before the caller flushes it
+            self._checkpoints.shutdown()
+            # The render threads have exited; forget them so a reused thread id is not profiled
+            self.control.thread_ids.intersection_update(campaign_threads)
+            self.timing.add_cpu('event_loop', time.thread_time() - cpu_started)
+            self.timing.add_cpu('prepare', self._prepare_cpu)
+            self.timing.add_cpu('render', self._render_cpu)
+
+        pending_retries = len(self._retries.drain())
+        if pending_retries:
+            # Their checkpoint state is still 'retrying', so a resume picks them up
+            self.logger.info(f"{pending_retries} retries left unsent")
+        stats['pipeline'] = self.timing.summary()
+        self.timing.log(self.logger)
+        return stats
+
+    def _load_rows(self, rows):
+        """Next batch of rows on the loader thread; an empty list once they run out"""
+        cpu_started = time.thread_time()
+        batch = list(itertools.islice(rows, ROW_BATCH_SIZE))
+        self._prepare_cpu += time.thread_time() - cpu_started
+        return batch
+
+    async def _feed_retries(self, ready_queue):
+        """Hand every retry whose backoff has passed to the sessions, between fresh rows"""
+        while True:
+            item = self._retries.pop_due()
+            if item is None:
+                return
+            # Retries keep their rendered payload and skip the render stage
+            await ready_queue.put(item)
+
+    async def _renderer(self, row_queue, ready_queue, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            row = await row_queue.get()
+            if row is None:
+                break
+            if self.control.cancelled:
+                self._outstanding -= 1
+                continue
+
+            started = time.perf_counter()
+            try:
+                payload, cpu = await loop.run_in_executor(executor, self._render_timed, row)
+            except Exception as e:
+                self.logger.error(f"Failed to render email to {row[3]}: {str(e)}")
+                self._record(row[0], row[3], FAILED, f"render: {str(e)}", 'render')
+                continue
+            rendered = time.perf_counter()
+            self._render_cpu += cpu
+            # Waits while the sessions are behind; that wait is the back-pressure
+            await ready_queue.put((row, 1, payload))
+            self.timing.add('render', rendered - started, time.perf_counter() - rendered)
+
+    def _render_timed(self, row):
+        """render_payload on an executor thread, plus the CPU time it used"""
+        cpu_started = time.thread_time()
+        payload = self.automation.render_payload(row, self._resume_path)
+        return payload, time.thread_time() - cpu_started
+
+    def _client(self):
+        automation = self.automation
+        return aiosmtplib.SMTP(
+            hostname=automation.smtp_host,
+            port=automation.smtp_port,
+            username=automation.sender_email,
+            password=automation.sender_password,
+            start_tls=automation.use_tls,
+            timeout=30,
+        )
+
+    async def _connect(self):
+        if self.test_mode:
+            return None
+        try:
+            return await self._open()
+        except Exception as e:
+            self.logger.error(f"Async session failed to connect to SMTP server: {str(e)}")
+            return None
+
+    async def _open(self):
+        """New logged-in client"""
+        started = time.perf_counter()
+        client = self._client()
+        await client.connect()
+        CONNECTS.inc()
+        STAGE_SECONDS.observe(time.perf_counter() - started, SMTP_CONNECT)
+        return client
+
+    async def _session(self, ready_queue):
+        control = self.control
+        client = await self._connect()
+        next_send = 0.0
+        try:
+            while True:
+                waiting = time.perf_counter()
+                item = await ready_queue.get()
+                if item is None:
+                    break
+                starved = time.perf_counter() - waiting
+                row, attempt, payload = item
+
+                if control.paused:
+                    # Hang up during a pause; _send_row reconnects on the next message
+                    client = await self._disconnect(client)
+                if not await control.wait_while_paused_async():
+                    # Cancelled: hang up now, then drain rows until the sentinel
+                    client = await self._disconnect(client)
+                    self._outstanding -= 1
+                    continue
+
+                if not self.test_mode:
+                    # Same per-session floor as the threaded engine, but yielding the loop
+                    if not await control.sleep_async(next_send - time.monotonic()):
+                        self._outstanding -= 1
+                        continue
+                client = await self._send_row(row, attempt, payload, client, starved)
+                next_send = time.monotonic() + self.delay_seconds
+        finally:
+            await self._disconnect(client)
+
+    async def _disconnect(self, client):
+        if client is not None and client.is_connected:
+            try:
+                await client.quit()
+            except aiosmtplib.SMTPException:
+                client.close()
+        return None
+
+    async def _send_row(self, row, attempt, payload, client, starved=0.0):
+        automation = self.automation
+        index, company_name, role, recruiter_email = row[:4]
+
+        if self.test_mode:
+            automation.recipient_logger.info("TEST MODE - Would send to %s (%s - %s); subject: %s",
+                                             recruiter_email, company_name, role, row[6])
+            self.timing.add('send', 0.0, starved)
+            self._record(index, recruiter_email, SENT)
+            return client
+
+        domain = recipient_domain(recruiter_email)
+        slot = self.limiter.reserve(domain)
+        delay = slot - time.monotonic()
+        if delay > 0:
+            if delay >= LONG_WAIT_SECONDS:
+                automation.logger.warning(f"Send limit reached; next email in {delay / 60:.0f} minute(s)")
+            if not await self.control.sleep_async(delay):
+                # Cancelled while waiting; the row stays unsent in the checkpoint and its quota is given back
+                self.limiter.release(slot)
+                self._outstanding -= 1
+                return client
+
+        started = time.perf_counter()
+        sent_at = time.monotonic()
+        try:
+            if client is None or not client.is_connected:
+                client = await self._open()
+            sending = time.perf_counter()
+            try:
+                await client.sendmail(automation.sender_email, [recruiter_email], payload)
+            except aiosmtplib.SMTPServerDisconnected:
+                # Reconnect once, like the pooled smtplib sessions do
+                RECONNECTS.inc()
+                client = await self._open()
+                sending = time.perf_counter()
+                await client.sendmail(automation.sender_email, [recruiter_email], payload)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - sending, SMTP_SEND)
+            self.limiter.record_success(domain)
+            automation.recipient_logger.info("Email sent successfully to %s", recruiter_email)
+        except Exception as e:
+            self.timing.add('send', time.perf_counter() - started, starved)
+            if self.limiter.record_failure(domain, e, sent_at):
+                automation.logger.warning(f"Provider throttled sends to {domain}; slowing down")
+            kind, reason = classify(e)
+            if breaks_session(reason) and client is not None:
+                # The socket is unusable; close without a QUIT and reconnect on the next send
+                client.close()
+                client = None
+            error = f"{reason}: {str(e)}"
+            if self.retry_policy.should_retry(kind, attempt):
+                delay = self.retry_policy.delay(attempt)
+                automation.logger.warning(f"Temporary failure sending to {recruiter_email} ({error}); "
+                                          f"retry {attempt + 1}/{self.retry_policy.max_attempts} in {delay:.0f}s")
+                self._stats['retried'] += 1
+                RETRIES.inc()
+                self._checkpoint(index, recruiter_email, RETRYING, error)
+                self._retries.put((row, attempt + 1, payload), delay)
+            else:
+                automation.logger.error(f"Failed to send email to {recruiter_email} after {attempt} attempt(s): {error}")
+                self._record(index, recruiter_email, REJECTED if is_bounce(e) else FAILED, error, reason)
+            return client
+
+        self.timing.add('send', time.perf_counter() - started, starved)
+        self._record(index, recruiter_email, SENT)
+        return client
+
+    def _checkpoint(self, index, recruiter_email, state, error):
+        """Hand one result to the checkpoint on its writer thread"""
+        if self.checkpoint is not None:
+            asyncio.get_running_loop().run_in_executor(self._checkpoints, self._write_checkpoint,
+                                                       index, recruiter_email, state, error)
+
+    def _write_checkpoint(self, index, recruiter_email, state, error):
+        try:
+            self.checkpoint(index, recruiter_email, state, error)
+        except Exception as e:
+            # The result is counted; a resume may send this row again if its checkpoint was lost
+            self.logger.error(f"Failed to checkpoint {recruiter_email}: {str(e)}")
+
+    def _record(self, index, recruiter_email, state, error=None, reason=None):
+        """Merge one final result into stats; the loop is single-threaded so no lock is needed"""
+        stats = self._stats
+        if not self.test_mode:
+            MESSAGES.inc(labels=(state,))
+        self._processed += 1
+        self._outstanding -= 1
+        if state == SENT:
+            stats['sent_successfully'] += 1
+        else:
+            stats['failed_to_send'] += 1
+            stats['failed_emails'].append(recruiter_email)
+            reasons = stats['failure_reasons']
+            reasons[reason] = reasons.get(reason, 0) + 1
+
+        self._checkpoint(index, recruiter_email, state, error)
+        if self.progress_callback is not None:
+            try:
+                self.progress_callback(self._processed, stats, recruiter_email)
+            except Exception as e:
+                self.logger.error(f"Failed to report progress for {recruiter_email}: {str(e)}")
+
+        if self._processed % 10 == 0:
+            self.logger.info("Progress: %d/%d emails processed", self._processed, stats['total_emails'])
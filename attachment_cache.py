@@ -0,0 +1,100 @@
+import base64
+import mmap
+import os
+import threading
+from collections import OrderedDict
+import time
+from email.mime.base import MIMEBase
+
+from metrics import ATTACHMENT_ENCODE, ATTACHMENT_HIT, ATTACHMENT_MISS, CACHE_LOOKUPS, STAGE_SECONDS
+
+
+class CachedAttachment:
+    """Base64 payload of one file, encoded once and shared by every message"""
+
+    def __init__(self, filename, encoded):
+        self.filename = filename
+        self.encoded = encoded
+
+    def to_part(self):
+        """Fresh MIME part that reuses the already-encoded payload"""
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(self.encoded)
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.add_header('Content-Disposition', f'attachment; filename= {self.filename}')
+        return part
+
+
+class AttachmentCache:
+    """LRU cache of encoded attachments keyed by path, mtime and size
+
+    Editing or re-uploading a file changes its mtime/size, so stale entries
+    are never served; they simply age out of the LRU.
+    """
+
+    def __init__(self, max_entries=8, use_mmap=True):
+        self.max_entries = max_entries
+        self.use_mmap = use_mmap
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Return the CachedAttachment for path, encoding it on first use"""
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                CACHE_LOOKUPS.inc(labels=ATTACHMENT_HIT)
+                return entry
+            self.misses += 1
+        CACHE_LOOKUPS.inc(labels=ATTACHMENT_MISS)
+
+        # Encode outside the lock; a concurrent miss on the same file just does the work twice
+        started = time.perf_counter()
+        entry = CachedAttachment(os.path.basename(path), self._encode(path, st.st_size))
+        STAGE_SECONDS.observe(time.perf_counter() - started, ATTACHMENT_ENCODE)
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def get_part(self, path):
+        """MIME part for path, ready to attach"""
+        return self.get(path).to_part()
+
+    def _encode(self, path, size):
+        # Same output as email.encoders.encode_base64
+        with open(path, 'rb') as f:
+            if self.use_mmap and size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return base64.encodebytes(data).decode('ascii')
+            return base64.encodebytes(f.read()).decode('ascii')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'encoded_bytes': sum(len(e.encoded) for e in self._entries.values()),
+            }
+
+
+# Shared by every EmailAutomation in the process so campaigns reuse each other's work
+attachment_cache = AttachmentCache(max_entries=int(os.environ.get('ATTACHMENT_CACHE_SIZE', 8)))
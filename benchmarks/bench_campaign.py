@@ -0,0 +1,264 @@
+"""End-to-end campaign throughput against a local SMTP sink.
+
+Generates synthetic contact lists, sends them through send_bulk_emails with
+each engine against an in-process SMTP sink, and writes messages per second,
+send latency percentiles, peak RSS and CPU time per stage as JSON.
+
+Usage: python benchmarks/bench_campaign.py [--rows 1k,100k,1m] [--engines threaded,async,process]
+           [--workers 8] [--latency 0.002] [--error-rate 0.01] [--max-rate 5000]
+           [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+
+from contacts import build_dataset
+from smtp_sink import SMTPSink
+
+
+SIZES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+ROLES = ['Software Engineer', 'Data Scientist', 'Product Manager', 'SRE', 'ML Engineer']
+DOMAINS = 500
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    return SIZES[text] if text in SIZES else int(text)
+
+
+def make_contacts(rows, path, seed=0):
+    """Synthetic contact list whose recipient domains follow a Zipf-like mix, like real lists"""
+    rng = np.random.default_rng(seed)
+    ids = pd.Series(np.arange(rows)).astype(str)
+    domains = pd.Series(rng.zipf(1.5, rows) % DOMAINS).astype(str)
+    # Every fifth row leaves the first name blank so it is derived from the address
+    first_names = ('First' + ids).where(np.arange(rows) % 5 != 0, '')
+    pd.DataFrame({
+        'company_name': 'Company ' + domains,
+        'role': rng.choice(ROLES, rows),
+        'recruiter_email': 'first' + ids + '.last@company' + domains + '.com',
+        'recruiter_first_name': first_names,
+    }).to_csv(path, index=False)
+
+
+def prepare_list(rows, data_dir, seed):
+    """CSV for this size (generated once) and its columnar dataset, as /upload would build it"""
+    path = os.path.join(data_dir, f'contacts_{rows}_{seed}.csv')
+    if not os.path.exists(path):
+        make_contacts(rows, path, seed)
+    started = time.perf_counter()
+    build_dataset(path)
+    return path, time.perf_counter() - started
+
+
+def peak_rss_mb(usage):
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def own_peak_rss_mb(usage):
+    """Peak RSS of this process alone
+
+    ru_maxrss survives fork and exec, so a child would report the harness's
+    peak if that was higher. VmHWM belongs to the current image.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb(usage)
+
+
+def run_case(case, conn):
+    """Run one campaign in a fresh process, so peak RSS belongs to this case alone"""
+    import logging
+    from demo import EmailAutomation
+    from retry import RetryPolicy
+
+    os.chdir(case['data_dir'])
+    automation = EmailAutomation('bench@example.com', 'bench', 'Bench Sender',
+                                 smtp_host=case['host'], smtp_port=case['port'],
+                                 pool_size=case['workers'], use_tls=False)
+    logging.getLogger().setLevel(case['log_level'])
+    retry_policy = RetryPolicy(max_attempts=case['retry_attempts'], base_delay=case['retry_delay'],
+                               max_delay=case['retry_delay'] * 8)
+
+    started = time.perf_counter()
+    cpu_started = time.thread_time()
+    stats = automation.send_bulk_emails(case['csv'], resume_path=case['attachment'], delay_seconds=0,
+                                        test_mode=False, workers=case['workers'], engine=case['engine'],
+                                        processes=case['processes'], retry_policy=retry_policy)
+    wall = time.perf_counter() - started
+    main_cpu = time.thread_time() - cpu_started
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    pipeline = stats.get('pipeline', {})
+    stages = {stage: totals['cpu_seconds'] for stage, totals in pipeline.items()}
+    # Screening and opening the list happen on the calling thread before the engine starts
+    stages['setup'] = round(max(0.0, main_cpu - stages.get('prepare', 0.0) - stages.get('event_loop', 0.0)), 3)
+
+    send = pipeline.get('send', {})
+    render = pipeline.get('render', {})
+    conn.send({
+        'sent': stats['sent_successfully'],
+        'failed': stats['failed_to_send'],
+        'retried': stats['retried'],
+        'throttled': stats.get('throttled', 0),
+        'wall_seconds': round(wall, 3),
+        'msgs_per_second': round(stats['sent_successfully'] / wall, 1) if wall else 0.0,
+        'send_latency_ms': {'p50': send.get('p50_ms', 0.0), 'p99': send.get('p99_ms', 0.0)},
+        'render_latency_ms': {'p50': render.get('p50_ms', 0.0), 'p99': render.get('p99_ms', 0.0)},
+        'peak_rss_mb': round(own_peak_rss_mb(own), 1),
+        # Largest single send process (process engine only)
+        'shard_peak_rss_mb': round(peak_rss_mb(children), 1) if case['engine'] == 'process' else None,
+        'cpu_seconds': {
+            'total': round(own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime, 3),
+            'stages': stages,
+        },
+        'pipeline': pipeline,
+    })
+    conn.close()
+
+
+def run_in_process(case):
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=run_case, args=(case, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = None
+    process.join()
+    return result or {'error': f'benchmark process exited with code {process.exitcode}'}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(result):
+    return (result['rows'], result['engine'], result['workers'], result.get('processes'))
+
+
+def compare(results, baseline_path, max_regression):
+    """Print throughput against a previous run; returns False if any case regressed too far"""
+    with open(baseline_path) as f:
+        baseline = {case_key(result): result for result in json.load(f)['results'] if 'error' not in result}
+    ok = True
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        before = baseline.get(case_key(result))
+        if before is None or 'error' in result or not before['msgs_per_second']:
+            continue
+        ratio = result['msgs_per_second'] / before['msgs_per_second']
+        regressed = ratio < 1 - max_regression
+        ok = ok and not regressed
+        print(f"  {result['rows']:>9,} rows {result['engine']:<9} {before['msgs_per_second']:>10,.0f} -> "
+              f"{result['msgs_per_second']:>10,.0f} msgs/s ({ratio:.2f}x){'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='1k,100k,1m', help='comma-separated list sizes (1k, 100k, 1m or a number)')
+    parser.add_argument('--engines', default='threaded,async,process')
+    parser.add_argument('--workers', type=int, default=8, help='send workers (per process for the process engine)')
+    parser.add_argument('--processes', type=int, default=None, help='processes for the process engine (default: CPUs)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the sink waits before accepting a message')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of messages the sink rejects with 550')
+    parser.add_argument('--max-rate', type=int, default=None, help='messages per second before the sink answers 421')
+    parser.add_argument('--attachment-kib', type=int, default=0, help='size of a random resume attached to every message')
+    parser.add_argument('--retry-attempts', type=int, default=4)
+    parser.add_argument('--retry-delay', type=float, default=0.05, help='base retry backoff in seconds')
+    parser.add_argument('--log-level', default='WARNING', help='campaign log level while measuring')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'email-bench'))
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='previous results JSON to compare throughput against')
+    parser.add_argument('--max-regression', type=float, default=0.10,
+                        help='fail when msgs/s drops by more than this fraction versus --compare')
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    attachment = None
+    if args.attachment_kib:
+        attachment = os.path.join(args.data_dir, f'resume_{args.attachment_kib}k.pdf')
+        with open(attachment, 'wb') as f:
+            f.write(np.random.default_rng(args.seed).bytes(args.attachment_kib * 1024))
+
+    results = []
+    with SMTPSink(keep_messages=False, latency=args.latency, error_rate=args.error_rate,
+                  max_rate=args.max_rate, seed=args.seed) as sink:
+        for rows in map(parse_size, args.rows.split(',')):
+            csv_path, build_seconds = prepare_list(rows, args.data_dir, args.seed)
+            for engine in args.engines.split(','):
+                case = {
+                    'rows': rows, 'engine': engine, 'workers': args.workers,
+                    'processes': args.processes if engine == 'process' else None,
+                    'csv': csv_path, 'attachment': attachment, 'data_dir': args.data_dir,
+                    'host': sink.host, 'port': sink.port, 'log_level': args.log_level,
+                    'retry_attempts': args.retry_attempts, 'retry_delay': args.retry_delay,
+                }
+                accepted, rejected, throttled = sink.message_count, sink.rejected, sink.throttled
+                print(f"{rows:>9,} rows  {engine:<9} ...", end=' ', flush=True)
+                result = {key: case[key] for key in ('rows', 'engine', 'workers', 'processes')}
+                result['dataset_build_seconds'] = round(build_seconds, 3)
+                result.update(run_in_process(case))
+                result['sink'] = {
+                    'accepted': sink.message_count - accepted,
+                    'rejected': sink.rejected - rejected,
+                    'throttled': sink.throttled - throttled,
+                }
+                results.append(result)
+                if 'error' in result:
+                    print(result['error'])
+                else:
+                    print(f"{result['msgs_per_second']:>10,.0f} msgs/s  "
+                          f"send p50 {result['send_latency_ms']['p50']:.2f} ms  "
+                          f"p99 {result['send_latency_ms']['p99']:.2f} ms  "
+                          f"peak RSS {result['peak_rss_mb']:,.0f} MiB  "
+                          f"CPU {result['cpu_seconds']['total']:.1f}s")
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare and not compare(results, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
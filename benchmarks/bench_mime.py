@@ -0,0 +1,91 @@
+"""Compare skeleton message assembly with building and flattening a MIME tree per message.
+
+Usage: python benchmarks/bench_mime.py [messages] [attachment_kib]
+"""
+import copy
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from email.generator import BytesGenerator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from demo import EmailAutomation
+from mime_skeleton import POLICY
+
+
+def send_message_bytes(automation, row, resume_path):
+    """What the old path put on the wire: build_message, then smtplib.send_message's flatten"""
+    subject, html_body, text_body = automation.render_prepared(*row[1:])
+    msg = automation.build_message(row[3], subject, html_body, text_body, resume_path)
+    out = io.BytesIO()
+    BytesGenerator(out, mangle_from_=False, policy=POLICY).flatten(copy.copy(msg), linesep='\r\n')
+    return out.getvalue()
+
+
+def skeleton_bytes(automation, row, resume_path):
+    subject, html_body, text_body = automation.render_prepared(*row[1:])
+    return automation.skeleton.assemble(row[3], subject, html_body, text_body, resume_path)
+
+
+def make_rows(count):
+    return [
+        (i, f'Company {i}', 'Software Engineer', f'first{i}.last@company{i % 97}.com', f'First{i}',
+         f'First{i}', f'Application for Software Engineer at Company {i}')
+        for i in range(count)
+    ]
+
+
+def bench(label, fn, rows):
+    start = time.perf_counter()
+    for row in rows:
+        fn(row)
+    elapsed = time.perf_counter() - start
+
+    # Peak memory allocated while building one message, averaged over a sample
+    sample = rows[:200]
+    tracemalloc.start()
+    total_peak = 0
+    for row in sample:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn(row)
+        total_peak += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    print(f"{label:<14} {elapsed:8.3f}s  {len(rows) / elapsed:10,.0f} msgs/s  "
+          f"{total_peak / len(sample) / 1024:10,.1f} KiB peak alloc/msg")
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    attachment_kib = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rows = make_rows(count)
+
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+        f.write(os.urandom(attachment_kib * 1024))
+        resume_path = f.name
+    try:
+        automation = EmailAutomation('sender@example.com', 'unused', 'Sender')
+
+        # Both paths must produce identical bytes (same boundary) before timing means anything
+        row = rows[0]
+        subject, html_body, text_body = automation.render_prepared(*row[1:])
+        msg = automation.build_message(row[3], subject, html_body, text_body, resume_path)
+        msg.set_boundary(automation.skeleton.boundary)
+        assert msg.as_bytes(policy=POLICY) == skeleton_bytes(automation, row, resume_path)
+
+        print(f"Assembling {count:,} messages with a {attachment_kib} KiB attachment")
+        baseline = bench('send_message', lambda r: send_message_bytes(automation, r, resume_path), rows)
+        spliced = bench('skeleton', lambda r: skeleton_bytes(automation, r, resume_path), rows)
+        print(f"skeleton / send_message: {spliced / baseline:.2f}x time")
+    finally:
+        os.unlink(resume_path)
+
+
+if __name__ == '__main__':
+    main()
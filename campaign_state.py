@@ -0,0 +1,216 @@
+import asyncio
+import threading
+from collections import namedtuple
+
+
+CampaignSnapshot = namedtuple('CampaignSnapshot', [
+    'version', 'campaign_id', 'sender_email', 'queued', 'running', 'paused', 'cancelled', 'total',
+    'progress', 'sent', 'failed', 'current_email', 'start_time', 'end_time', 'error', 'results',
+])
+CampaignSnapshot.__doc__ = """Immutable, internally consistent view of one campaign at one version
+
+results is shared with the state rather than copied; treat it as read-only.
+"""
+
+
+class CampaignControl:
+    """Cancel and pause switches that the send engines check before every message
+
+    Sleeps go through sleep()/sleep_async() so a cancel interrupts rate-limit
+    and delay waits instead of running them out.
+    """
+
+    # How often the asyncio engine re-checks the switches while it waits
+    POLL_INTERVAL = 0.1
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        # Threads working on this campaign, for the sampling profiler
+        self.thread_ids = set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set() and not self.cancelled
+
+    def cancel(self):
+        self._cancelled.set()
+        # Wake anything waiting on a pause so it sees the cancel
+        self._running.set()
+
+    def pause(self):
+        if not self.cancelled:
+            self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def join_thread(self):
+        """Count the calling thread as part of this campaign until leave_thread"""
+        self.thread_ids.add(threading.get_ident())
+
+    def leave_thread(self):
+        self.thread_ids.discard(threading.get_ident())
+
+    def wait_while_paused(self):
+        """Block while paused; returns False if the campaign was cancelled"""
+        self._running.wait()
+        return not self.cancelled
+
+    def sleep(self, seconds):
+        """Sleep unless cancelled first; returns False if the campaign was cancelled"""
+        if seconds > 0:
+            self._cancelled.wait(seconds)
+        return not self.cancelled
+
+    async def wait_while_paused_async(self):
+        while not self._running.is_set():
+            await asyncio.sleep(self.POLL_INTERVAL)
+        return not self.cancelled
+
+    async def sleep_async(self, seconds):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + seconds
+        while not self.cancelled:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(remaining, self.POLL_INTERVAL))
+        return not self.cancelled
+
+
+class CampaignState:
+    """Progress of one campaign, updated by the send loop and read by the web routes
+
+    Writers hold the registry lock only for a few attribute stores. Readers
+    get a CampaignSnapshot that is rebuilt at most once per version, so
+    polling and SSE clients never see a half-applied update and never copy
+    the failed_emails list.
+    """
+
+    __slots__ = ('campaign_id', 'sender_email', 'queued', 'running', 'paused', 'cancelled', 'total', 'progress', 'sent', 'failed',
+                 'current_email', 'start_time', 'end_time', 'error', 'results',
+                 'version', 'control', '_snapshot', '_registry')
+
+    FIELDS = CampaignSnapshot._fields[1:]
+
+    def __init__(self, registry, campaign_id=None):
+        self._registry = registry
+        self.campaign_id = campaign_id
+        self.sender_email = None
+        self.queued = False
+        self.running = False
+        self.paused = False
+        self.cancelled = False
+        self.total = 0
+        self.progress = 0
+        self.sent = 0
+        self.failed = 0
+        self.current_email = ''
+        self.start_time = None
+        self.end_time = None
+        self.error = None
+        self.results = None
+        self.version = 0
+        self.control = CampaignControl()
+        self._snapshot = None
+
+    def update(self, **fields):
+        """Apply several fields as one atomic change"""
+        for name in fields:
+            if name not in self.FIELDS:
+                raise AttributeError(f"Unknown campaign field: {name}")
+        with self._registry.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self._bump()
+
+    def record_progress(self, processed, sent, failed, current_email, total=None):
+        """Fast path for the per-recipient progress callback"""
+        with self._registry.changed:
+            if total is not None:
+                self.total = total
+            self.progress = processed
+            self.sent = sent
+            self.failed = failed
+            self.current_email = current_email
+            self._bump()
+
+    def _bump(self):
+        # Caller holds the registry lock
+        self.version += 1
+        self._snapshot = None
+        self._registry.notify()
+
+    def snapshot(self):
+        with self._registry.changed:
+            snapshot = self._snapshot
+            if snapshot is None:
+                snapshot = self._snapshot = CampaignSnapshot(
+                    self.version, self.campaign_id, self.sender_email, self.queued, self.running,
+                    self.paused, self.cancelled, self.total, self.progress, self.sent, self.failed,
+                    self.current_email, self.start_time, self.end_time, self.error, self.results,
+                )
+            return snapshot
+
+
+class CampaignRegistry:
+    """Every campaign this process knows about, keyed by campaign id
+
+    All states share one Condition, so a reader (an SSE stream) can wait for
+    a change to any campaign. current() is the most recently started one.
+    """
+
+    def __init__(self):
+        self.changed = threading.Condition(threading.Lock())
+        self.version = 0
+        self._campaigns = {}
+        self._current = CampaignState(self)
+
+    def notify(self):
+        # Caller holds self.changed
+        self.version += 1
+        self.changed.notify_all()
+
+    def start(self, campaign_id, **fields):
+        """Create (or reset) the state for campaign_id, make it current and return it
+
+        The state starts out neither queued nor running unless fields say so.
+        """
+        state = CampaignState(self, campaign_id)
+        with self.changed:
+            self._campaigns[campaign_id] = state
+            self._current = state
+            for name, value in fields.items():
+                setattr(state, name, value)
+            state._bump()
+        return state
+
+    def get(self, campaign_id):
+        with self.changed:
+            return self._campaigns.get(campaign_id)
+
+    def current(self):
+        with self.changed:
+            return self._current
+
+    def all(self):
+        """Every known campaign state, oldest first"""
+        with self.changed:
+            return list(self._campaigns.values())
+
+    def active(self):
+        """States of campaigns queued or running"""
+        with self.changed:
+            return [state for state in self._campaigns.values() if state.queued or state.running]
+
+    def wait(self, seen_version, timeout=None):
+        """Block until the registry version differs from seen_version; returns the new version"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != seen_version, timeout=timeout)
+            return self.version
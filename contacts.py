@@ -0,0 +1,341 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from template_engine import format_value
+
+
+REQUIRED_COLUMNS = ['company_name', 'role', 'recruiter_email']
+OPTIONAL_COLUMNS = ['recruiter_first_name']
+
+# Rows parsed per chunk when streaming a contact list
+CHUNK_SIZE = int(os.environ.get('CSV_CHUNK_SIZE', 20000))
+
+# Column order of the frame prepare_contacts returns; send engines receive
+# each row as a plain (index, *ROW_COLUMNS) tuple
+ROW_COLUMNS = ('company_name', 'role', 'recruiter_email', 'recruiter_first_name', 'recruiter_name', 'subject')
+
+
+def clean_text(series):
+    """Strings with NaN/None turned into '' and surrounding whitespace removed"""
+    return series.fillna('').astype(str).str.strip()
+
+
+def derive_recruiter_names(emails):
+    """Vectorized EmailAutomation.extract_recruiter_name over a column of addresses
+
+    first.last@ and first_last@ become "First Last"; anything else is
+    capitalized whole. Every part goes through str.capitalize like the
+    scalar version, so 'JDOE2x' stays 'Jdoe2x' (str.title would give 'Jdoe2X').
+    """
+    local = emails.str.split('@', n=1).str[0].reset_index(drop=True)
+    names = local.str.capitalize()
+    dotted = local.str.contains('.', regex=False)
+    underscored = ~dotted & local.str.contains('_', regex=False)
+    for mask, sep in ((dotted, '.'), (underscored, '_')):
+        if mask.any():
+            parts = local[mask].str.split(sep, regex=False).explode().str.capitalize()
+            names[mask] = parts.groupby(level=0, sort=False).agg(' '.join)
+    return pd.Series(names.to_numpy(dtype=object), index=emails.index, dtype=object)
+
+
+def render_column(template, frame, constants):
+    """Render a CompiledTemplate for every row at once with pandas string concatenation"""
+    result = ''
+    for part in template.parts:
+        if isinstance(part, str):
+            piece = part
+        else:
+            field, spec, conversion = part
+            if field in constants:
+                piece = format_value(constants[field], spec, conversion)
+            elif spec or conversion:
+                piece = frame[field].map(lambda value: format_value(value, spec, conversion))
+            else:
+                piece = frame[field]
+        result = result + piece
+    if isinstance(result, str):
+        return pd.Series(result, index=frame.index, dtype=object)
+    return result
+
+
+def prepare_contacts(df, template, constants=None):
+    """Derive every per-row field for the whole frame before sending
+
+    Returns a frame with exactly ROW_COLUMNS. Missing or blank
+    recruiter_first_name values fall back to a name derived from the address,
+    so NaN never reaches a greeting.
+    """
+    prepared = pd.DataFrame(index=df.index)
+    for column in REQUIRED_COLUMNS:
+        prepared[column] = clean_text(df[column])
+
+    if 'recruiter_first_name' in df.columns:
+        first_names = clean_text(df['recruiter_first_name'])
+    else:
+        first_names = pd.Series('', index=df.index, dtype=object)
+    prepared['recruiter_first_name'] = first_names
+
+    derived = derive_recruiter_names(prepared['recruiter_email'])
+    prepared['recruiter_name'] = np.where(first_names != '', first_names, derived)
+
+    subject_constants = {**(constants or {}), **template.constants}
+    prepared['subject'] = render_column(template.subject, prepared, subject_constants)
+    return prepared[list(ROW_COLUMNS)]
+
+
+def read_columns(path):
+    """Column names from the CSV header without parsing any rows"""
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+
+def validate_columns(columns):
+    if not all(col in columns for col in REQUIRED_COLUMNS):
+        raise ValueError(f"CSV must contain columns: {REQUIRED_COLUMNS}")
+
+
+class CSVContactSource:
+    """Streams a contact CSV in chunks, parsing only the columns sending needs
+
+    Everything is read as strings (no per-column type inference) and only
+    REQUIRED_COLUMNS plus any OPTIONAL_COLUMNS present are materialized, so
+    memory stays flat no matter how long the list is.
+    """
+
+    def __init__(self, path, chunksize=CHUNK_SIZE):
+        self.path = path
+        self.chunksize = chunksize
+        self.columns = read_columns(path)
+        validate_columns(self.columns)
+        self.usecols = REQUIRED_COLUMNS + [col for col in OPTIONAL_COLUMNS if col in self.columns]
+        self._row_count = None
+
+    @property
+    def row_count(self):
+        """Number of data rows, counted once in a single one-column pass"""
+        if self._row_count is None:
+            self._row_count = sum(
+                len(chunk) for chunk in pd.read_csv(self.path, usecols=['recruiter_email'], dtype=str,
+                                                    chunksize=max(self.chunksize, 100000))
+            )
+        return self._row_count
+
+    def iter_chunks(self):
+        """Yield DataFrames of at most chunksize rows; the index keeps counting across chunks"""
+        dtypes = {col: str for col in self.usecols}
+        yield from pd.read_csv(self.path, usecols=self.usecols, dtype=dtypes, chunksize=self.chunksize)
+
+    def iter_column(self, column):
+        """One column as string Series chunks, for whole-list passes such as screening"""
+        for chunk in pd.read_csv(self.path, usecols=[column], dtype=str, chunksize=max(self.chunksize, 100000)):
+            yield chunk[column]
+
+DATASET_VERSION = 1
+
+# Terminates every stored value (ASCII unit separator; NUL would be stripped by NumPy's bytes handling)
+FIELD_END = '\x1f'
+
+# Bytes of a column file searched at a time, so find() never holds a whole column in memory
+FIND_BLOCK_SIZE = 1 << 20
+
+
+def dataset_path(csv_path):
+    """Directory holding the columnar copy of an uploaded CSV"""
+    return os.path.splitext(csv_path)[0] + '.dataset'
+
+
+def _source_signature(csv_path):
+    st = os.stat(csv_path)
+    return {'source_size': st.st_size, 'source_mtime_ns': st.st_mtime_ns}
+
+
+def _column_file(path, index):
+    # Columns are stored by position so arbitrary header text never becomes a filename
+    return os.path.join(path, f'col{index}.data'), os.path.join(path, f'col{index}.offsets.npy')
+
+
+def build_dataset(csv_path, chunksize=CHUNK_SIZE):
+    """Validate a CSV once and persist a normalized columnar copy next to it
+
+    Every column is cleaned with clean_text and stored as one UTF-8 file of
+    FIELD_END-terminated values plus an int64 array of row offsets, so any row
+    range can be sliced and split without tokenizing CSV text again.
+    Returns the ColumnarContactSource for the new dataset.
+    """
+    columns = read_columns(csv_path)
+    validate_columns(columns)
+
+    path = dataset_path(csv_path)
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    files = [open(_column_file(tmp_path, i)[0], 'wb') for i in range(len(columns))]
+    lengths = [[] for _ in columns]
+    row_count = 0
+    try:
+        for chunk in pd.read_csv(csv_path, dtype=str, chunksize=chunksize):
+            row_count += len(chunk)
+            for i, column in enumerate(columns):
+                values = clean_text(chunk[column]).str.replace(FIELD_END, '', regex=False) + FIELD_END
+                encoded = values.str.encode('utf-8')
+                lengths[i].append(encoded.str.len().to_numpy(dtype=np.int64))
+                files[i].write(b''.join(encoded))
+    finally:
+        for f in files:
+            f.close()
+
+    for i in range(len(columns)):
+        offsets = np.zeros(row_count + 1, dtype=np.int64)
+        if row_count:
+            np.cumsum(np.concatenate(lengths[i]), out=offsets[1:])
+        np.save(_column_file(tmp_path, i)[1], offsets)
+
+    meta = {'version': DATASET_VERSION, 'columns': columns, 'row_count': row_count,
+            **_source_signature(csv_path)}
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return ColumnarContactSource(path, chunksize=chunksize)
+
+
+class ColumnarContactSource:
+    """Reads contacts from a dataset written by build_dataset
+
+    Same interface as CSVContactSource; the row count and columns come from
+    the metadata, and chunks are sliced straight out of the column files.
+    """
+
+    def __init__(self, path, chunksize=CHUNK_SIZE):
+        self.path = path
+        self.chunksize = chunksize
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.columns = self.meta['columns']
+        self.row_count = self.meta['row_count']
+        self.usecols = REQUIRED_COLUMNS + [col for col in OPTIONAL_COLUMNS if col in self.columns]
+
+    def _read_column(self, column, start, stop):
+        data_file, offsets_file = _column_file(self.path, self.columns.index(column))
+        offsets = np.load(offsets_file, mmap_mode='r')
+        begin, end = int(offsets[start]), int(offsets[stop])
+        with open(data_file, 'rb') as f:
+            f.seek(begin)
+            text = f.read(end - begin).decode('utf-8')
+        # Every value is terminated, so the final split piece is always empty
+        return text.split(FIELD_END)[:-1]
+
+    def _frame(self, columns, start, stop):
+        index = pd.RangeIndex(start, stop)
+        return pd.DataFrame({column: pd.Series(self._read_column(column, start, stop), index=index, dtype=object)
+                             for column in columns}, index=index)
+
+    def iter_chunks(self):
+        for start in range(0, self.row_count, self.chunksize):
+            yield self._frame(self.usecols, start, min(start + self.chunksize, self.row_count))
+
+    def iter_column(self, column):
+        for start in range(0, self.row_count, self.chunksize):
+            stop = min(start + self.chunksize, self.row_count)
+            yield pd.Series(self._read_column(column, start, stop), index=pd.RangeIndex(start, stop), dtype=object)
+
+    def rows(self, start, stop):
+        """Rows start..stop with every column, read by seeking to their offsets"""
+        start = min(max(0, start), self.row_count)
+        return self._frame(self.columns, start, min(max(start, stop), self.row_count))
+
+    def take(self, positions):
+        """Rows at the given (not necessarily adjacent) positions with every column"""
+        positions = np.asarray(positions, dtype=np.int64)
+        index = pd.Index(positions)
+        frame = {}
+        for i, column in enumerate(self.columns):
+            data_file, offsets_file = _column_file(self.path, i)
+            offsets = np.load(offsets_file, mmap_mode='r')
+            values = []
+            with open(data_file, 'rb') as f:
+                for begin, end in zip(offsets[positions].tolist(), offsets[positions + 1].tolist()):
+                    f.seek(begin)
+                    # Leave off the FIELD_END terminator
+                    values.append(f.read(end - begin - 1).decode('utf-8'))
+            frame[column] = pd.Series(values, index=index, dtype=object)
+        return pd.DataFrame(frame, index=index)
+
+    def find(self, column, text, block_size=FIND_BLOCK_SIZE):
+        """Sorted positions of rows whose column contains text, ignoring (ASCII) case
+
+        Searches the stored bytes of the column directly, block_size bytes
+        at a time, and maps every hit to its row through the offsets, so
+        no value is split or parsed.
+        """
+        needle = text.replace(FIELD_END, '').encode('utf-8').lower()
+        if not needle:
+            return np.arange(self.row_count, dtype=np.int64)
+        data_file, offsets_file = _column_file(self.path, self.columns.index(column))
+        offsets = np.load(offsets_file, mmap_mode='r')
+        # Each block is searched after the previous block's last len(needle) - 1 bytes,
+        # so a match straddling two blocks is found once, in the later window
+        overlap = len(needle) - 1
+        rows = []
+        carry = b''
+        start = 0
+        with open(data_file, 'rb') as f:
+            while True:
+                block = f.read(max(block_size, 1))
+                if not block:
+                    break
+                # bytes.lower() only folds ASCII, so every offset still lines up
+                window = carry + block.lower()
+                hits = []
+                pos = window.find(needle)
+                while pos != -1:
+                    hits.append(start + pos)
+                    pos = window.find(needle, pos + 1)
+                if hits:
+                    rows.append(np.unique(np.searchsorted(offsets, hits, side='right') - 1))
+                carry = window[-overlap:] if overlap else b''
+                start += len(window) - len(carry)
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(rows)).astype(np.int64)
+
+
+def load_dataset(csv_path, chunksize=CHUNK_SIZE):
+    """ColumnarContactSource for csv_path, or None if it has no up-to-date dataset"""
+    path = dataset_path(csv_path)
+    try:
+        source = ColumnarContactSource(path, chunksize=chunksize)
+    except (OSError, ValueError, KeyError):
+        return None
+    meta = source.meta
+    if meta.get('version') != DATASET_VERSION or any(
+            meta.get(key) != value for key, value in _source_signature(csv_path).items()):
+        return None
+    return source
+
+
+def open_contacts(path, chunksize=CHUNK_SIZE):
+    """Open a contact list for streaming; raises ValueError if required columns are missing
+
+    Uses the cached columnar dataset when one matches the file, otherwise
+    falls back to streaming the CSV text.
+    """
+    source = load_dataset(path, chunksize=chunksize)
+    if source is not None:
+        return source
+    return CSVContactSource(path, chunksize=chunksize)
+
+
+def iter_prepared_chunks(source, template, constants=None, skip=None):
+    """Prepared frames one chunk at a time, leaving out row indexes listed in skip"""
+    for chunk in source.iter_chunks():
+        if skip is not None and len(skip):
+            chunk = chunk[~chunk.index.isin(skip)]
+            if chunk.empty:
+                continue
+        yield prepare_contacts(chunk, template, constants)
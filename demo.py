@@ -1,43 +1,70 @@
 
-import pandas as pd
+import numpy as np
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
 from email.utils import formataddr
+import atexit
 import os
 import time
 from datetime import datetime
 import logging
+from log_pipeline import LOG_RECIPIENT_SAMPLE, recipient_logger, setup_logging
+from smtp_pool import close_all_pools, get_pool
+from send_engine import SendEngine
+from rate_limiter import RateLimiter
+from attachment_cache import attachment_cache
+from template_engine import default_template
+from contacts import iter_prepared_chunks, open_contacts
+from send_queue import CANCELLED, COMPLETED, ERROR
+from retry import classify
+from mime_skeleton import MessageSkeleton
+from preflight import screen
+from address_validation import spread_by_domain
+from metrics import CSV_LOAD, MIME_BUILD, RENDER, SCREEN, SMTP_SEND, STAGE_SECONDS
+
+# 'skeleton' splices per-recipient parts into bytes serialized once per campaign;
+# 'mime' builds every message as a MIMEMultipart tree
+MESSAGE_ASSEMBLY = os.environ.get('MESSAGE_ASSEMBLY', 'skeleton')
 
 class EmailAutomation:
-    def __init__(self, sender_email, sender_password, sender_name="Nirmal Boghara"):
+    def __init__(self, sender_email, sender_password, sender_name="Nirmal Boghara",
+                 smtp_host="smtp.gmail.com", smtp_port=587, pool_size=4, use_tls=True):
     
         self.sender_email = sender_email
         self.sender_password = sender_password
         self.sender_name = sender_name
-        self.smtp_server = None
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.pool_size = pool_size
+        self.use_tls = use_tls
+        self.template = default_template()
+        self._skeleton = None
         self.setup_logging()
 
     def setup_logging(self):
-        """Setup logging for tracking email sends"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('email_automation.log'),
-                logging.StreamHandler()
-            ]
-        )
+        """Setup logging for tracking email sends; records are written on a background thread"""
+        setup_logging()
         self.logger = logging.getLogger(__name__)
-
-    def connect_to_smtp(self, smtp_server="smtp.gmail.com", smtp_port=587):
+        # "Sent to ..." lines, sampled when LOG_RECIPIENT_SAMPLE is set
+        self.recipient_logger = recipient_logger(__name__)
+
+    @property
+    def pool(self):
+        """Shared SMTP connection pool for this sender account"""
+        return get_pool(self.smtp_host, self.smtp_port, self.sender_email, self.sender_password,
+                        pool_size=self.pool_size, use_tls=self.use_tls)
+
+    def connect_to_smtp(self, smtp_server=None, smtp_port=None):
+        """Make sure the pool can hand out a healthy, logged-in session"""
+        if smtp_server:
+            self.smtp_host = smtp_server
+        if smtp_port:
+            self.smtp_port = smtp_port
 
         try:
-            self.smtp_server = smtplib.SMTP(smtp_server, smtp_port)
-            self.smtp_server.starttls()
-            self.smtp_server.login(self.sender_email, self.sender_password)
+            if not self.pool.check():
+                raise smtplib.SMTPException("NOOP health check failed")
             self.logger.info("Successfully connected to SMTP server")
             return True
         except Exception as e:
@@ -45,10 +72,9 @@ class EmailAutomation:
             return False
 
     def disconnect_from_smtp(self):
-        """Disconnect from SMTP server"""
-        if self.smtp_server:
-            self.smtp_server.quit()
-            self.logger.info("Disconnected from SMTP server")
+        """Close idle pooled sessions for this account"""
+        self.pool.close_idle()
+        self.logger.info("Disconnected from SMTP server")
 
     def extract_recruiter_name(self, email):
 
@@ -74,204 +100,262 @@ class EmailAutomation:
 
         recruiter_name = recruiter_first_name if recruiter_first_name else self.extract_recruiter_name(recruiter_email)
 
-        # Subject line
-        subject = f"Excited for {role} Position at {company_name}"
-
-        # HTML email body (same text, tighter spacing via inline styles)
-        html_body = f"""
-        <html>
-        <body style="margin:0;padding:0;">
-          <div style="font-family:Arial,Helvetica,sans-serif;font-size:14px;line-height:1.35;color:#111;">
-            <p style="margin:0 0 8px;">Hi {recruiter_name},</p>
-
-            <p style="margin:0 0 8px;">Pleasure to e-meet you! I hope you're doing great! I am Nirmal Boghara, studying my second year MS in Computer Science at New York University, writing this mail to express my interest in {role} opportunity at {company_name} for Spring 2026! I won't make this very long for you, but thanks for your time. Here's everything about me:</p>
-
-            <ul style="margin:0 0 8px;padding-left:20px;">
-              <li style="margin:2px 0;">Studying CS at NYU</li>
-              <li style="margin:2px 0;">Did my undergrad at University of Mumbai in Computer Engineering</li>
-              <li style="margin:2px 0;">Interned at Chewy last summer as an AI Innovator Intern II in Boston, MA.</li>
-              <li style="margin:2px 0;">Currently Technical Ambassador at Qualcomm, mentored 200+ students at their Edge AI Hackathons across USA.</li>
-              <li style="margin:2px 0;">Got featured in the <a href="https://urldefense.proofpoint.com/v2/url?u=https-3A__www.qualcomm.com_developer_blog_2025_07_from-2Dold-2Dto-2Delite-2Dhow-2Dnyu-2Dhack-2Dwinners-2Dembraced-2Dsnapdragon&d=DwMGaQ&c=slrrB7dE8n7gBJbeO0g-IQ&r=pyihzPbGwz9yNqAmgJS8KQ&m=Mt7rte2SLZlLU0YFz-V87h2Uf18WGdp4pOt9bFuKr38KoVG17ByPIE43oI6gKQMx&s=lIqTWjfnEeqY5g2h5Y9lsZqbQ4qEhWgffXRV8tGanSs&e=">Qualcomm developer Blog</a>.</li>
-              <li style="margin:2px 0;">Won 5 hackathons, attended 20+</li>
-              <li style="margin:2px 0;">Deep technical knowledge in SWE, AI, ML models with multiple academic and professional projects.</li>
-              <li style="margin:2px 0;">Previously interned at 3 consultancies & tech companies as SDE, AI, and Fullstack roles.</li>
-              <li style="margin:2px 0;">AI Business Fellow at Perplexity</li>
-              <li style="margin:2px 0;">I always build for social causes (<a href="https://github.com/nirmal141/TUTORAI">TutorAI</a>, <a href="https://github.com/nirmal141/PyroguardAI">PyroguardAI</a>, <a href="https://github.com/nirmal141/Fitfarm-main">Fitfarm</a>, <a href="https://github.com/nirmal141/Fittify">Fittify</a>) and more.</li>
-              <li style="margin:2px 0;">I solve rubik's cube in under 30 seconds (helps me stay sharp!)</li>
-            </ul>
-
-            <p style="margin:0 0 8px;">I learn and adapt things very quickly and am highly interested in working at {company_name} as a {role}. Looking forward to chatting with you on how my skills align with the org.</p>
-            <p style="margin:0 0 8px;">Attaching all the relevant links for your reference and my resume. Thank you for your time. Have a great day.</p>
-            
-
-            <p style="margin:0 0 8px;">
-            <a href="https://github.com/nirmal141">Github</a> | 
-            <a href="https://nirmal-aiswe.vercel.app">Portfolio</a> | 
-            <a href="https://linkedin.com/in/nirmal-boghara">Linkedin</a>
-            </p>
-
-            <p style="margin:0 0 8px;">Best regards,<br>
-            <strong>Nirmal Boghara</strong><br>
-            MS in Computer Science, New York University<br>
-            📧 {self.sender_email}<br>
-            
-            </p>
-          </div>
-        </body>
-        </html>
-        """
-
-        # Plain text version (verbatim text as provided)
-        text_body = f"""
-Hi {recruiter_name}, 
-
-Pleasure to e-meet you! I hope you're doing great! I am Nirmal Boghara, studying my second year MS in Computer Science at New York University, writing this mail to express my interest in {role} opportunity at {company_name} for Spring 2026! I won't make this very long for you, but thanks for your time. Here's everything about me:
-
-Studying CS at NYU 
-Did my undergrad at University of Mumbai in Computer Engineering
-Interned at Chewy last summer as an AI Innovator Intern II in Boston, MA.
-Currently Technical Ambassador at Qualcomm, mentored 200+ students at their Edge AI Hackathons across USA.
-Got featured in the Qualcomm developer Blog.
-Won 5 hackathons, attended 20+
-Deep technical knowledge in SWE, AI, ML models with multiple academic and professional projects.
-Previously interned at 3 consultancies & tech companies as SDE, AI, and Fullstack roles.
-AI Business Fellow at Perplexity
-I always build for social causes (TutorAI, PyroguardAI, Fitfarm, Fittify) and more.
-⁠⁠I solve rubik's cube in under 30 seconds (helps me stay sharp!)
-
-I learn and adapt things very quickly and am highly interested in working at {company_name} as a {role}. Looking forward to chatting with you on how my skills align with the org.
-Attaching all the relevant links for your reference and my resume. Thank you for your time. Have a great day.
-
-Best regards,
-Nirmal Boghara
-MS in Computer Science, New York University
-Email: {self.sender_email}
-Github | Portfolio | Linkedin
-        """
-
+        # Subject, HTML and text bodies from the compiled template
+        return self.template.render({
+            'company_name': company_name,
+            'role': role,
+            'recruiter_email': recruiter_email,
+            'recruiter_first_name': recruiter_first_name or '',
+            'recruiter_name': recruiter_name,
+            'sender_name': self.sender_name,
+            'sender_email': self.sender_email,
+        })
+
+    def sender_constants(self):
+        """Template values that are the same for every recipient"""
+        return {'sender_name': self.sender_name, 'sender_email': self.sender_email}
+
+    def render_prepared(self, company_name, role, recruiter_email, recruiter_first_name, recruiter_name, subject):
+        """Render the bodies for a row whose name and subject were prepared in batch"""
+        html_body, text_body = self.template.render_row(company_name, role, recruiter_email, recruiter_first_name,
+                                                        recruiter_name, self.sender_name, self.sender_email)
         return subject, html_body, text_body
 
-    def send_email(self, to_email, subject, html_body, text_body, resume_path=None):
+    def build_message(self, to_email, subject, html_body, text_body, resume_path=None):
+        """Build the MIME message for one recipient"""
+        # Create message
+        msg = MIMEMultipart('alternative')
+        msg['From'] = formataddr((self.sender_name, self.sender_email))
+        msg['To'] = to_email
+        msg['Subject'] = subject
+
+        # Add text and HTML parts
+        text_part = MIMEText(text_body, 'plain')
+        html_part = MIMEText(html_body, 'html')
+
+        msg.attach(text_part)
+        msg.attach(html_part)
+
+        # Attach resume if provided (read and base64-encoded once per file version)
+        if resume_path and os.path.exists(resume_path):
+            msg.attach(attachment_cache.get_part(resume_path))
+
+        return msg
+
+    @property
+    def skeleton(self):
+        """Invariant message parts for this sender, serialized on first use"""
+        if self._skeleton is None:
+            self._skeleton = MessageSkeleton(self.sender_name, self.sender_email)
+        return self._skeleton
+
+    def render_payload(self, row, resume_path=None):
+        """Serialize the whole message for a prepared (index, *ROW_COLUMNS) row, ready for sendmail"""
+        started = time.perf_counter()
+        subject, html_body, text_body = self.render_prepared(*row[1:])
+        rendered = time.perf_counter()
+        STAGE_SECONDS.observe(rendered - started, RENDER)
+
+        payload = None
+        if MESSAGE_ASSEMBLY == 'skeleton':
+            payload = self.skeleton.assemble(row[3], subject, html_body, text_body, resume_path)
+        if payload is None:
+            msg = self.build_message(row[3], subject, html_body, text_body, resume_path)
+            # CRLF line endings up front, so smtplib has nothing left to rewrite
+            payload = msg.as_bytes(policy=msg.policy.clone(linesep='\r\n'))
+        STAGE_SECONDS.observe(time.perf_counter() - rendered, MIME_BUILD)
+        return payload
+
+    def deliver_payload(self, to_email, payload, connection=None):
+        """Send a payload from render_payload, raising on failure"""
+        started = time.perf_counter()
+        try:
+            if connection is not None:
+                connection.sendmail(self.sender_email, [to_email], payload)
+            else:
+                with self.pool.connection() as conn:
+                    conn.sendmail(self.sender_email, [to_email], payload)
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, SMTP_SEND)
+
+    def deliver_email(self, to_email, subject, html_body, text_body, resume_path=None, connection=None):
+        """Build and send one message, raising on failure"""
+        msg = self.build_message(to_email, subject, html_body, text_body, resume_path)
+
+        # Send email on the caller's session, or borrow one from the pool
+        if connection is not None:
+            connection.send_message(msg)
+        else:
+            with self.pool.connection() as conn:
+                conn.send_message(msg)
+
+    def send_email(self, to_email, subject, html_body, text_body, resume_path=None, connection=None):
 
         try:
-            # Create message
-            msg = MIMEMultipart('alternative')
-            msg['From'] = formataddr((self.sender_name, self.sender_email))
-            msg['To'] = to_email
-            msg['Subject'] = subject
-
-            # Add text and HTML parts
-            text_part = MIMEText(text_body, 'plain')
-            html_part = MIMEText(html_body, 'html')
-
-            msg.attach(text_part)
-            msg.attach(html_part)
-
-            # Attach resume if provided
-            if resume_path and os.path.exists(resume_path):
-                with open(resume_path, "rb") as attachment:
-                    part = MIMEBase('application', 'octet-stream')
-                    part.set_payload(attachment.read())
-                    encoders.encode_base64(part)
-                    part.add_header(
-                        'Content-Disposition',
-                        f'attachment; filename= {os.path.basename(resume_path)}'
-                    )
-                    msg.attach(part)
-
-            # Send email
-            self.smtp_server.send_message(msg)
-            self.logger.info(f"Email sent successfully to {to_email}")
+            self.deliver_email(to_email, subject, html_body, text_body, resume_path, connection)
+            self.recipient_logger.info("Email sent successfully to %s", to_email)
             return True
 
         except Exception as e:
-            self.logger.error(f"Failed to send email to {to_email}: {str(e)}")
+            kind, reason = classify(e)
+            self.logger.error(f"Failed to send email to {to_email} ({kind}, {reason}): {str(e)}")
             return False
 
-    def send_bulk_emails(self, csv_file_path, resume_path=None, delay_seconds=2, test_mode=True):
+    def send_bulk_emails(self, csv_file_path, resume_path=None, delay_seconds=2, test_mode=True,
+                         workers=1, max_rate=None, progress_callback=None, engine='threaded',
+                         burst=1, domain_rate=None, total_rows=None, send_queue=None, campaign_id=None,
+                         quota=None, control=None, retry_policy=None, recipient_index=None,
+                         domain_checker=None, spread_domains=True, processes=None, shard_by='domain'):
 
         try:
-            # Read CSV file
-            df = pd.read_csv(csv_file_path)
+            # Open the CSV for streaming (validates required columns from the header)
+            source = open_contacts(csv_file_path)
 
-            # Validate required columns
-            required_columns = ['company_name', 'role', 'recruiter_email']
-            if not all(col in df.columns for col in required_columns):
-                raise ValueError(f"CSV must contain columns: {required_columns}")
-            
-            # Check for optional recruiter_first_name column
-            has_recruiter_name = 'recruiter_first_name' in df.columns
+            # Invalid, repeated and suppressed addresses are dropped before anything is rendered
+            started = time.perf_counter()
+            screening = screen(source, recipient_index, campaign_id, domain_checker)
+            STAGE_SECONDS.observe(time.perf_counter() - started, SCREEN)
+            skipped = np.concatenate([screening.invalid, screening.duplicates, screening.suppressed])
 
             # Initialize statistics
             stats = {
-                'total_emails': len(df),
+                'total_emails': (total_rows if total_rows is not None else screening.total) - len(skipped),
+                'skipped_invalid': len(screening.invalid),
+                'skipped_duplicates': len(screening.duplicates),
+                'skipped_suppressed': len(screening.suppressed),
                 'sent_successfully': 0,
                 'failed_to_send': 0,
+                'retried': 0,
                 'start_time': datetime.now(),
-                'failed_emails': []
+                'failed_emails': [],
+                # Final failures of this run by reason code ('550', 'auth', 'timeout', ...)
+                'failure_reasons': {}
             }
 
-            self.logger.info(f"Starting bulk email campaign for {stats['total_emails']} recipients")
-
-            if not test_mode:
-                # Connect to SMTP server
-                if not self.connect_to_smtp():
-                    return stats
-
-            # Process each row
-            for index, row in df.iterrows():
-                company_name = row['company_name']
-                role = row['role']
-                recruiter_email = row['recruiter_email']
-                recruiter_first_name = row.get('recruiter_first_name') if has_recruiter_name else None
-
-                # Create personalized email
-                subject, html_body, text_body = self.create_personalized_email(
-                    company_name, role, recruiter_email, recruiter_first_name, resume_path
-                )
-
-                if test_mode:
-                    # Test mode: just log what would be sent
-                    self.logger.info(f"TEST MODE - Would send to {recruiter_email} ({company_name} - {role})")
-                    self.logger.info(f"Subject: {subject}")
-                    stats['sent_successfully'] += 1
+            # With a durable queue, pick up where an interrupted run left off
+            skip = skipped
+            checkpoint = None
+            if len(skipped):
+                self.logger.info(f"Skipping {stats['skipped_invalid']} invalid, {stats['skipped_duplicates']} duplicate "
+                                 f"and {stats['skipped_suppressed']} suppressed recipients")
+            if send_queue is not None:
+                prior = send_queue.progress(campaign_id)
+                stats['sent_successfully'] = prior['sent']
+                stats['failed_to_send'] = prior['failed']
+                stats['failed_emails'] = prior['failed_emails']
+                finished = send_queue.finished_rows(campaign_id)
+                if len(finished):
+                    self.logger.info(f"Resuming campaign {campaign_id}: {len(finished)} recipients already done")
+                    skip = np.concatenate([skipped, finished])
+
+                def record_result(index, recruiter_email, state, error):
+                    send_queue.record(campaign_id, index, recruiter_email, state, error)
+                checkpoint = record_result
+
+            # delay_seconds stays the minimum gap between sends on one session;
+            # the limiter adds the global and per-domain ceilings (and the sender quota) on top of it
+            limiter = RateLimiter(rate=max_rate, burst=burst, domain_rate=domain_rate, quota=quota)
+
+            self.logger.info(f"Starting bulk email campaign for {stats['total_emails']} recipients "
+                             f"with {workers} {engine} worker(s)")
+            if LOG_RECIPIENT_SAMPLE > 1:
+                self.logger.info(f"Logging 1 in {LOG_RECIPIENT_SAMPLE} per-recipient lines; the summary counts them all")
+
+            # Chunks are parsed and prepared (names, subjects) in vectorized passes as
+            # the engine consumes them; the engines only walk plain tuples
+            rows = self._campaign_rows(source, skip, send_queue, campaign_id, spread_domains)
+
+            if engine == 'async':
+                # Imported lazily so the threaded path works without aiosmtplib
+                from async_sender import AsyncSendEngine
+                sender = AsyncSendEngine(self, sessions=workers, rate_limiter=limiter, delay_seconds=delay_seconds,
+                                         progress_callback=progress_callback, test_mode=test_mode,
+                                         checkpoint=checkpoint, control=control, retry_policy=retry_policy)
+            elif engine == 'process':
+                # Shards the rows across processes, each with `workers` threads and its own sessions
+                from process_engine import ProcessSendEngine
+                sender = ProcessSendEngine(self, workers=workers, rate_limiter=limiter, delay_seconds=delay_seconds,
+                                           progress_callback=progress_callback, test_mode=test_mode,
+                                           checkpoint=checkpoint, control=control, retry_policy=retry_policy,
+                                           processes=processes, shard_by=shard_by)
+            else:
+                # Every worker needs its own pooled session
+                if workers > self.pool_size:
+                    self.pool_size = workers
+                sender = SendEngine(self, workers=workers, rate_limiter=limiter, delay_seconds=delay_seconds,
+                                    progress_callback=progress_callback, test_mode=test_mode,
+                                    checkpoint=checkpoint, control=control, retry_policy=retry_policy)
+            sender.run(rows, stats, resume_path)
+            stats['cancelled'] = sender.control.cancelled
+            if stats.get('shard_failures') or stats.get('dropped_rows'):
+                # Rows of a failed send process were never sent; leave the campaign resumable
+                stats['error'] = (f"{stats['shard_failures']} send process(es) failed and "
+                                  f"{stats['dropped_rows']} recipients were not dispatched")
+                self.logger.error(stats['error'])
+            if send_queue is not None:
+                # A cancelled or failed campaign keeps its checkpoint so it can be resumed later
+                send_queue.flush()
+                if stats['cancelled']:
+                    status = CANCELLED
+                elif stats.get('error'):
+                    status = ERROR
                 else:
-                    # Actually send email
-                    if self.send_email(recruiter_email, subject, html_body, text_body, resume_path):
-                        stats['sent_successfully'] += 1
-                    else:
-                        stats['failed_to_send'] += 1
-                        stats['failed_emails'].append(recruiter_email)
-
-                    # Add delay to avoid spam detection
-                    time.sleep(delay_seconds)
-
-                # Progress update
-                if (index + 1) % 10 == 0:
-                    self.logger.info(f"Progress: {index + 1}/{stats['total_emails']} emails processed")
-
-            if not test_mode:
-                self.disconnect_from_smtp()
+                    status = COMPLETED
+                send_queue.set_status(campaign_id, status)
+                if recipient_index is not None and not test_mode:
+                    # Later campaigns skip whoever this one reached or bounced
+                    recipient_index.record_campaign(send_queue, campaign_id)
+            stats['throttled'] = limiter.throttled
+            stats['attachment_cache'] = attachment_cache.stats()
 
             # Final statistics
             stats['end_time'] = datetime.now()
             stats['duration'] = stats['end_time'] - stats['start_time']
+            stats['duration_seconds'] = int(stats['duration'].total_seconds())
 
-            self.logger.info(f"Campaign completed!")
+            if stats.get('error') and not stats['cancelled']:
+                self.logger.info("Campaign stopped with errors")
+            else:
+                self.logger.info("Campaign cancelled" if stats['cancelled'] else "Campaign completed!")
             self.logger.info(f"Total emails: {stats['total_emails']}")
             self.logger.info(f"Successfully sent: {stats['sent_successfully']}")
             self.logger.info(f"Failed to send: {stats['failed_to_send']}")
+            self.logger.info(f"Retried: {stats['retried']}")
             self.logger.info(f"Duration: {stats['duration']}")
 
             return stats
 
         except Exception as e:
             self.logger.error(f"Error in bulk email campaign: {str(e)}")
+            if send_queue is not None:
+                # Keep whatever was checkpointed so the campaign can be resumed
+                send_queue.flush()
+                send_queue.set_status(campaign_id, ERROR)
+                if recipient_index is not None and not test_mode:
+                    recipient_index.record_campaign(send_queue, campaign_id)
             return stats
 
+    def _campaign_rows(self, source, skip=None, send_queue=None, campaign_id=None, spread_domains=True):
+        """Prepared row tuples for the engines, enqueued as pending chunk by chunk"""
+        chunks = iter_prepared_chunks(source, self.template, self.sender_constants(), skip)
+        while True:
+            # Parsing and preparing a chunk is the campaign's CSV load time
+            started = time.perf_counter()
+            prepared = next(chunks, None)
+            if prepared is None:
+                return
+            STAGE_SECONDS.observe(time.perf_counter() - started, CSV_LOAD)
+            if send_queue is not None:
+                send_queue.enqueue(campaign_id, prepared.index, prepared['recruiter_email'])
+            if spread_domains:
+                prepared = spread_by_domain(prepared)
+            yield from prepared.itertuples(index=True, name=None)
+
 
 # Example usage and configuration
 def main():
+    # Say QUIT on pooled SMTP sessions when the script exits
+    atexit.register(close_all_pools)
 
     # Configuration - UPDATE THESE VALUES
     SENDER_EMAIL = "nb3964@nyu.edu"  # Replace with your email
@@ -0,0 +1,177 @@
+import atexit
+import itertools
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+# Campaign log file, rotated once it reaches LOG_MAX_BYTES; LOG_BACKUP_COUNT old files are kept
+LOG_FILE = os.environ.get('LOG_FILE', 'email_automation.log')
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+
+# Records written between flushes, and the longest a written record waits for one
+LOG_BATCH_SIZE = 256
+LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', 1.0))
+
+# Keep one in N per-recipient lines ("Email sent successfully to ..."); warnings and errors are always kept
+LOG_RECIPIENT_SAMPLE = max(1, int(os.environ.get('LOG_RECIPIENT_SAMPLE', 1)))
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+class DeferredFlush:
+    """Handler mixin that skips the flush after every record; the listener flushes once per batch"""
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+    def close(self):
+        self.flush_batch()
+        super().close()
+
+
+class BatchedFileHandler(DeferredFlush, RotatingFileHandler):
+    pass
+
+
+class BatchedStreamHandler(DeferredFlush, logging.StreamHandler):
+    pass
+
+
+class LazyQueueHandler(QueueHandler):
+    """Enqueue records untouched, so formatting happens on the listener thread
+
+    QueueHandler.prepare formats every record up front so it can be
+    pickled. This queue never leaves the process, so the message, its
+    args and any traceback can be formatted later, off the send path.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class BatchingQueueListener(QueueListener):
+    """Writes everything already queued before flushing the handlers once"""
+
+    def __init__(self, queue, *handlers, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+    def _monitor(self):
+        q = self.queue
+        has_task_done = hasattr(q, 'task_done')
+        written = 0
+        last_flush = time.monotonic()
+        while True:
+            try:
+                # Only wait with a timeout while something is written but not flushed yet
+                record = q.get(timeout=self.flush_interval) if written else q.get()
+            except queue.Empty:
+                record = None
+            else:
+                if has_task_done:
+                    q.task_done()
+                if record is self._sentinel:
+                    break
+                self.handle(record)
+                written += 1
+            if written and (record is None or written >= self.batch_size
+                            or time.monotonic() - last_flush >= self.flush_interval or q.empty()):
+                self.flush()
+                written = 0
+                last_flush = time.monotonic()
+        self.flush()
+
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush_batch()
+
+
+class SampleFilter(logging.Filter):
+    """Pass one record in `every` below WARNING, and every warning or error"""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+        self._seen = itertools.count()
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or next(self._seen) % self.every == 0
+
+
+class ForwardingHandler(QueueHandler):
+    """Hands records from a send process to its parent over the results queue, tagged with the shard"""
+
+    def __init__(self, queue, shard):
+        super().__init__(queue)
+        self.shard = shard
+
+    def enqueue(self, record):
+        # prepare() has already formatted the message, so the record pickles cleanly
+        self.queue.put_nowait(('log', self.shard, record))
+
+
+def setup_logging(level=logging.INFO):
+    """Send every record through a queue to a rotating log file and the console
+
+    The calling thread only appends to the queue; a listener thread
+    formats and writes. Like basicConfig, this does nothing when the root
+    logger already has handlers.
+    """
+    global _listener
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [BatchedFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT),
+                BatchedStreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    root.addHandler(LazyQueueHandler(records))
+    root.setLevel(level)
+    _listener = BatchingQueueListener(records, *handlers)
+    _listener.start()
+    # Write out whatever is still queued (the campaign summary, usually) before the process exits
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write out queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def forward_logging(results, shard, level):
+    """Log through the parent process from a send process; the parent owns the log file"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(ForwardingHandler(results, shard))
+    root.setLevel(level)
+
+
+def handle_forwarded(record):
+    """Log a record forwarded from a send process through this process's handlers"""
+    # callHandlers skips the logger's filters; the record was already sampled in its own process
+    logging.getLogger(record.name).callHandlers(record)
+
+
+def recipient_logger(name):
+    """Logger for per-recipient lines, sampled down to one in LOG_RECIPIENT_SAMPLE"""
+    logger = logging.getLogger(f'{name}.recipients')
+    if LOG_RECIPIENT_SAMPLE > 1 and not logger.filters:
+        logger.addFilter(SampleFilter(LOG_RECIPIENT_SAMPLE))
+    return logger
@@ -0,0 +1,238 @@
+import bisect
+import threading
+
+
+# Bucket upper bounds in seconds, from 50µs to about 100s, each 20% above the last
+DEFAULT_BUCKETS = tuple(0.00005 * 1.2 ** n for n in range(80))
+
+
+class Histogram:
+    """Observation counts per bucket, so quantiles cost no per-sample memory
+
+    Not thread-safe on its own; callers observe under their own lock.
+    Quantiles are interpolated inside the bucket, so they are accurate to
+    within one bucket width (20%).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # The last slot counts observations above the largest bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, counts, total):
+        """Add the counts and sum of another histogram with the same buckets"""
+        for i, n in enumerate(counts):
+            self.counts[i] += n
+        self.count += sum(counts)
+        self.sum += total
+
+    def quantile(self, q):
+        """Estimated value below which a fraction q of the observations fall"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+# Bounds for the exported latency histograms, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    """Monotonic count, optionally split by label values (a tuple in label order)"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def export(self):
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, exported):
+        with self._lock:
+            for labels, value in exported.items():
+                self._values[labels] = self._values.get(labels, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        for labels, value in sorted(self.export().items()):
+            yield self.name, dict(zip(self.label_names, labels)), value
+
+
+class Timer:
+    """Histogram of durations in seconds, optionally split by label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, labels=()):
+        with self._lock:
+            histogram = self._values.get(labels)
+            if histogram is None:
+                histogram = self._values[labels] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def export(self):
+        with self._lock:
+            return {labels: (list(h.counts), h.sum) for labels, h in self._values.items()}
+
+    def merge(self, exported):
+        with self._lock:
+            for labels, (counts, total) in exported.items():
+                histogram = self._values.get(labels)
+                if histogram is None:
+                    histogram = self._values[labels] = Histogram(self.buckets)
+                histogram.merge(counts, total)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        for labels, (counts, total) in sorted(self.export().items()):
+            base = dict(zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield self.name + '_bucket', {**base, 'le': format_bound(bound)}, cumulative
+            yield self.name + '_sum', base, total
+            yield self.name + '_count', base, cumulative
+
+
+def format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def escape_label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class Registry:
+    """Every metric of this process, rendered in the Prometheus text format
+
+    Collectors are called at scrape time and yield (name, kind, help,
+    samples) for values that already live elsewhere, such as campaign
+    states, so reading them costs nothing on the send path.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def timer(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Timer(name, help, labels, buckets))
+
+    def add_collector(self, collect):
+        with self._lock:
+            self._collectors.append(collect)
+
+    def export(self):
+        """Plain, picklable values that merge() can add into another process's registry"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.export() for metric in metrics}
+
+    def merge(self, exported):
+        with self._lock:
+            metrics = dict(self._metrics)
+        for name, values in exported.items():
+            if name in metrics:
+                metrics[name].merge(values)
+
+    def reset(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        families = [(m.name, m.kind, m.help, m.samples()) for m in metrics]
+        for collect in collectors:
+            families.extend(collect())
+
+        lines = []
+        for name, kind, help, samples in families:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for sample, labels, value in samples:
+                if labels:
+                    rendered = ','.join(f'{key}="{escape_label(v)}"' for key, v in labels.items())
+                    lines.append(f'{sample}{{{rendered}}} {value}')
+                else:
+                    lines.append(f'{sample} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry served at /metrics
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.timer(
+    'email_stage_seconds', 'Time spent in each step of preparing and sending email', ['stage'])
+MESSAGES = REGISTRY.counter('email_messages_total', 'Final results of real (non-test) sends', ['result'])
+RETRIES = REGISTRY.counter('email_retries_total', 'Sends scheduled for another attempt after a temporary failure')
+THROTTLED = REGISTRY.counter('email_throttled_total', 'Throttling replies (421/451) from providers')
+CONNECTS = REGISTRY.counter('email_smtp_connects_total', 'SMTP sessions opened and logged in')
+RECONNECTS = REGISTRY.counter('email_smtp_reconnects_total', 'SMTP sessions reopened after the server dropped them')
+CACHE_LOOKUPS = REGISTRY.counter('email_cache_lookups_total', 'Lookups in the attachment caches', ['cache', 'result'])
+
+# Label tuples for the hot paths, built once
+CSV_LOAD = ('csv_load',)
+SCREEN = ('screen',)
+RENDER = ('render',)
+MIME_BUILD = ('mime_build',)
+ATTACHMENT_ENCODE = ('attachment_encode',)
+SMTP_CONNECT = ('smtp_connect',)
+SMTP_SEND = ('smtp_send',)
+RATE_LIMIT_WAIT = ('rate_limit_wait',)
+ATTACHMENT_HIT = ('attachment', 'hit')
+ATTACHMENT_MISS = ('attachment', 'miss')
+SKELETON_HIT = ('skeleton_attachment', 'hit')
+SKELETON_MISS = ('skeleton_attachment', 'miss')
@@ -0,0 +1,95 @@
+import os
+import random
+import re
+import sys
+import threading
+from email import base64mime
+from email.mime.multipart import MIMEMultipart
+from email.policy import compat32
+from email.utils import formataddr
+
+from attachment_cache import attachment_cache
+from metrics import CACHE_LOOKUPS, SKELETON_HIT, SKELETON_MISS
+
+
+# Same policy smtplib flattens with, so spliced bytes match what send_message would put on the wire
+POLICY = compat32.clone(linesep='\r\n')
+CRLF = b'\r\n'
+NLCRE = re.compile(r'\r\n|\r|\n')
+
+
+def text_part(body, subtype):
+    """Serialized MIMEText(body, subtype) part, without building the object"""
+    try:
+        encoded = body.encode('us-ascii')
+    except UnicodeEncodeError:
+        # MIMEText picks utf-8 and base64 for anything that isn't plain ASCII
+        return (f'Content-Type: text/{subtype}; charset="utf-8"\r\n'
+                'MIME-Version: 1.0\r\nContent-Transfer-Encoding: base64\r\n\r\n').encode('ascii') + \
+            base64mime.body_encode(body.encode('utf-8'), eol='\r\n').encode('ascii')
+    if b'\n' in encoded or b'\r' in encoded:
+        encoded = NLCRE.sub('\r\n', body).encode('us-ascii')
+    return (f'Content-Type: text/{subtype}; charset="us-ascii"\r\n'
+            'MIME-Version: 1.0\r\nContent-Transfer-Encoding: 7bit\r\n\r\n').encode('ascii') + encoded
+
+
+class MessageSkeleton:
+    """The parts of a campaign's messages that never change, serialized once
+
+    From, the multipart layout and boundary, and the encoded resume are the
+    same for every recipient, so assemble() only folds To/Subject and
+    encodes the two bodies, then joins byte strings. The output is what
+    EmailAutomation.build_message + as_bytes would produce with the same
+    boundary.
+    """
+
+    def __init__(self, sender_name, sender_email):
+        # Set the fixed headers on a real message so they come out in build_message's order
+        msg = MIMEMultipart('alternative')
+        msg['From'] = formataddr((sender_name, sender_email))
+        # Same shape as the boundaries email.generator picks
+        self.boundary = '=' * 15 + ('%019d' % random.randrange(sys.maxsize)) + '=='
+        msg.set_boundary(self.boundary)
+        self.head = b''.join(POLICY.fold_binary(name, value) for name, value in msg.items())
+
+        delimiter = f'--{self.boundary}'.encode('ascii')
+        self.marker = delimiter
+        self.first = delimiter + CRLF
+        self.between = CRLF + delimiter + CRLF
+        self.end = CRLF + delimiter + b'--' + CRLF
+        self._attachments = {}
+        self._lock = threading.Lock()
+
+    def attachment(self, path):
+        """Serialized attachment part for path, encoded at most once per file version"""
+        entry = attachment_cache.get(path)
+        with self._lock:
+            cached = self._attachments.get(path)
+            if cached is not None and cached[0] is entry:
+                CACHE_LOOKUPS.inc(labels=SKELETON_HIT)
+                return cached[1]
+        CACHE_LOOKUPS.inc(labels=SKELETON_MISS)
+        serialized = entry.to_part().as_bytes(policy=POLICY)
+        with self._lock:
+            self._attachments[path] = (entry, serialized)
+        return serialized
+
+    def assemble(self, to_email, subject, html_body, text_body, resume_path=None):
+        """Full message bytes, or None if a body happens to contain the boundary"""
+        text = text_part(text_body, 'plain')
+        html = text_part(html_body, 'html')
+        if self.marker in text or self.marker in html:
+            return None
+
+        pieces = [
+            self.head,
+            POLICY.fold_binary('To', to_email),
+            POLICY.fold_binary('Subject', subject),
+            CRLF,
+            self.first, text,
+            self.between, html,
+        ]
+        if resume_path and os.path.exists(resume_path):
+            pieces += [self.between, self.attachment(resume_path)]
+        pieces.append(self.end)
+        return b''.join(pieces)
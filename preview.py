@@ -0,0 +1,52 @@
+import math
+import os
+from collections import namedtuple
+
+import numpy as np
+
+
+# Contacts shown per preview page
+PREVIEW_PAGE_SIZE = int(os.environ.get('PREVIEW_PAGE_SIZE', 25))
+
+# Filter fields of the preview page and the columns they search; the search box looks in all of them
+SEARCH_COLUMNS = {'company': 'company_name', 'role': 'role', 'email': 'recruiter_email'}
+
+PreviewPage = namedtuple('PreviewPage', ['rows', 'page', 'pages', 'matches', 'page_size'])
+PreviewPage.__doc__ = """One page of a contact list; rows is a DataFrame indexed by row position"""
+
+
+def matching_rows(source, query='', filters=None):
+    """Positions of rows that contain query in any search column and match every filter
+
+    Returns None when neither narrows the list, so callers can page
+    through the whole list without materializing every position.
+    """
+    selected = None
+    for key, text in (filters or {}).items():
+        text = (text or '').strip()
+        if text:
+            found = source.find(SEARCH_COLUMNS[key], text)
+            selected = found if selected is None else np.intersect1d(selected, found, assume_unique=True)
+
+    query = (query or '').strip()
+    if query:
+        found = np.unique(np.concatenate([source.find(column, query) for column in SEARCH_COLUMNS.values()]))
+        selected = found if selected is None else np.intersect1d(selected, found, assume_unique=True)
+    return selected
+
+
+def preview_page(source, page=1, query='', filters=None, page_size=PREVIEW_PAGE_SIZE):
+    """One page of the matching rows, read from the columnar dataset by offset
+
+    Out-of-range page numbers are clamped to the first or last page.
+    """
+    selected = matching_rows(source, query, filters)
+    matches = source.row_count if selected is None else len(selected)
+    pages = max(1, math.ceil(matches / page_size))
+    page = min(max(1, page), pages)
+    start = (page - 1) * page_size
+    if selected is None:
+        rows = source.rows(start, start + page_size)
+    else:
+        rows = source.take(selected[start:start + page_size])
+    return PreviewPage(rows, page, pages, matches, page_size)
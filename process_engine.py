@@ -0,0 +1,423 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zlib
+
+from campaign_state import CampaignControl
+from demo import EmailAutomation
+from log_pipeline import forward_logging, handle_forwarded
+from metrics import REGISTRY
+from rate_limiter import LONG_WAIT_SECONDS, RateLimiter, recipient_domain
+from retry import RetryPolicy
+from send_engine import SendEngine, StageTimer
+
+
+# 'spawn' starts each shard from a clean interpreter; forking the web process
+# would copy locks that its other threads may be holding
+START_METHOD = os.environ.get('PROCESS_START_METHOD', 'spawn')
+
+# How rows are split across processes: every recipient domain stays in one
+# process (so per-domain limits hold), or fixed-size blocks of rows take turns
+SHARD_KEYS = ('domain', 'range')
+
+# Rows handed to a shard per queue message, so pickling and pipe overhead is paid per batch
+SHARD_BATCH_SIZE = 200
+# Batches waiting per shard before the dispatcher blocks (back-pressure)
+SHARD_QUEUE_DEPTH = 4
+# Rows per block when sharding by range
+RANGE_BLOCK_SIZE = 1000
+# Checkpoint records a shard buffers before shipping them to the parent
+CHECKPOINT_BATCH_SIZE = 100
+# How often the parent folds the shared counters into stats and passes on pause/cancel
+PROGRESS_INTERVAL = 0.25
+
+# Layout of each shard's slots in the shared counter block
+SENT_SLOT, FAILED_SLOT, RETRIED_SLOT = range(3)
+SLOTS = 3
+
+
+class SharedControl(CampaignControl):
+    """CampaignControl whose switches are multiprocessing events, visible to every shard"""
+
+    def __init__(self, cancelled, running):
+        self._cancelled = cancelled
+        self._running = running
+        self.thread_ids = set()
+
+
+class QuotaGate:
+    """Sender quota claimed in the parent at the moment a shard is about to send
+
+    The SenderQuota is shared with the app's other campaigns, so only the
+    parent can claim it. A shard's worker signals `wanted` and blocks on
+    `granted`; the parent claims a slot per request and waits out the quota
+    window before granting it, so no send runs ahead of its claim.
+    """
+
+    def __init__(self, context):
+        self.wanted = context.Semaphore(0)
+        self.granted = context.Semaphore(0)
+
+    def wait(self, cancelled):
+        """Shard side: block until the parent grants one send; False if cancelled first"""
+        self.wanted.release()
+        while not self.granted.acquire(timeout=PROGRESS_INTERVAL):
+            if cancelled.is_set():
+                return False
+        return True
+
+
+class GatedRateLimiter(RateLimiter):
+    """A shard's RateLimiter that also waits for the parent to grant sender quota"""
+
+    def __init__(self, gate, cancelled, **kwargs):
+        super().__init__(**kwargs)
+        self.gate = gate
+        self.cancelled = cancelled
+
+    def reserve(self, domain=''):
+        # Wait outside the limiter's lock, so other workers can still record their results
+        if not self.gate.wait(self.cancelled):
+            # Any later slot sends the engine to its cancel check, which leaves the row unsent
+            return time.monotonic() + PROGRESS_INTERVAL
+        return super().reserve(domain)
+
+
+class ProcessSendEngine:
+    """Split a campaign across worker processes, each running its own SendEngine
+
+    Rendering, MIME assembly and base64 are CPU-bound, so one process tops
+    out at one core however many threads it runs. The parent streams the
+    prepared rows to the shards in batches; each shard has its own SMTP
+    sessions, rate limiter share and retry queue. Shards publish their
+    sent/failed/retried totals in a shared-memory counter block that the
+    parent sums for progress, and ship checkpoint records back in batches
+    so the parent can keep the durable send queue up to date.
+    """
+
+    def __init__(self, automation, workers=1, rate_limiter=None, delay_seconds=0,
+                 progress_callback=None, test_mode=True, checkpoint=None, control=None,
+                 retry_policy=None, processes=None, shard_by='domain'):
+        if shard_by not in SHARD_KEYS:
+            raise ValueError(f"Unknown shard key: {shard_by}")
+        self.automation = automation
+        self.workers = max(1, int(workers))
+        self.processes = max(1, int(processes or os.cpu_count() or 1))
+        self.shard_by = shard_by
+        self.limiter = rate_limiter or RateLimiter()
+        self.delay_seconds = delay_seconds
+        self.progress_callback = progress_callback
+        self.test_mode = test_mode
+        self.checkpoint = checkpoint
+        self.control = control or CampaignControl()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.logger = automation.logger
+        self.timing = StageTimer()
+        self._current_email = ''
+        self._reported = None
+        # Shards that crashed or reported an error, and rows that never reached a live shard
+        self._failed_shards = set()
+        self._dropped = 0
+
+    def run(self, rows, stats, resume_path=None):
+        """Send every prepared (index, *contacts.ROW_COLUMNS) row and fill in stats"""
+        self._stats = stats
+        # A resumed campaign starts from the results already checkpointed
+        self._prior = (stats['sent_successfully'], stats['failed_to_send'], stats['retried'])
+
+        context = multiprocessing.get_context(START_METHOD)
+        # Each shard only writes its own slots, so the block needs no lock
+        self._counters = context.Array('q', self.processes * SLOTS, lock=False)
+        self._results = context.Queue()
+        self._shared = SharedControl(context.Event(), context.Event())
+        self._shared.resume()
+
+        config = self._shard_config(stats, resume_path)
+        gate = None
+        if self.limiter.quota is not None and not self.test_mode:
+            gate = QuotaGate(context)
+        self._queues = [context.Queue(maxsize=SHARD_QUEUE_DEPTH) for _ in range(self.processes)]
+        self._shards = [
+            context.Process(target=run_shard, name=f"send-shard-{n}", daemon=True,
+                            args=(n, config, self._queues[n], self._results, self._counters,
+                                  self._shared._cancelled, self._shared._running, gate))
+            for n in range(self.processes)
+        ]
+        for process in self._shards:
+            process.start()
+        self.logger.info(f"Started {self.processes} send processes with {self.workers} worker(s) each, "
+                         f"sharded by {self.shard_by}")
+
+        finished = threading.Event()
+        monitor = threading.Thread(target=self._monitor, args=(finished,), name='shard-monitor', daemon=True)
+        monitor.start()
+        granter = None
+        if gate is not None:
+            granter = threading.Thread(target=self._grant_quota, args=(gate, finished), name='quota-granter',
+                                       daemon=True)
+            granter.start()
+
+        batches = [[] for _ in self._shards]
+        # This thread parses, prepares and pickles the rows for the shards
+        cpu_started = time.thread_time()
+        try:
+            for row in rows:
+                if self.control.cancelled:
+                    break
+                shard = self._shard_of(row)
+                batch = batches[shard]
+                batch.append(row)
+                if len(batch) >= SHARD_BATCH_SIZE:
+                    self._dispatch_rows(shard, batch)
+                    batches[shard] = []
+            if not self.control.cancelled:
+                for shard, batch in enumerate(batches):
+                    if batch:
+                        self._dispatch_rows(shard, batch)
+        finally:
+            self.timing.add_cpu('prepare', time.thread_time() - cpu_started)
+            for shard in range(self.processes):
+                self._dispatch(shard, None)
+            for process in self._shards:
+                process.join()
+            finished.set()
+            monitor.join()
+            if granter is not None:
+                granter.join()
+            for shard_queue in self._queues:
+                # Rows a cancelled shard never read must not keep this process from exiting
+                shard_queue.cancel_join_thread()
+
+        for n, process in enumerate(self._shards):
+            if process.exitcode:
+                self.logger.error(f"Send process {n} exited with code {process.exitcode}")
+                self._failed_shards.add(n)
+        # Rows of a failed shard stay unfinished in the checkpoint; the campaign must not count as completed
+        stats['shard_failures'] = len(self._failed_shards)
+        stats['dropped_rows'] = self._dropped
+        if self._dropped:
+            self.logger.error(f"{self._dropped} recipients were not handed to a send process")
+        stats['pipeline'] = self.timing.summary()
+        self.timing.log(self.logger)
+        return stats
+
+    def _shard_config(self, stats, resume_path):
+        """Everything a shard needs to rebuild the sender, its limiter share and its engine"""
+        automation = self.automation
+        limiter = self.limiter
+        rate = limiter.global_bucket.configured_rate
+        domain_rate = limiter.domain_rate
+        if domain_rate and self.shard_by == 'range':
+            # A domain's rows land in every shard, so each gets an equal share of its limit
+            domain_rate = domain_rate / self.processes
+        return {
+            'sender_email': automation.sender_email,
+            'sender_password': automation.sender_password,
+            'sender_name': automation.sender_name,
+            'smtp_host': automation.smtp_host,
+            'smtp_port': automation.smtp_port,
+            'use_tls': automation.use_tls,
+            'template': automation.template,
+            'workers': self.workers,
+            'delay_seconds': self.delay_seconds,
+            'test_mode': self.test_mode,
+            'retry_policy': self.retry_policy,
+            'rate': rate / self.processes if rate else None,
+            'burst': max(1, limiter.global_bucket.burst // self.processes),
+            'domain_rate': domain_rate,
+            'domain_burst': limiter.domain_burst,
+            'resume_path': resume_path,
+            'total_emails': stats['total_emails'],
+            'log_level': logging.getLogger().level,
+        }
+
+    def _shard_of(self, row):
+        if self.shard_by == 'domain':
+            return zlib.crc32(recipient_domain(row[3]).encode('utf-8')) % self.processes
+        return row[0] // RANGE_BLOCK_SIZE % self.processes
+
+    def _grant_quota(self, gate, finished):
+        """Claim the sender quota for each send a shard asks for, then let that send go"""
+        quota = self.limiter.quota
+        self.control.join_thread()
+        try:
+            while not finished.is_set() and not self.control.cancelled:
+                if not gate.wanted.acquire(timeout=PROGRESS_INTERVAL):
+                    continue
+                now = time.monotonic()
+                slot = quota.claim(now)
+                delay = slot - now
+                if delay >= LONG_WAIT_SECONDS:
+                    self.logger.warning(f"Send limit reached; next email in {delay / 60:.0f} minute(s)")
+                if not self.control.sleep(delay):
+                    # Cancelled before the send could go; the slot was never used
+                    quota.release(slot)
+                    return
+                gate.granted.release()
+        finally:
+            self.control.leave_thread()
+
+    def _dispatch(self, shard, batch):
+        """Queue a batch (or the None sentinel) for a shard, giving up if the shard has exited"""
+        while self._shards[shard].is_alive():
+            try:
+                self._queues[shard].put(batch, timeout=PROGRESS_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _dispatch_rows(self, shard, batch):
+        """Queue a batch of rows, counting them as dropped if the shard is gone"""
+        if not self._dispatch(shard, batch):
+            self._dropped += len(batch)
+            self._failed_shards.add(shard)
+
+    def _monitor(self, finished):
+        """Pass pause/cancel on to the shards, apply their results and report progress"""
+        self.control.join_thread()
+        try:
+            while True:
+                done = finished.is_set()
+                self._mirror_control()
+                self._drain(0.05 if done else PROGRESS_INTERVAL)
+                self._report()
+                if done:
+                    return
+        finally:
+            self.control.leave_thread()
+
+    def _mirror_control(self):
+        if self.control.cancelled:
+            self._shared.cancel()
+        elif self.control.paused:
+            self._shared.pause()
+        else:
+            self._shared.resume()
+
+    def _drain(self, timeout):
+        try:
+            message = self._results.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            self._apply(*message)
+            try:
+                message = self._results.get_nowait()
+            except queue.Empty:
+                return
+
+    def _apply(self, kind, shard, payload):
+        stats = self._stats
+        if kind == 'checkpoint':
+            for index, recruiter_email, state, error in payload:
+                if self.checkpoint is not None:
+                    self.checkpoint(index, recruiter_email, state, error)
+                self._current_email = recruiter_email
+        elif kind == 'done':
+            stats['failed_emails'].extend(payload['failed_emails'])
+            reasons = stats['failure_reasons']
+            for reason, count in payload['failure_reasons'].items():
+                reasons[reason] = reasons.get(reason, 0) + count
+            self.timing.merge(payload['timing'])
+            # Shard metrics reach /metrics here once the shard finishes
+            REGISTRY.merge(payload['metrics'])
+            self.limiter.throttled += payload['throttled']
+        elif kind == 'log':
+            handle_forwarded(payload)
+        elif kind == 'error':
+            self.logger.error(f"Send process {shard} failed: {payload}")
+            self._failed_shards.add(shard)
+
+    def _report(self):
+        """Fold the shared counters into stats and report progress if anything changed"""
+        counters = self._counters[:]
+        sent, failed, retried = self._prior
+        stats = self._stats
+        stats['sent_successfully'] = sent + sum(counters[SENT_SLOT::SLOTS])
+        stats['failed_to_send'] = failed + sum(counters[FAILED_SLOT::SLOTS])
+        stats['retried'] = retried + sum(counters[RETRIED_SLOT::SLOTS])
+
+        processed = stats['sent_successfully'] + stats['failed_to_send']
+        if processed == self._reported:
+            return
+        self._reported = processed
+        if self.progress_callback is not None:
+            self.progress_callback(processed, stats, self._current_email)
+
+
+def shard_rows(rows):
+    """Rows from a shard's queue until the parent's None sentinel"""
+    while True:
+        batch = rows.get()
+        if batch is None:
+            return
+        yield from batch
+
+
+def run_shard(shard, config, rows, results, counters, cancelled, running, gate=None):
+    """Entry point of one send process: a SendEngine over the rows the parent routes here"""
+    base = shard * SLOTS
+    pending = []
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal pending, last_flush
+        if pending:
+            results.put(('checkpoint', shard, pending))
+            pending = []
+        last_flush = time.monotonic()
+
+    def checkpoint(index, recruiter_email, state, error):
+        # Called under the engine's lock
+        pending.append((index, recruiter_email, state, error))
+        if len(pending) >= CHECKPOINT_BATCH_SIZE or time.monotonic() - last_flush >= PROGRESS_INTERVAL:
+            flush()
+
+    def publish(processed, stats, recruiter_email):
+        counters[base + SENT_SLOT] = stats['sent_successfully']
+        counters[base + FAILED_SLOT] = stats['failed_to_send']
+        counters[base + RETRIED_SLOT] = stats['retried']
+
+    # A forked shard would otherwise hand the parent's own counts back to it
+    REGISTRY.reset()
+    # Records go to the parent, whose listener owns the (rotating) log file
+    forward_logging(results, shard, config['log_level'])
+    try:
+        automation = EmailAutomation(config['sender_email'], config['sender_password'], config['sender_name'],
+                                     smtp_host=config['smtp_host'], smtp_port=config['smtp_port'],
+                                     pool_size=config['workers'], use_tls=config['use_tls'])
+        automation.template = config['template']
+        limits = {'rate': config['rate'], 'burst': config['burst'], 'domain_rate': config['domain_rate'],
+                  'domain_burst': config['domain_burst']}
+        limiter = GatedRateLimiter(gate, cancelled, **limits) if gate is not None else RateLimiter(**limits)
+        stats = {
+            'total_emails': config['total_emails'],
+            'sent_successfully': 0,
+            'failed_to_send': 0,
+            'retried': 0,
+            'failed_emails': [],
+            'failure_reasons': {},
+        }
+        engine = SendEngine(automation, workers=config['workers'], rate_limiter=limiter,
+                            delay_seconds=config['delay_seconds'], progress_callback=publish,
+                            test_mode=config['test_mode'], checkpoint=checkpoint,
+                            control=SharedControl(cancelled, running), retry_policy=config['retry_policy'])
+        engine.run(shard_rows(rows), stats, config['resume_path'])
+        flush()
+        publish(None, stats, None)
+        results.put(('done', shard, {
+            'failed_emails': stats['failed_emails'],
+            'failure_reasons': stats['failure_reasons'],
+            'timing': engine.timing.export(),
+            'metrics': REGISTRY.export(),
+            'throttled': limiter.throttled,
+        }))
+        if not config['test_mode']:
+            automation.pool.close_idle()
+    except Exception as e:
+        flush()
+        results.put(('error', shard, str(e)))
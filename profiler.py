@@ -0,0 +1,187 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+
+# Seconds between stack samples while a campaign is profiled
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+# Folded stacks and summaries of profiled campaigns are written here
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+# Functions listed in a summary
+PROFILE_TOP = 30
+# Deeper stacks are cut at the root end; the frames nearest the sample are kept
+MAX_STACK_DEPTH = 64
+
+PROFILE_KINDS = {'folded': '.folded', 'summary': '.txt'}
+
+
+def thread_group(name):
+    """Thread name without its number, so every send worker adds up under one name"""
+    return re.sub(r'[-_]\d+$', '', name)
+
+
+class SamplingProfiler:
+    """Statistical profiler for the threads of one campaign
+
+    A daemon thread reads sys._current_frames() every interval and counts
+    the stacks of the threads in thread_ids (a live set the engines add
+    their threads to). Nothing is installed on the profiled threads, so a
+    campaign pays nothing until profiling starts, and only the sampler's
+    share of the GIL while it runs.
+    """
+
+    def __init__(self, thread_ids, interval=PROFILE_INTERVAL):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self._labels = {}
+        self._names = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name='campaign-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped_at = time.time()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            sampled = []
+            for ident in list(self.thread_ids):
+                frame = frames.get(ident)
+                if frame is not None:
+                    sampled.append((self._thread_name(ident), self._stack(frame)))
+            del frames
+            with self._lock:
+                for key in sampled:
+                    self.stacks[key] += 1
+                self.samples += 1
+
+    def _thread_name(self, ident):
+        name = self._names.get(ident)
+        if name is None:
+            self._names = {thread.ident: thread_group(thread.name) for thread in threading.enumerate()}
+            name = self._names.get(ident, 'thread')
+        return name
+
+    def _stack(self, frame):
+        """Function labels from the root of the stack to the frame being run"""
+        labels = self._labels
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def folded(self):
+        """Stacks in the folded format read by flamegraph.pl and speedscope: 'thread;f;g count'"""
+        with self._lock:
+            stacks = sorted(self.stacks.items(), key=lambda item: -item[1])
+        return ''.join(f"{';'.join((thread,) + stack)} {count}\n" for (thread, stack), count in stacks)
+
+    def top_functions(self, limit=PROFILE_TOP):
+        """(function, own samples, total samples) for the functions seen most often on top of a stack"""
+        own = Counter()
+        total = Counter()
+        with self._lock:
+            stacks = list(self.stacks.items())
+        for (thread, stack), count in stacks:
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+        return [(label, count, total[label]) for label, count in own.most_common(limit)]
+
+    def summary(self, title):
+        """Plain-text report: sampled threads, then the top functions by own time"""
+        with self._lock:
+            samples = self.samples
+            threads = Counter()
+            for (thread, _), count in self.stacks.items():
+                threads[thread] += count
+        seen = sum(threads.values()) or 1
+        elapsed = (self.stopped_at or time.time()) - (self.started_at or time.time())
+
+        lines = [f"{title}: {samples} samples every {self.interval * 1000:.0f} ms over {elapsed:.1f}s", '',
+                 'Samples by thread:']
+        lines.extend(f"  {count / seen:6.1%}  {thread}" for thread, count in threads.most_common())
+        lines.extend(['', 'Top functions (own = running it, total = it or anything it called):',
+                      '    own   total  function'])
+        lines.extend(f"  {count / seen:6.1%}  {total / seen:6.1%}  {label}"
+                     for label, count, total in self.top_functions())
+        lines.append('')
+        lines.append('Threads blocked in wait/get/acquire are idle: waiting on a queue, a lock or the network.')
+        return '\n'.join(lines) + '\n'
+
+
+class CampaignProfiles:
+    """Profilers of running campaigns, and the files they leave behind"""
+
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self._profilers = {}
+        self._lock = threading.Lock()
+
+    def start(self, campaign_id, thread_ids):
+        """Start sampling campaign_id's threads; returns False if it is already being profiled"""
+        with self._lock:
+            profiler = self._profilers.get(campaign_id)
+            if profiler is not None and profiler.running:
+                return False
+            profiler = self._profilers[campaign_id] = SamplingProfiler(thread_ids)
+        profiler.start()
+        return True
+
+    def stop(self, campaign_id):
+        """Stop sampling and write the profile files; returns the profiler, or None if it was not running"""
+        with self._lock:
+            profiler = self._profilers.get(campaign_id)
+        if profiler is None or not profiler.running:
+            return None
+        profiler.stop()
+        self.write(campaign_id)
+        return profiler
+
+    def running(self, campaign_id):
+        with self._lock:
+            profiler = self._profilers.get(campaign_id)
+        return profiler is not None and profiler.running
+
+    def write(self, campaign_id):
+        """Write the folded stacks and summary collected so far (also mid-campaign)"""
+        with self._lock:
+            profiler = self._profilers.get(campaign_id)
+        if profiler is None:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(campaign_id, 'folded'), 'w') as f:
+            f.write(profiler.folded())
+        with open(self.path(campaign_id, 'summary'), 'w') as f:
+            f.write(profiler.summary(f"Campaign {campaign_id}"))
+        return True
+
+    def path(self, campaign_id, kind):
+        # Campaign ids come from the URL; keep them inside the profile directory
+        return os.path.join(self.directory, os.path.basename(campaign_id) + PROFILE_KINDS[kind])
@@ -0,0 +1,269 @@
+import threading
+import time
+from collections import deque
+
+from metrics import RATE_LIMIT_WAIT, STAGE_SECONDS, THROTTLED
+
+
+# Provider replies that mean "slow down" rather than "this message is bad"
+THROTTLE_CODES = (421, 451)
+
+# Waits this long or longer are logged; they almost always mean a sender quota is used up
+LONG_WAIT_SECONDS = 60
+
+
+def reply_code(exc):
+    """Best-effort SMTP reply code from an smtplib or aiosmtplib exception"""
+    code = getattr(exc, 'smtp_code', None) or getattr(exc, 'code', None)
+    if isinstance(code, int):
+        return code
+
+    # Recipient refusals carry one code per address
+    recipients = getattr(exc, 'recipients', None)
+    if isinstance(recipients, dict):
+        for value in recipients.values():
+            return value[0]
+    elif recipients:
+        return getattr(recipients[0], 'code', None)
+    return None
+
+
+def recipient_domain(email):
+    """Lower-cased domain part of an email address"""
+    return str(email).rpartition('@')[2].strip().lower()
+
+
+class TokenBucket:
+    """Token bucket kept in GCRA form: tracks when the next token is due
+
+    rate is tokens per second (None means unlimited) and burst is how many
+    tokens may be spent back to back. The rate drops when the provider
+    throttles us and creeps back up as sends succeed.
+    """
+
+    def __init__(self, rate=None, burst=1):
+        self.configured_rate = rate
+        self.rate = rate
+        self.burst = max(1, int(burst))
+        self.theoretical_arrival = 0.0
+        self.blocked_until = 0.0
+        self.throttle_streak = 0
+        self.throttled_at = None
+        # Rate in effect before the current throttling began, which recovery climbs back to
+        self.recovery_target = None
+        self._last_reserved = None
+        self._avg_interval = None
+
+    def earliest(self, now):
+        """Earliest time at which a token could be taken"""
+        t = max(now, self.blocked_until)
+        if self.rate:
+            interval = 1.0 / self.rate
+            t = max(t, self.theoretical_arrival - (self.burst - 1) * interval)
+        return t
+
+    def commit(self, t):
+        """Take a token at time t (as returned by earliest)"""
+        if self.rate:
+            self.theoretical_arrival = max(self.theoretical_arrival, t) + 1.0 / self.rate
+        if self._last_reserved is not None:
+            gap = max(t - self._last_reserved, 1e-6)
+            self._avg_interval = gap if self._avg_interval is None else 0.8 * self._avg_interval + 0.2 * gap
+        self._last_reserved = t
+
+    def slow_down(self, now, min_rate, max_cooldown, sent_at=None):
+        """Halve the rate and pause briefly after a throttling reply
+
+        Sessions in flight when the provider starts throttling all get the
+        reply. A send that started before the last slow-down belongs to that
+        same event and is ignored, or N sessions would cut the rate 2^N times.
+        """
+        if sent_at is not None and self.throttled_at is not None and sent_at < self.throttled_at:
+            return
+        self.throttled_at = now
+        observed = 1.0 / self._avg_interval if self._avg_interval else None
+        if self.recovery_target is None:
+            self.recovery_target = self.rate or observed
+        base = self.rate or observed or 1.0
+        self.rate = max(min_rate, base * 0.5)
+        self.throttle_streak += 1
+        self.blocked_until = max(self.blocked_until, now + min(max_cooldown, 2 ** self.throttle_streak))
+
+    def speed_up(self, max_rate):
+        """Additively recover towards the rate before the throttling after a success
+
+        An unconfigured bucket climbs back to the pace it was observed sending
+        at (max_rate if it had none) and only then becomes unlimited again.
+        """
+        self.throttle_streak = 0
+        if self.rate is None or self.rate == self.configured_rate:
+            return
+        target = self.recovery_target or self.configured_rate or max_rate
+        self.rate = min(target, self.rate + target * 0.05)
+        if self.rate >= target:
+            self.recovery_target = None
+            if self.configured_rate is None:
+                self.rate = None
+
+
+class SenderQuota:
+    """Hourly and daily send caps for one sender account, over sliding windows
+
+    Shared by every campaign of that sender. claim() is atomic, so
+    campaigns reserving slots concurrently never overshoot the caps.
+    """
+
+    WINDOWS = (('hourly', 3600), ('daily', 86400))
+
+    def __init__(self, hourly=None, daily=None):
+        self.limits = [(seconds, limit) for (name, seconds), limit in zip(self.WINDOWS, (hourly, daily)) if limit]
+        self._sends = deque()
+        self._lock = threading.Lock()
+
+    def claim(self, t):
+        """Reserve a send at or after monotonic time t and return when it may go"""
+        with self._lock:
+            # Prune against the requested time, not a later slot: a slot given back
+            # with release() must not leave the window short of sends
+            horizon = max((seconds for seconds, _ in self.limits), default=0)
+            while self._sends and self._sends[0] <= t - horizon:
+                self._sends.popleft()
+            if self._sends:
+                t = max(t, self._sends[-1])
+            for seconds, limit in self.limits:
+                # The limit-th most recent send decides when a slot in this window frees up
+                if len(self._sends) >= limit and self._sends[-limit] > t - seconds:
+                    t = self._sends[-limit] + seconds
+            if self.limits:
+                self._sends.append(t)
+            return t
+
+    def seed(self, times):
+        """Count sends made before this process started, given as monotonic times"""
+        if not self.limits:
+            return
+        with self._lock:
+            self._sends = deque(sorted([*self._sends, *times]))
+
+    def release(self, t):
+        """Give back a slot claimed for time t whose send never happened"""
+        with self._lock:
+            # Claims are appended in time order, and a given-back one is usually among the latest
+            for i in range(len(self._sends) - 1, -1, -1):
+                if self._sends[i] == t:
+                    del self._sends[i]
+                    return
+
+    def usage(self):
+        """Sends counted in each window right now"""
+        now = time.monotonic()
+        with self._lock:
+            return {name: sum(1 for sent in self._sends if now - seconds < sent <= now)
+                    for name, seconds in self.WINDOWS}
+
+
+class SenderQuotas:
+    """One SenderQuota per sender address, created on first use"""
+
+    def __init__(self, hourly=None, daily=None):
+        self.hourly = hourly
+        self.daily = daily
+        self._quotas = {}
+        self._lock = threading.Lock()
+
+    def get(self, sender):
+        key = str(sender).strip().lower()
+        with self._lock:
+            quota = self._quotas.get(key)
+            if quota is None:
+                quota = self._quotas[key] = SenderQuota(self.hourly, self.daily)
+            return quota
+
+    def seed(self, sent):
+        """Count earlier sends against each sender's caps, from (sender, time.time()) pairs
+
+        Usage would otherwise start from zero on every restart, while the
+        campaigns themselves resume from the send queue.
+        """
+        by_sender = {}
+        # Wall-clock send times, shifted onto the monotonic clock the quotas run on
+        offset = time.monotonic() - time.time()
+        for sender, sent_at in sent:
+            by_sender.setdefault(sender, []).append(sent_at + offset)
+        for sender, times in by_sender.items():
+            self.get(sender).seed(times)
+
+    def usage(self):
+        with self._lock:
+            quotas = dict(self._quotas)
+        return {sender: quota.usage() for sender, quota in quotas.items()}
+
+
+class RateLimiter:
+    """Global plus per-recipient-domain token buckets with adaptive throttling
+
+    An optional SenderQuota caps sends per hour/day across campaigns.
+
+    Thread-safe. reserve() never sleeps: the engines wait for the slot with
+    their campaign control, so a cancel cuts the wait short, and then
+    release() the slot's quota claim.
+    """
+
+    def __init__(self, rate=None, burst=1, domain_rate=None, domain_burst=1,
+                 min_rate=0.1, max_cooldown=60, recovery_rate=50, quota=None):
+        self.global_bucket = TokenBucket(rate, burst)
+        self.quota = quota
+        self.domain_rate = domain_rate
+        self.domain_burst = domain_burst
+        self.min_rate = min_rate
+        self.max_cooldown = max_cooldown
+        self.recovery_rate = recovery_rate
+        self.domains = {}
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _domain_bucket(self, domain):
+        bucket = self.domains.get(domain)
+        if bucket is None:
+            bucket = self.domains[domain] = TokenBucket(self.domain_rate, self.domain_burst)
+        return bucket
+
+    def reserve(self, domain=''):
+        """Claim a send slot for a recipient domain and return the monotonic time it may go"""
+        with self._lock:
+            now = time.monotonic()
+            domain_bucket = self._domain_bucket(domain)
+            t = max(self.global_bucket.earliest(now), domain_bucket.earliest(now))
+            if self.quota is not None:
+                t = self.quota.claim(t)
+            self.global_bucket.commit(t)
+            domain_bucket.commit(t)
+        STAGE_SECONDS.observe(t - now, RATE_LIMIT_WAIT)
+        return t
+
+    def release(self, slot):
+        """Give back the sender quota of a reserved slot that was not used (the send was cancelled)"""
+        if self.quota is not None:
+            self.quota.release(slot)
+
+    def record_success(self, domain=''):
+        with self._lock:
+            self.global_bucket.speed_up(self.recovery_rate)
+            self._domain_bucket(domain).speed_up(self.recovery_rate)
+
+    def record_failure(self, domain, exc, sent_at=None):
+        """Slow down if the failure was a provider throttling reply; returns True if so
+
+        sent_at is the monotonic time the failed send started, so replies from
+        one throttling event slow things down only once.
+        """
+        if reply_code(exc) not in THROTTLE_CODES:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+            THROTTLED.inc()
+            self._domain_bucket(domain).slow_down(now, self.min_rate, self.max_cooldown, sent_at)
+            # A 421 usually means the whole account is over its limit, not just one domain
+            self.global_bucket.slow_down(now, self.min_rate, self.max_cooldown, sent_at)
+        return True
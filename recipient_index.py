@@ -0,0 +1,103 @@
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from send_queue import REJECTED, SENT
+
+
+# Why an address is on the suppression list
+CONTACTED = 'contacted'
+BOUNCED = 'bounced'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS suppressions (
+    hash INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    campaign_id TEXT,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def normalize_emails(emails):
+    """Lower-cased addresses without surrounding whitespace or a +tag in the local part"""
+    emails = emails.fillna('').astype(str).str.strip().str.lower()
+    return emails.str.replace(r'\+[^@]*(?=@)', '', regex=True)
+
+
+def email_hashes(emails):
+    """Stable 64-bit hashes of the normalized addresses, one per row"""
+    normalized = normalize_emails(emails)
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy().view(np.int64)
+
+
+# Blank addresses are never put on the list
+EMPTY_HASH = email_hashes(pd.Series([''], dtype=object))[0]
+
+
+class RecipientIndex:
+    """Persistent suppression list of hashed, normalized addresses (SQLite, WAL mode)
+
+    Addresses that hard-bounced, and optionally every address a real campaign
+    already reached, are recorded here and skipped by later campaigns.
+    Thread-safe.
+    """
+
+    def __init__(self, db_path='campaigns.db', suppress_contacted=True):
+        self.db_path = db_path
+        self.suppress_contacted = suppress_contacted
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        # Bumped on every change, so callers can cache results that depend on the list
+        self.version = 0
+
+    def add(self, emails, reason, campaign_id=None):
+        """Suppress addresses; ones already listed keep their original reason"""
+        emails = pd.Series(list(emails), dtype=object)
+        if emails.empty:
+            return
+        now = time.time()
+        records = [(int(h), email, reason, campaign_id, now)
+                   for h, email in zip(email_hashes(emails), normalize_emails(emails)) if h != EMPTY_HASH]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO suppressions (hash, email, reason, campaign_id, created_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                records,
+            )
+            self.version += 1
+
+    def record_campaign(self, send_queue, campaign_id):
+        """Suppress what a finished (or stopped) campaign sent to and what bounced"""
+        # Only rows the engines recorded as REJECTED: the server refused the address itself
+        self.add([email for email, _ in send_queue.results(campaign_id, REJECTED)], BOUNCED, campaign_id)
+        if self.suppress_contacted:
+            self.add([email for email, _ in send_queue.results(campaign_id, SENT)], CONTACTED, campaign_id)
+
+    def suppressed_hashes(self, exclude_campaign=None):
+        """Hashes that should not be emailed, leaving out entries added by exclude_campaign"""
+        query = 'SELECT hash FROM suppressions WHERE (campaign_id IS NULL OR campaign_id != ?)'
+        params = [exclude_campaign or '']
+        if not self.suppress_contacted:
+            query += ' AND reason != ?'
+            params.append(CONTACTED)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return pd.Index(np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)))
+
+    def counts(self):
+        """Number of suppressed addresses per reason"""
+        with self._lock:
+            return dict(self._conn.execute('SELECT reason, COUNT(*) FROM suppressions GROUP BY reason').fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
@@ -0,0 +1,145 @@
+import heapq
+import itertools
+import random
+import re
+import smtplib
+import threading
+import time
+
+from rate_limiter import reply_code
+
+
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+# Enhanced status codes 5.1.x (RFC 3463) say the recipient address itself is bad
+RECIPIENT_STATUS = re.compile(r'^\s*5\.1\.\d+')
+
+
+def classify(exc):
+    """Sort a send failure into (TRANSIENT or PERMANENT, reason code)
+
+    The reason is the SMTP reply code when there is one ('421', '550', ...),
+    otherwise a short name for what went wrong. Transient failures are worth
+    retrying later; permanent ones will fail the same way every time.
+    """
+    if isinstance(exc, smtplib.SMTPAuthenticationError):
+        return PERMANENT, 'auth'
+
+    code = reply_code(exc)
+    if code is not None:
+        if 400 <= code < 500:
+            return TRANSIENT, str(code)
+        if 500 <= code < 600:
+            return PERMANENT, str(code)
+
+    # aiosmtplib's disconnect/timeout/connect errors subclass these builtins too
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return TRANSIENT, 'disconnected'
+    if isinstance(exc, TimeoutError):
+        return TRANSIENT, 'timeout'
+    if isinstance(exc, ConnectionError):
+        return TRANSIENT, 'disconnected'
+    if isinstance(exc, smtplib.SMTPConnectError):
+        return TRANSIENT, 'connection'
+    # SMTPException subclasses OSError, so it has to be sorted out before the socket errors
+    if isinstance(exc, smtplib.SMTPException):
+        return PERMANENT, 'smtp'
+    if isinstance(exc, OSError):
+        return TRANSIENT, 'connection'
+    return PERMANENT, 'error'
+
+
+def reply_text(exc):
+    """Server reply text of an smtplib or aiosmtplib exception, or ''"""
+    text = getattr(exc, 'smtp_error', None) or getattr(exc, 'message', None)
+    recipients = getattr(exc, 'recipients', None)
+    if text is None and isinstance(recipients, dict):
+        text = next(iter(recipients.values()), (None, ''))[1]
+    elif text is None and recipients:
+        text = getattr(recipients[0], 'message', '')
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', 'replace')
+    return text if isinstance(text, str) else ''
+
+
+def is_bounce(exc):
+    """Whether a failure permanently rejects the recipient address
+
+    Only a refused RCPT or a 5.1.x enhanced status counts. Other 5xx replies
+    (a refused sender, a daily quota, a message blocked as spam) say nothing
+    about the address and must not get it suppressed.
+    """
+    code = reply_code(exc)
+    if code is None or not 500 <= code < 600:
+        return False
+    if hasattr(exc, 'recipients') or hasattr(exc, 'recipient'):
+        return True
+    return bool(RECIPIENT_STATUS.match(reply_text(exc)))
+
+
+def breaks_session(reason):
+    """Whether a failure with this reason leaves the SMTP session unusable"""
+    return reason in ('disconnected', 'timeout', 'connection')
+
+
+class RetryPolicy:
+    """How many times to try one recipient and how long to back off in between
+
+    The wait before attempt n+1 is base_delay * 2**(n-1), capped at max_delay,
+    with "equal jitter": half of it fixed and half random, so retries from a
+    burst of failures spread out instead of hitting the server together.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=30, max_delay=900):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, kind, attempt):
+        return kind == TRANSIENT and attempt < self.max_attempts
+
+    def delay(self, attempt):
+        """Seconds to wait after failed attempt number `attempt` (1-based)"""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class DelayQueue:
+    """Thread-safe queue whose items only come out once their delay has passed"""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def put(self, item, delay):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), item))
+            self._cond.notify()
+
+    def pop_due(self, timeout=0):
+        """Next item whose delay has passed, waiting up to timeout seconds; None if there is none"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    return heapq.heappop(self._heap)[2]
+                if now >= deadline:
+                    return None
+                wait = deadline - now
+                if self._heap:
+                    wait = min(wait, self._heap[0][0] - now)
+                self._cond.wait(wait)
+
+    def drain(self):
+        """Remove and return every item, due or not"""
+        with self._cond:
+            items = [entry[2] for entry in sorted(self._heap)]
+            self._heap.clear()
+            return items
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap)
@@ -0,0 +1,63 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class CampaignScheduler:
+    """Run campaigns concurrently on a bounded pool of threads
+
+    At most max_concurrent campaigns send at once; later submissions wait
+    their turn in FIFO order instead of being rejected. The threads are
+    daemons (ThreadPoolExecutor's are joined at exit), so stopping the app
+    never waits for a campaign to finish; its checkpoint lets it resume.
+    """
+
+    def __init__(self, max_concurrent=2):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._queue = queue.SimpleQueue()
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run, name=f'campaign_{n}', daemon=True)
+                         for n in range(self.max_concurrent)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, campaign_id, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) as campaign_id; raises ValueError if it is already active"""
+        with self._lock:
+            if self._is_active_locked(campaign_id):
+                raise ValueError(f"Campaign {campaign_id} is already queued or running")
+            future = Future()
+            self._futures[campaign_id] = future
+            self._queue.put((future, fn, args, kwargs))
+        future.add_done_callback(lambda _: self._forget(campaign_id, future))
+        return future
+
+    def is_active(self, campaign_id):
+        with self._lock:
+            return self._is_active_locked(campaign_id)
+
+    def active_count(self):
+        with self._lock:
+            return len(self._futures)
+
+    def _run(self):
+        while True:
+            future, fn, args, kwargs = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def _is_active_locked(self, campaign_id):
+        future = self._futures.get(campaign_id)
+        return future is not None and not future.done()
+
+    def _forget(self, campaign_id, future):
+        with self._lock:
+            if self._futures.get(campaign_id) is future:
+                del self._futures[campaign_id]
@@ -0,0 +1,424 @@
+import os
+import queue
+import threading
+import time
+
+from campaign_state import CampaignControl
+from metrics import MESSAGES, RETRIES, Histogram
+from rate_limiter import LONG_WAIT_SECONDS, RateLimiter, recipient_domain
+from retry import DelayQueue, RetryPolicy, breaks_session, classify, is_bounce
+from send_queue import FAILED, REJECTED, RETRYING, SENT
+
+
+# How long a worker waits for a dedicated session before borrowing one per message;
+# campaigns of the same sender share one pool, so it may be fully checked out
+SESSION_ACQUIRE_TIMEOUT = 5
+
+# How often the feeder checks for due retries once every fresh row is handed out
+RETRY_POLL_INTERVAL = 0.1
+
+# How long a put on a full stage queue waits before checking that the stage's threads are still alive
+QUEUE_PUT_TIMEOUT = 0.5
+
+# Threads turning rows into ready-to-send bytes ahead of the send workers
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', 1))
+
+
+class StageTimer:
+    """Busy and waiting time per pipeline stage, to show which stage is the bottleneck
+
+    A render stage that spends its time waiting on a full queue means the
+    senders are the bottleneck; senders waiting on an empty one mean rendering is.
+    Busy times also go into a histogram for p50/p99, and each stage's threads
+    report the CPU time they used when they exit.
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, stage):
+        totals = self._stages.get(stage)
+        if totals is None:
+            # items, busy seconds, waiting seconds, CPU seconds, busy-time histogram
+            totals = self._stages[stage] = [0, 0.0, 0.0, 0.0, Histogram()]
+        return totals
+
+    def add(self, stage, busy, waited=0.0):
+        with self._lock:
+            totals = self._stage(stage)
+            totals[0] += 1
+            totals[1] += busy
+            totals[2] += waited
+            totals[4].observe(busy)
+
+    def add_cpu(self, stage, seconds):
+        with self._lock:
+            self._stage(stage)[3] += seconds
+
+    def export(self):
+        """Plain, picklable totals that merge() can add into another timer"""
+        with self._lock:
+            return {stage: (items, busy, waited, cpu, list(histogram.counts), histogram.sum)
+                    for stage, (items, busy, waited, cpu, histogram) in self._stages.items()}
+
+    def merge(self, exported):
+        with self._lock:
+            for stage, (items, busy, waited, cpu, counts, total) in exported.items():
+                totals = self._stage(stage)
+                totals[0] += items
+                totals[1] += busy
+                totals[2] += waited
+                totals[3] += cpu
+                totals[4].merge(counts, total)
+
+    def summary(self):
+        with self._lock:
+            return {
+                stage: {
+                    'items': items,
+                    'busy_seconds': round(busy, 3),
+                    'wait_seconds': round(waited, 3),
+                    'cpu_seconds': round(cpu, 3),
+                    'ms_per_item': round(busy * 1000 / items, 3) if items else 0.0,
+                    'p50_ms': round(histogram.quantile(0.5) * 1000, 3),
+                    'p99_ms': round(histogram.quantile(0.99) * 1000, 3),
+                }
+                for stage, (items, busy, waited, cpu, histogram) in self._stages.items()
+            }
+
+    def log(self, logger):
+        for stage, totals in self.summary().items():
+            if not totals['items']:
+                # A stage that only reports CPU, like the thread feeding the pipeline
+                logger.info(f"Stage {stage}: {totals['cpu_seconds']}s CPU")
+                continue
+            logger.info(f"Stage {stage}: {totals['items']} items, {totals['ms_per_item']} ms each "
+                        f"(p99 {totals['p99_ms']} ms), {totals['wait_seconds']}s waiting, "
+                        f"{totals['cpu_seconds']}s CPU")
+
+
+class SendEngine:
+    """Fan contact rows out to N worker threads, each on its own SMTP session
+
+    Work runs as a pipeline: render threads build each message and serialize
+    it to bytes into a bounded queue while the send workers only push bytes
+    with sendmail, so CPU and network work overlap and a slow stage applies
+    back-pressure to the one before it. Rows that fail transiently go onto a
+    delay queue and the feeder hands them back to the send workers once their
+    backoff has passed, so no worker ever sleeps through a retry.
+    """
+
+    def __init__(self, automation, workers=1, rate_limiter=None, delay_seconds=0,
+                 progress_callback=None, test_mode=True, checkpoint=None, control=None,
+                 retry_policy=None, render_workers=RENDER_WORKERS):
+        self.automation = automation
+        self.workers = max(1, int(workers))
+        self.render_workers = max(1, int(render_workers))
+        self.limiter = rate_limiter or RateLimiter()
+        self.delay_seconds = delay_seconds
+        self.progress_callback = progress_callback
+        self.test_mode = test_mode
+        self.checkpoint = checkpoint
+        self.control = control or CampaignControl()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.logger = automation.logger
+
+        # Prepared rows waiting to be rendered
+        self._rows = queue.Queue(maxsize=self.workers * 4)
+        # Rendered (row, attempt, payload) items waiting to be sent; attempt counts from 1
+        self._ready = queue.Queue(maxsize=self.workers * 4)
+        self._retries = DelayQueue()
+        self.timing = StageTimer()
+        self._lock = threading.Lock()
+        self._processed = 0
+        # Rows handed out that have neither been recorded as sent/failed nor abandoned
+        self._outstanding = 0
+
+    def run(self, rows, stats, resume_path=None):
+        """Send every prepared (index, *contacts.ROW_COLUMNS) row and fill in stats"""
+        self._stats = stats
+        self._resume_path = resume_path
+        # A resumed campaign starts from the results already checkpointed
+        self._processed = stats['sent_successfully'] + stats['failed_to_send']
+
+        renderers = self._renderers = [
+            threading.Thread(target=self._renderer, name=f"render-worker-{n}", daemon=True)
+            for n in range(self.render_workers)
+        ]
+        senders = self._senders = [
+            threading.Thread(target=self._worker, name=f"send-worker-{n}", daemon=True)
+            for n in range(self.workers)
+        ]
+        for thread in renderers + senders:
+            thread.start()
+
+        # This thread parses and prepares the rows as it feeds them
+        cpu_started = time.thread_time()
+        try:
+            for row in rows:
+                if self.control.cancelled:
+                    break
+                self._feed_retries()
+                with self._lock:
+                    self._outstanding += 1
+                if not self._put(self._rows, row, renderers):
+                    raise RuntimeError("Every render worker has stopped")
+            # Fresh rows are exhausted; keep feeding retries until every row has a final result
+            while not self.control.cancelled and self._has_outstanding():
+                if not any(thread.is_alive() for thread in senders):
+                    raise RuntimeError("Every send worker has stopped")
+                item = self._retries.pop_due(timeout=RETRY_POLL_INTERVAL)
+                if item is not None and not self._put(self._ready, item, senders):
+                    raise RuntimeError("Every send worker has stopped")
+        finally:
+            # Stop the renderers first so everything they rendered still reaches a sender
+            self.timing.add_cpu('prepare', time.thread_time() - cpu_started)
+            for _ in renderers:
+                self._put(self._rows, None, renderers)
+            for thread in renderers:
+                thread.join()
+            for _ in senders:
+                self._put(self._ready, None, senders)
+            for thread in senders:
+                thread.join()
+
+        pending_retries = len(self._retries.drain())
+        if pending_retries:
+            # Their checkpoint state is still 'retrying', so a resume picks them up
+            self.logger.info(f"{pending_retries} retries left unsent")
+        stats['pipeline'] = self.timing.summary()
+        self.timing.log(self.logger)
+        return stats
+
+    def _feed_retries(self):
+        """Hand every retry whose backoff has passed to the send workers, between fresh rows"""
+        while True:
+            item = self._retries.pop_due()
+            if item is None:
+                return
+            # Retries keep their rendered payload and skip the render stage
+            if not self._put(self._ready, item, self._senders):
+                raise RuntimeError("Every send worker has stopped")
+
+    def _put(self, target, item, consumers):
+        """Put on a bounded stage queue; False if every thread that reads it has exited"""
+        while True:
+            try:
+                target.put(item, timeout=QUEUE_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                if not any(thread.is_alive() for thread in consumers):
+                    return False
+
+    def _has_outstanding(self):
+        with self._lock:
+            return self._outstanding > 0
+
+    def _renderer(self):
+        cpu_started = time.thread_time()
+        self.control.join_thread()
+        try:
+            self._render_rows()
+        finally:
+            self.control.leave_thread()
+            self.timing.add_cpu('render', time.thread_time() - cpu_started)
+
+    def _render_rows(self):
+        while True:
+            row = self._rows.get()
+            if row is None:
+                break
+            if self.control.cancelled:
+                self._abandon()
+                continue
+            try:
+                self._render_row(row)
+            except Exception as e:
+                # Anything unexpected fails this row only, so the feeder still sees it finish
+                self._fail(row, e)
+
+    def _render_row(self, row):
+        automation = self.automation
+        started = time.perf_counter()
+        try:
+            payload = automation.render_payload(row, self._resume_path)
+        except Exception as e:
+            automation.logger.error(f"Failed to render email to {row[3]}: {str(e)}")
+            self._record(row[0], row[3], FAILED, f"render: {str(e)}", 'render')
+            return
+        rendered = time.perf_counter()
+        # Waits while the senders are behind; that wait is the back-pressure
+        if not self._put(self._ready, (row, 1, payload), self._senders):
+            self._abandon()
+            return
+        self.timing.add('render', rendered - started, time.perf_counter() - rendered)
+
+    def _acquire_session(self):
+        """Dedicated pooled session for one worker, or None to borrow one per message"""
+        if self.test_mode:
+            return None
+        try:
+            return self.automation.pool.acquire(timeout=SESSION_ACQUIRE_TIMEOUT)
+        except TimeoutError:
+            self.logger.info("All pooled SMTP sessions are busy; sharing them per message")
+        except Exception as e:
+            self.logger.error(f"Worker failed to connect to SMTP server: {str(e)}")
+        return None
+
+    def _worker(self):
+        cpu_started = time.thread_time()
+        self.control.join_thread()
+        try:
+            self._send_rows()
+        finally:
+            self.control.leave_thread()
+            self.timing.add_cpu('send', time.thread_time() - cpu_started)
+
+    def _send_rows(self):
+        automation = self.automation
+        control = self.control
+        # Each worker keeps one pooled session for its whole lifetime; if the
+        # pool cannot hand one out, deliver_payload falls back to borrowing per message
+        connection = self._acquire_session()
+        reacquire = False
+
+        next_send = 0.0
+        try:
+            while True:
+                waiting = time.perf_counter()
+                item = self._ready.get()
+                if item is None:
+                    break
+                starved = time.perf_counter() - waiting
+                row, attempt, payload = item
+
+                if control.paused and connection is not None:
+                    # Hang up rather than pool the session, so a pause doesn't hold the provider's connection slot
+                    automation.pool.release(connection, discard=True)
+                    connection = None
+                    reacquire = True
+                if not control.wait_while_paused():
+                    # Cancelled: hang up now, then drain rows until the sentinel
+                    if connection is not None:
+                        automation.pool.release(connection, discard=True)
+                        connection = None
+                    self._abandon()
+                    continue
+                if reacquire:
+                    connection = self._acquire_session()
+                    reacquire = False
+
+                if not self.test_mode:
+                    # delay_seconds is a floor on the gap between sends on this session,
+                    # so time already spent waiting for a rendered message counts towards it
+                    if not control.sleep(next_send - time.monotonic()):
+                        self._abandon()
+                        continue
+                try:
+                    self._send_row(row, attempt, payload, connection, starved)
+                except Exception as e:
+                    # Anything unexpected fails this row only, so the feeder still sees it finish
+                    self._fail(row, e)
+                next_send = time.monotonic() + self.delay_seconds
+        finally:
+            if connection is not None:
+                automation.pool.release(connection)
+
+    def _send_row(self, row, attempt, payload, connection, starved=0.0):
+        automation = self.automation
+        index, company_name, role, recruiter_email = row[:4]
+
+        if self.test_mode:
+            # Lazy %-style arguments: sampled-out lines are never formatted, kept ones are formatted off this thread
+            automation.recipient_logger.info("TEST MODE - Would send to %s (%s - %s); subject: %s",
+                                             recruiter_email, company_name, role, row[6])
+            self.timing.add('send', 0.0, starved)
+            self._record(index, recruiter_email, SENT)
+            return
+
+        domain = recipient_domain(recruiter_email)
+        slot = self.limiter.reserve(domain)
+        delay = slot - time.monotonic()
+        if delay > 0:
+            if delay >= LONG_WAIT_SECONDS:
+                automation.logger.warning(f"Send limit reached; next email in {delay / 60:.0f} minute(s)")
+            if not self.control.sleep(delay):
+                # Cancelled while waiting; the row stays unsent in the checkpoint and its quota is given back
+                self.limiter.release(slot)
+                self._abandon()
+                return
+        started = time.perf_counter()
+        sent_at = time.monotonic()
+        try:
+            automation.deliver_payload(recruiter_email, payload, connection=connection)
+            self.limiter.record_success(domain)
+            automation.recipient_logger.info("Email sent successfully to %s", recruiter_email)
+        except Exception as e:
+            self.timing.add('send', time.perf_counter() - started, starved)
+            if self.limiter.record_failure(domain, e, sent_at):
+                automation.logger.warning(f"Provider throttled sends to {domain}; slowing down")
+            kind, reason = classify(e)
+            if breaks_session(reason) and connection is not None:
+                # Drop the dead socket; the next send on this session reconnects
+                connection.close()
+            error = f"{reason}: {str(e)}"
+            if self.retry_policy.should_retry(kind, attempt):
+                delay = self.retry_policy.delay(attempt)
+                automation.logger.warning(f"Temporary failure sending to {recruiter_email} ({error}); "
+                                          f"retry {attempt + 1}/{self.retry_policy.max_attempts} in {delay:.0f}s")
+                self._schedule_retry(row, attempt, payload, recruiter_email, error, delay)
+            else:
+                automation.logger.error(f"Failed to send email to {recruiter_email} after {attempt} attempt(s): {error}")
+                self._record(index, recruiter_email, REJECTED if is_bounce(e) else FAILED, error, reason)
+            return
+
+        self.timing.add('send', time.perf_counter() - started, starved)
+        self._record(index, recruiter_email, SENT)
+
+    def _schedule_retry(self, row, attempt, payload, recruiter_email, error, delay):
+        RETRIES.inc()
+        with self._lock:
+            self._stats['retried'] += 1
+            if self.checkpoint is not None:
+                self.checkpoint(row[0], recruiter_email, RETRYING, error)
+        self._retries.put((row, attempt + 1, payload), delay)
+
+    def _fail(self, row, exc):
+        """Record a row as failed after an unexpected error in a pipeline stage"""
+        self.logger.exception(f"Unexpected error handling {row[3]}: {str(exc)}")
+        self._record(row[0], row[3], FAILED, f"error: {str(exc)}", 'error')
+
+    def _abandon(self):
+        """A row skipped because of a cancel; it stays unfinished in the checkpoint"""
+        with self._lock:
+            self._outstanding -= 1
+
+    def _record(self, index, recruiter_email, state, error=None, reason=None):
+        """Merge one final result into the shared stats and report progress"""
+        stats = self._stats
+        if not self.test_mode:
+            MESSAGES.inc(labels=(state,))
+        with self._lock:
+            self._processed += 1
+            self._outstanding -= 1
+            if state == SENT:
+                stats['sent_successfully'] += 1
+            else:
+                stats['failed_to_send'] += 1
+                stats['failed_emails'].append(recruiter_email)
+                reasons = stats['failure_reasons']
+                reasons[reason] = reasons.get(reason, 0) + 1
+
+            processed = self._processed
+            try:
+                if self.checkpoint is not None:
+                    self.checkpoint(index, recruiter_email, state, error)
+                if self.progress_callback is not None:
+                    self.progress_callback(processed, stats, recruiter_email)
+            except Exception as e:
+                # The result is counted; a resume may send this row again if its checkpoint was lost
+                self.logger.error(f"Failed to checkpoint {recruiter_email}: {str(e)}")
+
+        if processed % 10 == 0:
+            self.logger.info("Progress: %d/%d emails processed", processed, stats['total_emails'])
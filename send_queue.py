@@ -0,0 +1,213 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+
+# Per-recipient states; rows in FINISHED_STATES are skipped when a campaign resumes
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+# Failed because the server refused the recipient address; these rows get suppressed
+REJECTED = 'rejected'
+RETRYING = 'retrying'
+FAILED_STATES = (FAILED, REJECTED)
+FINISHED_STATES = (SENT,) + FAILED_STATES
+
+# Campaign states; anything not COMPLETED can be resumed
+RUNNING = 'running'
+COMPLETED = 'completed'
+CANCELLED = 'cancelled'
+ERROR = 'error'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id TEXT PRIMARY KEY,
+    csv_path TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recipients (
+    campaign_id TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    email TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (campaign_id, row_index)
+) WITHOUT ROWID;
+"""
+
+
+class SendQueue:
+    """Durable per-recipient send state for campaigns, kept in SQLite (WAL mode)
+
+    Recipients are enqueued as pending one prepared chunk at a time, and
+    results are written back in batches of batch_size (or every
+    flush_interval seconds), so a crash can lose at most one unflushed batch
+    and a resumed campaign skips every recipient already checkpointed.
+    Thread-safe.
+    """
+
+    def __init__(self, db_path='campaigns.db', batch_size=50, flush_interval=2.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # WAL + NORMAL survives process crashes; only an OS crash can drop the last commits
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def create_campaign(self, csv_path, settings, campaign_id=None):
+        """Register a new campaign and return its id"""
+        campaign_id = campaign_id or uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO campaigns (id, csv_path, settings, status, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (campaign_id, csv_path, json.dumps(settings), RUNNING, now, now),
+            )
+        return campaign_id
+
+    def get_campaign(self, campaign_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, csv_path, settings, status, created_at, updated_at FROM campaigns WHERE id = ?',
+                (campaign_id,),
+            ).fetchone()
+        return self._campaign_dict(row) if row else None
+
+    def resumable_campaigns(self):
+        """Campaigns that never completed (stopped, crashed or redeployed), newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, csv_path, settings, status, created_at, updated_at FROM campaigns '
+                'WHERE status != ? ORDER BY created_at DESC',
+                (COMPLETED,),
+            ).fetchall()
+        return [self._campaign_dict(row) for row in rows]
+
+    def set_status(self, campaign_id, status):
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE campaigns SET status = ?, updated_at = ? WHERE id = ?',
+                               (status, datetime.now().isoformat(), campaign_id))
+
+    def enqueue(self, campaign_id, row_indexes, emails):
+        """Add recipients as pending; rows already known keep their state"""
+        now = time.time()
+        records = [(campaign_id, int(index), str(email), PENDING, now) for index, email in zip(row_indexes, emails)]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO recipients (campaign_id, row_index, email, state, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                records,
+            )
+
+    def record(self, campaign_id, row_index, email, state, error=None):
+        """Buffer one send result; it is committed with the next batch"""
+        with self._lock:
+            self._pending.append((campaign_id, int(row_index), str(email), state, error, time.time()))
+            if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        with self._conn:
+            self._conn.executemany(
+                'INSERT INTO recipients (campaign_id, row_index, email, state, attempts, error, updated_at) '
+                'VALUES (?, ?, ?, ?, 1, ?, ?) '
+                'ON CONFLICT (campaign_id, row_index) DO UPDATE SET '
+                'state = excluded.state, attempts = attempts + 1, error = excluded.error, '
+                'updated_at = excluded.updated_at',
+                batch,
+            )
+
+    def finished_rows(self, campaign_id):
+        """Row indexes already sent or failed, as a NumPy array for vectorized filtering"""
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT row_index FROM recipients WHERE campaign_id = ? '
+                f'AND state IN ({",".join("?" * len(FINISHED_STATES))})',
+                (campaign_id, *FINISHED_STATES),
+            ).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    def sent_times(self, since):
+        """(sender_email, time.time() it was sent) for every real send after since, oldest first
+
+        Test-mode campaigns and campaigns that predate storing the sender are left out.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT json_extract(c.settings, '$.sender_email'), r.updated_at "
+                'FROM recipients r JOIN campaigns c ON c.id = r.campaign_id '
+                "WHERE r.state = ? AND r.updated_at > ? AND json_extract(c.settings, '$.test_mode') = 0 "
+                "AND json_extract(c.settings, '$.sender_email') IS NOT NULL "
+                'ORDER BY r.updated_at',
+                (SENT, since),
+            ).fetchall()
+
+    def results(self, campaign_id, state):
+        """(email, error) for every recipient of campaign_id currently in state"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT email, error FROM recipients WHERE campaign_id = ? AND state = ?',
+                (campaign_id, state),
+            ).fetchall()
+
+    def progress(self, campaign_id):
+        """Counts per state plus the failed addresses, as checkpointed so far"""
+        with self._lock:
+            counts = dict(self._conn.execute(
+                'SELECT state, COUNT(*) FROM recipients WHERE campaign_id = ? GROUP BY state',
+                (campaign_id,),
+            ).fetchall())
+            failed_emails = [row[0] for row in self._conn.execute(
+                f'SELECT email FROM recipients WHERE campaign_id = ? '
+                f'AND state IN ({",".join("?" * len(FAILED_STATES))}) ORDER BY row_index',
+                (campaign_id, *FAILED_STATES),
+            )]
+        return {
+            'pending': counts.get(PENDING, 0),
+            'sent': counts.get(SENT, 0),
+            'failed': sum(counts.get(state, 0) for state in FAILED_STATES),
+            'retrying': counts.get(RETRYING, 0),
+            'failed_emails': failed_emails,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._conn.close()
+
+    @staticmethod
+    def _campaign_dict(row):
+        campaign_id, csv_path, settings, status, created_at, updated_at = row
+        return {
+            'id': campaign_id,
+            'csv_path': csv_path,
+            'settings': json.loads(settings),
+            'status': status,
+            'created_at': created_at,
+            'updated_at': updated_at,
+        }
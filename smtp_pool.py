@@ -0,0 +1,250 @@
+import smtplib
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+from metrics import CONNECTS, RECONNECTS, SMTP_CONNECT, STAGE_SECONDS
+
+
+class PooledConnection:
+    """A single SMTP session owned by a SMTPConnectionPool"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.smtp = None
+        self.created_at = 0.0
+        self.last_used = 0.0
+
+    def open(self):
+        """Open the socket, upgrade to TLS and log in"""
+        pool = self.pool
+        started = time.perf_counter()
+        smtp = pool.smtp_class(pool.host, pool.port, timeout=pool.connect_timeout)
+        try:
+            if pool.use_tls:
+                smtp.starttls()
+            if pool.username and pool.password:
+                smtp.login(pool.username, pool.password)
+        except Exception:
+            self._close_quietly(smtp)
+            raise
+        self.smtp = smtp
+        self.created_at = self.last_used = time.monotonic()
+        pool.stats['connects'] += 1
+        CONNECTS.inc()
+        STAGE_SECONDS.observe(time.perf_counter() - started, SMTP_CONNECT)
+        return self
+
+    def close(self):
+        """Send QUIT (best effort) and drop the socket"""
+        if self.smtp is not None:
+            self._close_quietly(self.smtp)
+            self.smtp = None
+
+    def reconnect(self):
+        """Throw away the current session and open a new one"""
+        self.close()
+        self.pool.stats['reconnects'] += 1
+        RECONNECTS.inc()
+        return self.open()
+
+    def is_alive(self):
+        """Health check the session with NOOP"""
+        if self.smtp is None:
+            return False
+        try:
+            code, _ = self.smtp.noop()
+            return code == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send_message(self, msg, from_addr=None, to_addrs=None):
+        """Send a message, reconnecting once if the server dropped us"""
+        if self.smtp is None:
+            self.open()
+        try:
+            result = self.smtp.send_message(msg, from_addr, to_addrs)
+        except smtplib.SMTPServerDisconnected:
+            self.reconnect()
+            result = self.smtp.send_message(msg, from_addr, to_addrs)
+        self.last_used = time.monotonic()
+        return result
+
+    def sendmail(self, from_addr, to_addrs, payload):
+        """Send a pre-serialized payload, reconnecting once if the server dropped us"""
+        if self.smtp is None:
+            self.open()
+        try:
+            result = self.smtp.sendmail(from_addr, to_addrs, payload)
+        except smtplib.SMTPServerDisconnected:
+            self.reconnect()
+            result = self.smtp.sendmail(from_addr, to_addrs, payload)
+        self.last_used = time.monotonic()
+        return result
+
+    @staticmethod
+    def _close_quietly(smtp):
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                smtp.close()
+            except OSError:
+                pass
+
+
+class SMTPConnectionPool:
+    """Thread-safe pool of logged-in SMTP sessions for one account"""
+
+    def __init__(self, host, port, username, password, pool_size=4, idle_timeout=120,
+                 health_check_interval=30, connect_timeout=30, use_tls=True,
+                 smtp_class=smtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.pool_size = max(1, int(pool_size))
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.connect_timeout = connect_timeout
+        self.use_tls = use_tls
+        self.smtp_class = smtp_class
+
+        self._idle = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.stats = {'connects': 0, 'reconnects': 0, 'evicted': 0, 'borrowed': 0}
+        self.logger = logging.getLogger(__name__)
+
+    def acquire(self, timeout=None):
+        """Borrow a healthy connection, opening one if the pool has room"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        stale = []
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("SMTP connection pool is closed")
+                stale.extend(self._evict_idle_locked())
+                if self._idle:
+                    conn = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use < self.pool_size:
+                    conn = None
+                    self._in_use += 1
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("Timed out waiting for a pooled SMTP connection")
+                self._cond.wait(remaining)
+            self.stats['borrowed'] += 1
+
+        # Network I/O happens outside the lock
+        for old in stale:
+            old.close()
+        try:
+            if conn is None:
+                conn = PooledConnection(self).open()
+            elif time.monotonic() - conn.last_used > self.health_check_interval and not conn.is_alive():
+                conn.reconnect()
+        except Exception:
+            if conn is not None:
+                conn.close()
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, or close it if discard is set"""
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed or conn.smtp is None:
+                keep = False
+            else:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+                keep = True
+            self._cond.notify()
+        if not keep:
+            conn.close()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that borrows a connection and always gives it back"""
+        conn = self.acquire(timeout)
+        discard = False
+        try:
+            yield conn
+        except (smtplib.SMTPServerDisconnected, OSError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def check(self):
+        """Borrow a connection and NOOP it; used by connection tests"""
+        with self.connection() as conn:
+            return conn.is_alive()
+
+    def close_idle(self):
+        """Close every idle connection; borrowed ones are closed on release"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def close(self):
+        """Close the pool and all idle connections"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.close_idle()
+
+    def _evict_idle_locked(self):
+        """Drop connections idle longer than idle_timeout; caller closes them"""
+        if not self._idle or self.idle_timeout is None:
+            return []
+        now = time.monotonic()
+        fresh, stale = [], []
+        for conn in self._idle:
+            if now - conn.last_used > self.idle_timeout:
+                stale.append(conn)
+            else:
+                fresh.append(conn)
+        self._idle = fresh
+        self.stats['evicted'] += len(stale)
+        return stale
+
+
+# Pools are shared process-wide so campaigns, test sends and connection
+# checks for the same account reuse the same logged-in sessions.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host, port, username, password, pool_size=4, **kwargs):
+    """Return the shared pool for an account, creating it on first use"""
+    key = (host, port, username, password)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = SMTPConnectionPool(host, port, username, password, pool_size=pool_size, **kwargs)
+            _pools[key] = pool
+        elif pool_size > pool.pool_size:
+            with pool._cond:
+                pool.pool_size = pool_size
+                pool._cond.notify_all()
+        return pool
+
+
+def close_all_pools():
+    """Close every shared pool; app.py and demo.py register this with atexit"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
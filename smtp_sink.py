@@ -0,0 +1,213 @@
+import asyncio
+import base64
+import random
+import threading
+import time
+
+
+class SinkMessage:
+    """One message accepted by the sink"""
+
+    def __init__(self, mail_from, rcpt_tos, data):
+        self.mail_from = mail_from
+        self.rcpt_tos = rcpt_tos
+        self.data = data
+        self.received_at = time.time()
+
+
+class SMTPSink:
+    """Local SMTP stand-in that accepts and records mail without delivering it
+
+    Runs an asyncio server on its own thread so both smtplib and aiosmtplib
+    clients can talk to it. Speaks plain ESMTP (no STARTTLS), so point senders
+    at it with use_tls=False.
+
+    To stand in for a real provider it can delay every message by latency
+    seconds, reject a random error_rate fraction of messages with a
+    permanent 550, and answer MAIL with 421 (then hang up) once more than
+    max_rate messages arrive within one second. seed makes the rejections
+    reproducible. replies maps 'MAIL', 'RCPT' or 'DATA' to a fixed reply
+    line (e.g. {'RCPT': '550 5.1.1 User unknown'}) to refuse every message
+    at that step.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, keep_messages=True,
+                 error_rate=0.0, max_rate=None, seed=None, replies=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.keep_messages = keep_messages
+        self.error_rate = error_rate
+        self.max_rate = max_rate
+        self.replies = replies or {}
+        self.messages = []
+        self.message_count = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.connections = 0
+        self._random = random.Random(seed)
+        self._window_start = 0.0
+        self._window_count = 0
+
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def start(self):
+        """Start serving in a background thread and return self"""
+        self._thread = threading.Thread(target=self._run, name='smtp-sink', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        """Stop the server and wait for the thread to exit"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._server = loop.run_until_complete(
+            asyncio.start_server(self._handle_client, self.host, self.port)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._loop = loop
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            # Drop clients still holding pooled sessions open, then shut down
+            self._server.close()
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
+
+    async def _reply(self, writer, line):
+        writer.write(line.encode('ascii') + b'\r\n')
+        await writer.drain()
+
+    async def _handle_client(self, reader, writer):
+        self.connections += 1
+        mail_from, rcpt_tos = None, []
+        try:
+            await self._reply(writer, '220 localhost SMTP sink ready')
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('utf-8', 'replace').rstrip('\r\n')
+                verb, _, arg = command.partition(' ')
+                verb = verb.upper()
+
+                if verb == 'EHLO':
+                    await self._reply(writer, '250-localhost')
+                    await self._reply(writer, '250-8BITMIME')
+                    await self._reply(writer, '250-AUTH PLAIN LOGIN')
+                    await self._reply(writer, '250 SMTPUTF8')
+                elif verb == 'HELO':
+                    await self._reply(writer, '250 localhost')
+                elif verb == 'AUTH':
+                    await self._auth(reader, writer, arg)
+                elif verb == 'MAIL':
+                    if self._over_rate():
+                        self.throttled += 1
+                        await self._reply(writer, '421 4.7.0 Too many messages, try again later')
+                        break
+                    if 'MAIL' in self.replies:
+                        self.rejected += 1
+                        await self._reply(writer, self.replies['MAIL'])
+                        continue
+                    mail_from, rcpt_tos = arg.partition(':')[2].strip(), []
+                    await self._reply(writer, '250 OK')
+                elif verb == 'RCPT':
+                    if 'RCPT' in self.replies:
+                        self.rejected += 1
+                        await self._reply(writer, self.replies['RCPT'])
+                        continue
+                    rcpt_tos.append(arg.partition(':')[2].strip())
+                    await self._reply(writer, '250 OK')
+                elif verb == 'DATA':
+                    await self._reply(writer, '354 End data with <CR><LF>.<CR><LF>')
+                    data = await self._read_data(reader)
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    if 'DATA' in self.replies:
+                        self.rejected += 1
+                        mail_from, rcpt_tos = None, []
+                        await self._reply(writer, self.replies['DATA'])
+                        continue
+                    if self.error_rate and self._random.random() < self.error_rate:
+                        self.rejected += 1
+                        mail_from, rcpt_tos = None, []
+                        await self._reply(writer, '550 5.1.1 Mailbox unavailable')
+                        continue
+                    self.message_count += 1
+                    if self.keep_messages:
+                        self.messages.append(SinkMessage(mail_from, rcpt_tos, data))
+                    mail_from, rcpt_tos = None, []
+                    await self._reply(writer, '250 OK queued')
+                elif verb == 'RSET':
+                    mail_from, rcpt_tos = None, []
+                    await self._reply(writer, '250 OK')
+                elif verb in ('NOOP', 'VRFY'):
+                    await self._reply(writer, '250 OK' if verb == 'NOOP' else '252 Cannot VRFY')
+                elif verb == 'QUIT':
+                    await self._reply(writer, '221 Bye')
+                    break
+                else:
+                    await self._reply(writer, '502 Command not implemented')
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Client hung up or the sink is shutting down
+            pass
+        finally:
+            writer.close()
+
+    def _over_rate(self):
+        """Count one message against the current one-second window"""
+        if not self.max_rate:
+            return False
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self._window_start = now
+            self._window_count = 0
+        self._window_count += 1
+        return self._window_count > self.max_rate
+
+    async def _auth(self, reader, writer, arg):
+        mechanism, _, initial = arg.partition(' ')
+        mechanism = mechanism.upper()
+        if mechanism == 'PLAIN' and not initial:
+            await self._reply(writer, '334 ')
+            await reader.readline()
+        elif mechanism == 'LOGIN':
+            await self._reply(writer, '334 ' + base64.b64encode(b'Username:').decode())
+            await reader.readline()
+            await self._reply(writer, '334 ' + base64.b64encode(b'Password:').decode())
+            await reader.readline()
+        elif mechanism != 'PLAIN':
+            await self._reply(writer, '504 Unrecognized authentication type')
+            return
+        await self._reply(writer, '235 Authentication successful')
+
+    async def _read_data(self, reader):
+        lines = []
+        while True:
+            line = await reader.readline()
+            if not line or line in (b'.\r\n', b'.\n'):
+                break
+            if line.startswith(b'..'):
+                line = line[1:]
+            lines.append(line)
+        return b''.join(lines)
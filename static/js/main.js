@@ -2,6 +2,7 @@
 
 // Global variables
 let statusUpdateInterval;
+let statusEventSource;
 let campaignStatus = {
     running: false,
     progress: 0,
@@ -19,9 +20,10 @@ function initializeApp() {
     // Initialize tooltips
     initializeTooltips();
     
-    // Initialize status polling if on campaign page
+    // Initialize live status updates if on campaign page; a page can render
+    // the status itself by defining updateUI
     if (window.location.pathname.includes('campaign')) {
-        startStatusPolling();
+        startStatusUpdates(typeof updateUI === 'function' ? updateUI : updateCampaignUI);
     }
     
     // Initialize file upload handlers
@@ -194,13 +196,46 @@ function copyToClipboard(text, button) {
     });
 }
 
-function startStatusPolling() {
+function startStatusUpdates(onUpdate) {
+    onUpdate = onUpdate || updateCampaignUI;
+    stopStatusUpdates();
+    
+    if (!window.EventSource) {
+        startStatusPolling(onUpdate);
+        return;
+    }
+    
+    // The server pushes only the fields that changed; merge them into the last known status
+    statusEventSource = new EventSource('/campaign_events');
+    statusEventSource.onmessage = function(event) {
+        Object.assign(campaignStatus, JSON.parse(event.data));
+        onUpdate(campaignStatus);
+    };
+    statusEventSource.onerror = function() {
+        // EventSource reconnects on its own; fall back to polling only once it gives up
+        if (statusEventSource.readyState === EventSource.CLOSED) {
+            statusEventSource = null;
+            startStatusPolling(onUpdate);
+        }
+    };
+}
+
+function stopStatusUpdates() {
+    if (statusEventSource) {
+        statusEventSource.close();
+        statusEventSource = null;
+    }
+    stopStatusPolling();
+}
+
+function startStatusPolling(onUpdate) {
+    onUpdate = onUpdate || updateCampaignUI;
     if (statusUpdateInterval) {
         clearInterval(statusUpdateInterval);
     }
     
-    statusUpdateInterval = setInterval(updateCampaignStatus, 2000);
-    updateCampaignStatus(); // Initial update
+    statusUpdateInterval = setInterval(() => updateCampaignStatus(onUpdate), 2000);
+    updateCampaignStatus(onUpdate); // Initial update
 }
 
 function stopStatusPolling() {
@@ -210,11 +245,11 @@ function stopStatusPolling() {
     }
 }
 
-function updateCampaignStatus() {
+function updateCampaignStatus(onUpdate) {
     fetch('/campaign_status')
         .then(response => response.json())
         .then(data => {
-            updateCampaignUI(data);
+            (onUpdate || updateCampaignUI)(data);
         })
         .catch(error => {
             console.error('Error fetching campaign status:', error);
@@ -289,7 +324,7 @@ function updateStatusIndicators(status) {
                     currentEmailDiv.style.display = 'block';
                 }
             }
-        } else if (status.results) {
+        } else if (status.results || status.completed) {
             statusText.textContent = 'Campaign completed!';
             if (currentEmailDiv) {
                 currentEmailDiv.style.display = 'none';
@@ -306,7 +341,7 @@ function updateStatusIndicators(status) {
         if (status.running) {
             statusBadge.textContent = 'Running';
             statusBadge.className = 'badge bg-success';
-        } else if (status.results) {
+        } else if (status.results || status.completed) {
             statusBadge.textContent = 'Completed';
             statusBadge.className = 'badge bg-info';
         } else {
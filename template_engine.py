@@ -0,0 +1,248 @@
+import keyword
+import re
+import string
+
+
+# Format specs and conversions are pasted into generated code, so only allow what str.format accepts
+_SPEC_RE = re.compile(r'[\w<>=^+\- #,.%]*')
+_CONVERSIONS = ('r', 's', 'a')
+
+# Added to placeholder errors: a literal brace (CSS in a <style> block, say) reads as a placeholder
+LITERAL_BRACES_HINT = "For a literal brace, as in CSS, write {{ and }}"
+
+
+class CompiledTemplate:
+    """Template parsed once into static chunks plus placeholder slots
+
+    Uses str.format syntax ({field}, {{ for a literal brace).
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.parts = []
+        fields = set()
+        try:
+            parsed = list(string.Formatter().parse(source))
+        except ValueError as e:
+            # "Single '}' encountered in format string" and the like
+            raise ValueError(f"{str(e).capitalize()}. {LITERAL_BRACES_HINT}") from None
+        for literal, field, spec, conversion in parsed:
+            if literal:
+                self.parts.append(literal)
+            if field is None:
+                continue
+            if not field.isidentifier() or keyword.iskeyword(field) or field.startswith('_'):
+                raise ValueError(f"Unsupported placeholder {{{field}}}: use simple names like {{company_name}}. "
+                                 f"{LITERAL_BRACES_HINT}")
+            if spec and not _SPEC_RE.fullmatch(spec):
+                raise ValueError(f"Unsupported format spec in {{{field}:{spec}}}. {LITERAL_BRACES_HINT}")
+            if conversion is not None and conversion not in _CONVERSIONS:
+                raise ValueError(f"Unsupported conversion in {{{field}!{conversion}}}: use !r, !s or !a")
+            fields.add(field)
+            self.parts.append((field, spec, conversion))
+        self.fields = frozenset(fields)
+        self.render = compile_renderer([self])
+
+    def expression(self, constants):
+        """Python source for this template as adjacent literals, constants folded in"""
+        pieces = []
+        for part in self.parts:
+            if isinstance(part, str):
+                pieces.append(repr(part))
+                continue
+            field, spec, conversion = part
+            if field in constants:
+                pieces.append(repr(format_value(constants[field], spec, conversion)))
+            else:
+                pieces.append("f'{" + field + ('!' + conversion if conversion else '')
+                              + (':' + spec if spec else '') + "}'")
+        return ' '.join(pieces) or "''"
+
+
+def format_value(value, spec, conversion):
+    """Apply a placeholder's !conversion and :spec the way str.format would"""
+    if conversion == 'r':
+        value = repr(value)
+    elif conversion == 'a':
+        value = ascii(value)
+    elif conversion == 's':
+        value = str(value)
+    return format(value, spec)
+
+
+def compile_renderer(templates, constants=None, args=None):
+    """Compile templates into one function: values dict -> rendered string (or tuple)
+
+    Each field is looked up once and the adjacent literal/f-string pieces of
+    every template compile to a single BUILD_STRING. With args (a sequence of
+    field names) the function takes those fields as positional parameters
+    instead of a dict, so no dict is built per row and every field is a fast
+    local; fields outside args become required keyword-only parameters.
+    """
+    constants = constants or {}
+    fields = sorted(set().union(*(t.fields for t in templates)) - set(constants))
+    if args is None:
+        lines = ['def _render(_values):']
+        lines += [f'    {field} = _values[{field!r}]' for field in fields]
+    else:
+        extra = [field for field in fields if field not in args]
+        params = list(args) + (['*'] + extra if extra else [])
+        lines = [f'def _render({", ".join(params)}):']
+    expressions = [t.expression(constants) for t in templates]
+    if len(expressions) == 1:
+        lines.append(f'    return {expressions[0]}')
+    else:
+        lines.append('    return (' + ', '.join(expressions) + ')')
+
+    namespace = {}
+    exec(compile('\n'.join(lines), '<email template>', 'exec'), namespace)
+    return namespace['_render']
+
+
+# Fields that come from each CSV row
+ROW_FIELDS = ('company_name', 'role', 'recruiter_email', 'recruiter_first_name')
+
+# Fields derived per row or taken from the sender configuration
+DERIVED_FIELDS = ('recruiter_name', 'sender_name', 'sender_email', 'signature')
+
+# Positional arguments of EmailTemplate.render_row, in order
+ROW_ARGS = ROW_FIELDS + ('recruiter_name', 'sender_name', 'sender_email')
+
+
+def allowed_fields(csv_columns=None):
+    """Placeholders a template may use for a given CSV (all row fields if unknown)"""
+    row_fields = ROW_FIELDS if csv_columns is None else [f for f in ROW_FIELDS if f in csv_columns]
+    return set(row_fields) | set(DERIVED_FIELDS)
+
+
+class EmailTemplate:
+    """Subject, HTML and plain-text templates compiled together"""
+
+    def __init__(self, subject_template, html_template, text_template, constants=None):
+        self.subject = CompiledTemplate(subject_template)
+        self.html = CompiledTemplate(html_template)
+        self.text = CompiledTemplate(text_template)
+        # Values fixed for the whole campaign (signature, sender overrides) are
+        # folded into the static chunks at compile time
+        self.constants = dict(constants or {})
+        self.fields = self.subject.fields | self.html.fields | self.text.fields
+        self._render = compile_renderer([self.subject, self.html, self.text], self.constants)
+        self._render_bodies = compile_renderer([self.html, self.text], self.constants)
+        # render_row(*ROW_ARGS values) -> (html_body, text_body): render_bodies for the send path,
+        # which already holds the fields as a row tuple, without a dict per row or a wrapper call
+        self.render_row = compile_renderer([self.html, self.text], self.constants, args=ROW_ARGS)
+
+    def __reduce__(self):
+        # The generated renderers can't be pickled; recompile from the sources instead
+        return (EmailTemplate, (self.subject.source, self.html.source, self.text.source, self.constants))
+
+    def validate(self, csv_columns=None):
+        """Raise ValueError if any placeholder cannot be filled from the CSV"""
+        unknown = self.fields - allowed_fields(csv_columns)
+        if unknown:
+            names = ', '.join('{' + name + '}' for name in sorted(unknown))
+            allowed = ', '.join('{' + name + '}' for name in sorted(allowed_fields(csv_columns)))
+            raise ValueError(f"Unknown placeholders {names}. Available: {allowed}. {LITERAL_BRACES_HINT}")
+
+    def render(self, values):
+        """Return (subject, html_body, text_body) for one row"""
+        return self._render(values)
+
+    def render_bodies(self, values):
+        """Return (html_body, text_body) when the subject was rendered in batch"""
+        return self._render_bodies(values)
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from the dict saved by /save_email_template, falling back to defaults"""
+        constants = {'signature': config.get('signature', '')}
+        if config.get('sender_name'):
+            constants['sender_name'] = config['sender_name']
+        if config.get('sender_email'):
+            constants['sender_email'] = config['sender_email']
+        return cls(
+            config.get('subject_template') or DEFAULT_SUBJECT_TEMPLATE,
+            config.get('html_template') or DEFAULT_HTML_TEMPLATE,
+            config.get('text_template') or DEFAULT_TEXT_TEMPLATE,
+            constants=constants,
+        )
+
+
+DEFAULT_SUBJECT_TEMPLATE = "Excited for {role} Position at {company_name}"
+
+# HTML email body (same text, tighter spacing via inline styles)
+DEFAULT_HTML_TEMPLATE = """
+        <html>
+        <body style="margin:0;padding:0;">
+          <div style="font-family:Arial,Helvetica,sans-serif;font-size:14px;line-height:1.35;color:#111;">
+            <p style="margin:0 0 8px;">Hi {recruiter_name},</p>
+
+            <p style="margin:0 0 8px;">Pleasure to e-meet you! I hope you're doing great! I am Nirmal Boghara, studying my second year MS in Computer Science at New York University, writing this mail to express my interest in {role} opportunity at {company_name} for Spring 2026! I won't make this very long for you, but thanks for your time. Here's everything about me:</p>
+
+            <ul style="margin:0 0 8px;padding-left:20px;">
+              <li style="margin:2px 0;">Studying CS at NYU</li>
+              <li style="margin:2px 0;">Did my undergrad at University of Mumbai in Computer Engineering</li>
+              <li style="margin:2px 0;">Interned at Chewy last summer as an AI Innovator Intern II in Boston, MA.</li>
+              <li style="margin:2px 0;">Currently Technical Ambassador at Qualcomm, mentored 200+ students at their Edge AI Hackathons across USA.</li>
+              <li style="margin:2px 0;">Got featured in the <a href="https://urldefense.proofpoint.com/v2/url?u=https-3A__www.qualcomm.com_developer_blog_2025_07_from-2Dold-2Dto-2Delite-2Dhow-2Dnyu-2Dhack-2Dwinners-2Dembraced-2Dsnapdragon&d=DwMGaQ&c=slrrB7dE8n7gBJbeO0g-IQ&r=pyihzPbGwz9yNqAmgJS8KQ&m=Mt7rte2SLZlLU0YFz-V87h2Uf18WGdp4pOt9bFuKr38KoVG17ByPIE43oI6gKQMx&s=lIqTWjfnEeqY5g2h5Y9lsZqbQ4qEhWgffXRV8tGanSs&e=">Qualcomm developer Blog</a>.</li>
+              <li style="margin:2px 0;">Won 5 hackathons, attended 20+</li>
+              <li style="margin:2px 0;">Deep technical knowledge in SWE, AI, ML models with multiple academic and professional projects.</li>
+              <li style="margin:2px 0;">Previously interned at 3 consultancies & tech companies as SDE, AI, and Fullstack roles.</li>
+              <li style="margin:2px 0;">AI Business Fellow at Perplexity</li>
+              <li style="margin:2px 0;">I always build for social causes (<a href="https://github.com/nirmal141/TUTORAI">TutorAI</a>, <a href="https://github.com/nirmal141/PyroguardAI">PyroguardAI</a>, <a href="https://github.com/nirmal141/Fitfarm-main">Fitfarm</a>, <a href="https://github.com/nirmal141/Fittify">Fittify</a>) and more.</li>
+              <li style="margin:2px 0;">I solve rubik's cube in under 30 seconds (helps me stay sharp!)</li>
+            </ul>
+
+            <p style="margin:0 0 8px;">I learn and adapt things very quickly and am highly interested in working at {company_name} as a {role}. Looking forward to chatting with you on how my skills align with the org.</p>
+            <p style="margin:0 0 8px;">Attaching all the relevant links for your reference and my resume. Thank you for your time. Have a great day.</p>
+            
+
+            <p style="margin:0 0 8px;">
+            <a href="https://github.com/nirmal141">Github</a> | 
+            <a href="https://nirmal-aiswe.vercel.app">Portfolio</a> | 
+            <a href="https://linkedin.com/in/nirmal-boghara">Linkedin</a>
+            </p>
+
+            <p style="margin:0 0 8px;">Best regards,<br>
+            <strong>Nirmal Boghara</strong><br>
+            MS in Computer Science, New York University<br>
+            📧 {sender_email}<br>
+            
+            </p>
+          </div>
+        </body>
+        </html>
+        """
+
+# Plain text version (verbatim text as provided)
+DEFAULT_TEXT_TEMPLATE = """
+Hi {recruiter_name}, 
+
+Pleasure to e-meet you! I hope you're doing great! I am Nirmal Boghara, studying my second year MS in Computer Science at New York University, writing this mail to express my interest in {role} opportunity at {company_name} for Spring 2026! I won't make this very long for you, but thanks for your time. Here's everything about me:
+
+Studying CS at NYU 
+Did my undergrad at University of Mumbai in Computer Engineering
+Interned at Chewy last summer as an AI Innovator Intern II in Boston, MA.
+Currently Technical Ambassador at Qualcomm, mentored 200+ students at their Edge AI Hackathons across USA.
+Got featured in the Qualcomm developer Blog.
+Won 5 hackathons, attended 20+
+Deep technical knowledge in SWE, AI, ML models with multiple academic and professional projects.
+Previously interned at 3 consultancies & tech companies as SDE, AI, and Fullstack roles.
+AI Business Fellow at Perplexity
+I always build for social causes (TutorAI, PyroguardAI, Fitfarm, Fittify) and more.
+⁠⁠I solve rubik's cube in under 30 seconds (helps me stay sharp!)
+
+I learn and adapt things very quickly and am highly interested in working at {company_name} as a {role}. Looking forward to chatting with you on how my skills align with the org.
+Attaching all the relevant links for your reference and my resume. Thank you for your time. Have a great day.
+
+Best regards,
+Nirmal Boghara
+MS in Computer Science, New York University
+Email: {sender_email}
+Github | Portfolio | Linkedin
+        """
+
+
+def default_template():
+    return EmailTemplate(DEFAULT_SUBJECT_TEMPLATE, DEFAULT_HTML_TEMPLATE, DEFAULT_TEXT_TEMPLATE,
+                         constants={'signature': ''})
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The modules live at the repository root, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def contacts(tmp_path, monkeypatch):
+    # The campaign log is written to the working directory
+    monkeypatch.chdir(tmp_path)
+
+    def write(rows):
+        path = tmp_path / 'contacts.csv'
+        pd.DataFrame({
+            'company_name': [f'Company {i % 3}' for i in range(rows)],
+            'role': ['Engineer'] * rows,
+            'recruiter_email': [f'person{i}@company{i % 3}.com' for i in range(rows)],
+            'recruiter_first_name': [''] * rows,
+        }).to_csv(path, index=False)
+        return str(path)
+    return write
@@ -0,0 +1,169 @@
+import io
+import time
+
+import pytest
+
+import app as webapp
+from demo import EmailAutomation
+from metrics import REGISTRY
+from send_queue import CANCELLED, COMPLETED
+from smtp_sink import SMTPSink
+
+
+@pytest.fixture
+def client(contacts, tmp_path, monkeypatch):
+    monkeypatch.setattr(webapp, 'SEND_QUEUE_DB', str(tmp_path / 'campaigns.db'))
+    monkeypatch.setattr(webapp, 'email_automation', None)
+    webapp.setup_services()
+    webapp.app.config['current_csv'] = contacts(20)
+    yield webapp.app.test_client()
+    webapp.app.config.pop('current_csv', None)
+    webapp.send_queue.close()
+
+
+def wait_until_finished(campaign_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while webapp.campaign_scheduler.is_active(campaign_id):
+        assert time.monotonic() < deadline, 'campaign did not finish'
+        time.sleep(0.01)
+
+
+def configure(sender_email, **kwargs):
+    webapp.email_automation = EmailAutomation(sender_email, 'password', 'Me', **kwargs)
+
+
+def test_campaign_resumes_only_from_its_own_sender(client):
+    configure('a@example.com')
+    response = client.post('/start_campaign', json={'test_mode': True, 'delay_seconds': 0})
+    campaign_id = response.get_json()['campaign_id']
+    wait_until_finished(campaign_id)
+    assert webapp.send_queue.get_campaign(campaign_id)['settings']['sender_email'] == 'a@example.com'
+
+    webapp.send_queue.set_status(campaign_id, 'error')
+    configure('b@example.com')
+    response = client.post(f'/campaigns/{campaign_id}/resume')
+    assert response.status_code == 400
+    assert 'a@example.com' in response.get_json()['error']
+
+    configure('A@example.com')
+    response = client.post(f'/campaigns/{campaign_id}/resume')
+    assert response.status_code == 200
+    wait_until_finished(campaign_id)
+
+
+def test_pause_cancel_and_resume_deliver_each_message_once(client):
+    with SMTPSink(latency=0.02) as sink:
+        configure('me@example.com', smtp_host=sink.host, smtp_port=sink.port, use_tls=False)
+        response = client.post('/start_campaign', json={'test_mode': False, 'delay_seconds': 0.05})
+        campaign_id = response.get_json()['campaign_id']
+        while sink.message_count < 3:
+            time.sleep(0.01)
+
+        assert client.post(f'/campaigns/{campaign_id}/pause').status_code == 200
+        assert webapp.campaigns.get(campaign_id).snapshot().paused
+        # Only the message in flight when the pause arrived may still land
+        time.sleep(0.3)
+        paused_count = sink.message_count
+        time.sleep(0.3)
+        assert sink.message_count == paused_count < 20
+
+        assert client.post(f'/campaigns/{campaign_id}/cancel').status_code == 200
+        wait_until_finished(campaign_id)
+        assert webapp.send_queue.get_campaign(campaign_id)['status'] == CANCELLED
+        assert sink.message_count == paused_count
+        assert client.post(f'/campaigns/{campaign_id}/pause').status_code == 400
+
+        assert client.post(f'/campaigns/{campaign_id}/resume').status_code == 200
+        wait_until_finished(campaign_id)
+        recipients = [rcpt for message in sink.messages for rcpt in message.rcpt_tos]
+    assert webapp.send_queue.get_campaign(campaign_id)['status'] == COMPLETED
+    assert sorted(recipients) == sorted(f'<person{i}@company{i % 3}.com>' for i in range(20))
+
+
+def upload(client, rows):
+    csv = 'company_name,role,recruiter_email\n' + ''.join(f'{company},Engineer,{email}\n' for company, email in rows)
+    return client.post('/upload', data={'csv_file': (io.BytesIO(csv.encode()), 'contacts.csv')},
+                       content_type='multipart/form-data')
+
+
+def test_preview_searches_the_latest_upload(client):
+    assert upload(client, [('Acme', 'alice@acme.com'), ('Globex', 'bob@globex.com')]).status_code == 302
+    page = client.get('/preview?q=globex').get_data(as_text=True)
+    assert 'bob@globex.com' in page and 'alice@acme.com' not in page
+
+    # Uploads in the same second land on the same path; the dataset must be rebuilt
+    assert upload(client, [('Hooli', 'gavin@hooli.com')]).status_code == 302
+    page = client.get('/preview?q=o').get_data(as_text=True)
+    assert 'gavin@hooli.com' in page and 'bob@globex.com' not in page
+
+
+def test_process_engine_campaigns_cannot_be_profiled(client):
+    configure('me@example.com')
+    response = client.post('/start_campaign', json={'test_mode': True, 'engine': 'process', 'profile': True})
+    assert response.status_code == 400
+    assert "'process' engine" in response.get_json()['error']
+
+    campaign_id = webapp.send_queue.create_campaign('contacts.csv', {'engine': 'process'})
+    response = client.post(f'/campaigns/{campaign_id}/profile/start')
+    assert response.status_code == 400
+    assert "'process' engine" in response.get_json()['error']
+
+
+def test_metrics_serves_prometheus_text(client):
+    REGISTRY.reset()
+    with SMTPSink() as sink:
+        configure('me@example.com', smtp_host=sink.host, smtp_port=sink.port, use_tls=False)
+        response = client.post('/start_campaign', json={'test_mode': False, 'delay_seconds': 0})
+        wait_until_finished(response.get_json()['campaign_id'])
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type == 'text/plain; version=0.0.4; charset=utf-8'
+    lines = response.get_data(as_text=True).splitlines()
+    assert '# TYPE email_messages_total counter' in lines
+    assert 'email_messages_total{result="sent"} 20' in lines
+    assert '# TYPE email_stage_seconds histogram' in lines
+    assert 'email_stage_seconds_count{stage="smtp_send"} 20' in lines
+    assert 'email_stage_seconds_bucket{stage="smtp_send",le="+Inf"} 20' in lines
+    assert any(line.startswith('email_stage_seconds_sum{stage="smtp_send"} ') for line in lines)
+    assert 'email_campaigns{state="running"} 0' in lines
+
+
+def test_profile_a_running_campaign(client, contacts):
+    configure('me@example.com')
+    # Test mode skips the delay, so give it enough rows to still be running while sampled
+    webapp.app.config['current_csv'] = contacts(10_000)
+    response = client.post('/start_campaign', json={'test_mode': True, 'delay_seconds': 0})
+    campaign_id = response.get_json()['campaign_id']
+    while not webapp.campaigns.get(campaign_id).snapshot().running:
+        time.sleep(0.01)
+
+    assert client.post(f'/campaigns/{campaign_id}/profile/start').status_code == 200
+    assert client.post(f'/campaigns/{campaign_id}/profile/start').status_code == 400
+    time.sleep(0.2)
+    response = client.post(f'/campaigns/{campaign_id}/profile/stop')
+    assert response.status_code == 200
+    stopped = response.get_json()
+    assert stopped['samples'] > 0 and stopped['top_functions']
+
+    folded = client.get(stopped['folded_url'])
+    assert folded.status_code == 200
+    assert folded.get_data(as_text=True).strip()
+    summary = client.get(f'/campaigns/{campaign_id}/profile?format=summary')
+    assert summary.status_code == 200
+    assert f'Campaign {campaign_id}' in summary.get_data(as_text=True)
+
+    response = client.post(f'/campaigns/{campaign_id}/profile/stop')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Campaign is not being profiled'
+    client.post(f'/campaigns/{campaign_id}/cancel')
+    wait_until_finished(campaign_id)
+
+
+def test_profiling_an_unknown_campaign_is_refused(client):
+    response = client.post('/campaigns/missing/profile/start')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Campaign is not running'
+    assert client.post('/campaigns/missing/profile/stop').status_code == 400
+    assert client.get('/campaigns/missing/profile').status_code == 404
+    assert client.get('/campaigns/missing/profile?format=svg').status_code == 400
@@ -0,0 +1,23 @@
+import threading
+
+from async_sender import AsyncSendEngine
+from contacts import open_contacts
+from demo import EmailAutomation
+
+
+def test_rows_are_loaded_off_the_event_loop(contacts):
+    csv_path = contacts(1200)
+    automation = EmailAutomation('me@example.com', 'password', 'Me')
+    loaded_on = set()
+
+    def rows():
+        for row in automation._campaign_rows(open_contacts(csv_path, chunksize=500)):
+            loaded_on.add(threading.current_thread().name)
+            yield row
+
+    stats = {'total_emails': 1200, 'sent_successfully': 0, 'failed_to_send': 0, 'retried': 0,
+             'failed_emails': [], 'failure_reasons': {}}
+    AsyncSendEngine(automation, sessions=4, test_mode=True).run(rows(), stats)
+    assert stats['sent_successfully'] == 1200
+    assert threading.current_thread().name not in loaded_on
+    assert all(name.startswith('row-loader') for name in loaded_on)
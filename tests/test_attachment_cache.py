@@ -0,0 +1,79 @@
+import os
+from email import encoders
+from email.mime.base import MIMEBase
+
+import pytest
+
+from attachment_cache import AttachmentCache
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def uncached_part(path):
+    # How the resume was attached before the cache existed
+    with open(path, 'rb') as f:
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(f.read())
+    encoders.encode_base64(part)
+    part.add_header('Content-Disposition', f'attachment; filename= {os.path.basename(path)}')
+    return part
+
+
+def test_repeat_lookups_hit(tmp_path):
+    cache = AttachmentCache()
+    path = write(tmp_path / 'resume.pdf', b'%PDF' * 100)
+    first = cache.get(path)
+    assert cache.get(path) is first
+    assert cache.get(path) is first
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 1, 1)
+    assert stats['encoded_bytes'] == len(first.encoded)
+
+
+def test_changed_file_is_encoded_again(tmp_path):
+    cache = AttachmentCache()
+    path = write(tmp_path / 'resume.pdf', b'version one')
+    first = cache.get(path)
+
+    # Same size, newer mtime
+    write(tmp_path / 'resume.pdf', b'version two')
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    second = cache.get(path)
+    assert second is not first
+    assert cache.get_part(path).get_payload(decode=True) == b'version two'
+
+    # Same mtime, different size
+    mtime_ns = os.stat(path).st_mtime_ns
+    write(tmp_path / 'resume.pdf', b'version three')
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    assert cache.get(path) is not second
+    assert cache.get_part(path).get_payload(decode=True) == b'version three'
+    assert cache.stats()['misses'] == 3
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = AttachmentCache(max_entries=2)
+    a, b, c = (write(tmp_path / f'{name}.pdf', name.encode()) for name in 'abc')
+    entry_a = cache.get(a)
+    cache.get(b)
+    # Touching a makes b the oldest
+    cache.get(a)
+    cache.get(c)
+    assert cache.stats()['evictions'] == 1
+    assert cache.get(a) is entry_a
+    misses = cache.stats()['misses']
+    cache.get(b)
+    assert cache.stats()['misses'] == misses + 1
+
+
+@pytest.mark.parametrize('use_mmap', [True, False])
+@pytest.mark.parametrize('size', [0, 57, 100_000])
+def test_cached_part_matches_uncached_encoding(tmp_path, use_mmap, size):
+    path = write(tmp_path / 'resume.pdf', os.urandom(size))
+    cache = AttachmentCache(use_mmap=use_mmap)
+    cache.get(path)
+    assert cache.get_part(path).as_bytes() == uncached_part(path).as_bytes()
@@ -0,0 +1,47 @@
+import threading
+import time
+
+from campaign_state import CampaignControl
+
+
+def wait_in_thread(fn):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn()), daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_pause_blocks_until_resumed():
+    control = CampaignControl()
+    control.pause()
+    assert control.paused
+    thread, result = wait_in_thread(control.wait_while_paused)
+    thread.join(timeout=0.1)
+    assert thread.is_alive()
+    control.resume()
+    thread.join(timeout=1)
+    assert result == [True]
+    assert not control.paused
+
+
+def test_cancel_wakes_a_paused_wait():
+    control = CampaignControl()
+    control.pause()
+    thread, result = wait_in_thread(control.wait_while_paused)
+    control.cancel()
+    thread.join(timeout=1)
+    assert result == [False]
+    # A cancelled campaign can't be paused again
+    control.pause()
+    assert not control.paused
+
+
+def test_cancel_cuts_a_sleep_short():
+    control = CampaignControl()
+    started = time.monotonic()
+    thread, result = wait_in_thread(lambda: control.sleep(30))
+    control.cancel()
+    thread.join(timeout=1)
+    assert result == [False]
+    assert time.monotonic() - started < 1
+    assert not control.sleep(0)
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from contacts import build_dataset, clean_text, derive_recruiter_names, load_dataset, prepare_contacts
+from demo import EmailAutomation
+from template_engine import default_template
+
+EMAILS = ['JDOE2x@corp.com', 'a.b_c@corp.com', "john.o'neil@corp.com", 'first_last@corp.com', 'MARY@corp.com',
+          'x..y@corp.com', 'trailing.@corp.com', 'élodie.dupont@corp.fr', 'no-at-sign', '']
+
+
+def test_derived_names_match_extract_recruiter_name():
+    automation = EmailAutomation('me@example.com', 'password', 'Me')
+    emails = pd.Series(EMAILS, index=range(10, 20), dtype=object)
+    derived = derive_recruiter_names(emails)
+    assert derived.index.equals(emails.index)
+    assert derived.tolist() == [automation.extract_recruiter_name(email) for email in EMAILS]
+
+
+def test_blank_first_names_fall_back_to_the_derived_name():
+    automation = EmailAutomation('me@example.com', 'password', 'Me')
+    first_names = [np.nan, '', '  ', 'Sam', None, np.nan, '', 'Élodie', np.nan, np.nan]
+    frame = pd.DataFrame({
+        'company_name': ['Acme'] * len(EMAILS),
+        'role': ['Engineer'] * len(EMAILS),
+        'recruiter_email': EMAILS,
+        'recruiter_first_name': first_names,
+    })
+    prepared = prepare_contacts(frame, default_template(), automation.sender_constants())
+    expected = [automation.create_personalized_email('Acme', 'Engineer', email, str(name).strip())[1]
+                for email, name in zip(EMAILS, pd.Series(first_names, dtype=object).fillna(''))]
+    rendered = [automation.render_prepared(*row[1:])[1] for row in prepared.itertuples(index=True, name=None)]
+    assert rendered == expected
+
+
+CSV = '\n'.join([
+    'company_name,role,recruiter_email,recruiter_first_name,notes',
+    '"Acme, Inc.",Engineer,alice@acme.com,Alice,"says ""hi"""',
+    'Globex,,bob@globex.com,,"two\nlines"',
+    'Société Générale,Ingénieur,élodie@sg.fr,Élodie,日本語',
+    '  Padded  ,Role ,  carol@initech.com ,,',
+    ',,,,',
+]) + '\n'
+
+
+def assert_same_values(frame, expected):
+    # Newer pandas reads strings into a string dtype; the dataset hands out plain objects
+    pd.testing.assert_frame_equal(frame, expected, check_index_type=False, check_dtype=False)
+
+
+def test_dataset_rows_match_reading_the_csv(tmp_path):
+    path = tmp_path / 'contacts.csv'
+    path.write_text(CSV, encoding='utf-8')
+    source = build_dataset(str(path), chunksize=2)
+
+    expected = pd.read_csv(path, dtype=str)
+    expected = pd.DataFrame({column: clean_text(expected[column]) for column in expected.columns})
+    assert source.row_count == len(expected) == 5
+    assert source.columns == expected.columns.tolist()
+    assert_same_values(source.rows(0, source.row_count), expected)
+    # Chunks read back the same values, and a reopened dataset is identical
+    assert_same_values(pd.concat(list(source.iter_chunks())), expected[source.usecols])
+    assert_same_values(load_dataset(str(path)).rows(1, 3), expected.iloc[1:3])
@@ -0,0 +1,60 @@
+import pandas as pd
+
+from address_validation import DomainChecker
+from contacts import open_contacts
+from preflight import screen
+
+
+class DictResolver:
+    """Answers from a dict, counting lookups per domain"""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = {}
+
+    def __call__(self, domain):
+        self.calls[domain] = self.calls.get(domain, 0) + 1
+        return self.answers.get(domain)
+
+
+def test_undeliverable_domains_are_skipped(tmp_path):
+    path = tmp_path / 'contacts.csv'
+    pd.DataFrame({
+        'company_name': ['A', 'B', 'C', 'D'],
+        'role': ['Engineer'] * 4,
+        'recruiter_email': ['a@good.com', 'b@gone.com', 'c@unknown.com', 'd@gone.com'],
+    }).to_csv(path, index=False)
+    resolver = DictResolver({'good.com': True, 'gone.com': False})
+
+    screening = screen(open_contacts(str(path)), domain_checker=DomainChecker(resolver))
+
+    # Only a definite "no mail here" answer (NXDOMAIN) skips a row; unknown domains are kept
+    assert sorted(screening.invalid.tolist()) == [1, 3]
+
+
+def test_answers_are_cached_per_domain():
+    resolver = DictResolver({'good.com': True, 'gone.com': False})
+    checker = DomainChecker(resolver)
+
+    assert checker.undeliverable(['good.com', 'gone.com', 'gone.com']) == {'gone.com'}
+    assert checker.undeliverable(['gone.com', 'good.com', 'new.com']) == {'gone.com'}
+
+    assert resolver.calls == {'good.com': 1, 'gone.com': 1, 'new.com': 1}
+    assert checker.lookups == 3
+
+
+def test_cache_entries_expire_after_ttl():
+    resolver = DictResolver({'good.com': True})
+    checker = DomainChecker(resolver, ttl=0)
+
+    checker.check(['good.com'])
+    checker.check(['good.com'])
+
+    assert resolver.calls == {'good.com': 2}
+
+
+def test_resolver_errors_count_as_unknown():
+    def failing(domain):
+        raise OSError('no network')
+
+    assert DomainChecker(failing).check(['good.com']) == {'good.com': None}
@@ -0,0 +1,80 @@
+import logging
+import queue
+
+import log_pipeline
+from log_pipeline import BatchedFileHandler, BatchingQueueListener, LazyQueueHandler, recipient_logger
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def capture(logger):
+    handler = ListHandler()
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return handler
+
+
+def test_recipient_lines_are_sampled(monkeypatch):
+    monkeypatch.setattr(log_pipeline, 'LOG_RECIPIENT_SAMPLE', 4)
+    logger = recipient_logger('test_sampled')
+    handler = capture(logger)
+    for i in range(20):
+        logger.info('Email sent successfully to person%d', i)
+    assert [record.args[0] for record in handler.records] == [0, 4, 8, 12, 16]
+    # Asking again doesn't stack a second filter
+    assert recipient_logger('test_sampled') is logger and len(logger.filters) == 1
+
+
+def test_warnings_are_never_sampled_out(monkeypatch):
+    monkeypatch.setattr(log_pipeline, 'LOG_RECIPIENT_SAMPLE', 10)
+    logger = recipient_logger('test_warnings')
+    handler = capture(logger)
+    for i in range(30):
+        logger.info('sent %d', i)
+        logger.warning('retrying %d', i)
+        if i % 3 == 0:
+            logger.error('failed %d', i)
+    levels = [record.levelno for record in handler.records]
+    assert levels.count(logging.INFO) == 3
+    assert levels.count(logging.WARNING) == 30
+    assert levels.count(logging.ERROR) == 10
+
+
+def test_unsampled_logger_keeps_everything():
+    logger = recipient_logger('test_unsampled')
+    handler = capture(logger)
+    for i in range(5):
+        logger.info('sent %d', i)
+    assert not logger.filters
+    assert len(handler.records) == 5
+
+
+def test_stopping_the_listener_writes_every_queued_record(tmp_path):
+    path = tmp_path / 'campaign.log'
+    file_handler = BatchedFileHandler(path, maxBytes=0)
+    file_handler.setFormatter(logging.Formatter(log_pipeline.LOG_FORMAT))
+    records = queue.SimpleQueue()
+    logger = logging.getLogger('test_listener')
+    logger.addHandler(LazyQueueHandler(records))
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    # Queued before the listener starts, so stop() has a backlog to drain
+    for i in range(1000):
+        logger.info('Email sent successfully to person%d', i)
+    listener = BatchingQueueListener(records, file_handler, batch_size=10_000, flush_interval=60)
+    listener.start()
+    listener.stop()
+    # Read before close(), which would flush on its own
+    lines = path.read_text().splitlines()
+    file_handler.close()
+    assert len(lines) == 1000
+    assert lines[-1].endswith('INFO - Email sent successfully to person999')
@@ -0,0 +1,41 @@
+import pytest
+
+from metrics import Histogram, Registry
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    timer = registry.timer('stage_seconds', 'Stage latency', ['stage'], buckets=(0.1, 1.0, 10.0))
+    for seconds in (0.05, 0.1, 0.5, 2.0, 20.0):
+        timer.observe(seconds, ('send',))
+    timer.observe(0.2, ('render',))
+
+    samples = {(name, labels['stage'], labels.get('le')): value for name, labels, value in timer.samples()}
+    # Upper bounds are inclusive, like Prometheus's le
+    assert [samples['stage_seconds_bucket', 'send', le] for le in ('0.1', '1.0', '10.0', '+Inf')] == [2, 3, 4, 5]
+    assert samples['stage_seconds_count', 'send', None] == 5
+    assert samples['stage_seconds_sum', 'send', None] == pytest.approx(22.65)
+    assert samples['stage_seconds_count', 'render', None] == 1
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    registry.counter('sends_total', 'Sends', ['result']).inc(3, labels=('sent',))
+    registry.timer('wait_seconds', 'Waits', buckets=(1.0,)).observe(0.5)
+    lines = registry.render().splitlines()
+    assert lines[:3] == ['# HELP sends_total Sends', '# TYPE sends_total counter', 'sends_total{result="sent"} 3']
+    assert lines[3:] == ['# HELP wait_seconds Waits', '# TYPE wait_seconds histogram',
+                         'wait_seconds_bucket{le="1.0"} 1', 'wait_seconds_bucket{le="+Inf"} 1',
+                         'wait_seconds_sum 0.5', 'wait_seconds_count 1']
+
+
+def test_merged_histogram_matches_one_that_saw_every_value():
+    left, right, both = Histogram((1.0, 2.0)), Histogram((1.0, 2.0)), Histogram((1.0, 2.0))
+    for value in (0.5, 1.5):
+        left.observe(value)
+        both.observe(value)
+    for value in (2.5, 0.7):
+        right.observe(value)
+        both.observe(value)
+    left.merge(right.counts, right.sum)
+    assert (left.counts, left.count, left.sum) == (both.counts, both.count, both.sum)
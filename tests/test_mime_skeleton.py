@@ -0,0 +1,50 @@
+import email
+
+import pytest
+
+from demo import EmailAutomation
+from mime_skeleton import POLICY
+
+
+def build_bytes(automation, to_email, subject, html_body, text_body, resume_path=None):
+    # What build_message puts on the wire with the skeleton's boundary
+    msg = automation.build_message(to_email, subject, html_body, text_body, resume_path)
+    msg.set_boundary(automation.skeleton.boundary)
+    return msg.as_bytes(policy=POLICY)
+
+
+@pytest.mark.parametrize('sender_name, subject, html_body, text_body', [
+    ('Sender', 'Application for Engineer', '<p>Hi Sam</p>', 'Hi Sam\nThanks'),
+    ('Zoë Čapek', 'Candidature — ingénieur à Zürich', '<p>Grüße, José</p>', 'Grüße, José\n東京'),
+])
+def test_skeleton_matches_build_message(sender_name, subject, html_body, text_body):
+    automation = EmailAutomation('sender@example.com', 'unused', sender_name)
+    assembled = automation.skeleton.assemble('sam@acme.com', subject, html_body, text_body)
+    assert assembled == build_bytes(automation, 'sam@acme.com', subject, html_body, text_body)
+
+
+def test_skeleton_matches_build_message_with_attachment(tmp_path):
+    resume = tmp_path / 'resume.pdf'
+    resume.write_bytes(bytes(range(256)) * 64)
+    automation = EmailAutomation('sender@example.com', 'unused', 'Sender')
+    args = ('sam@acme.com', 'Hello', '<p>Hi</p>', 'Hi', str(resume))
+    # Second call splices the attachment part cached by the first
+    assert automation.skeleton.assemble(*args) == build_bytes(automation, *args)
+    assert automation.skeleton.assemble(*args) == build_bytes(automation, *args)
+
+
+def test_boundary_in_body_falls_back_to_build_message():
+    automation = EmailAutomation('sender@example.com', 'unused', 'Sender')
+    text_body = f'Quoting an earlier message:\n--{automation.skeleton.boundary}\nend'
+    assert automation.skeleton.assemble('sam@acme.com', 'Hello', '<p>Hi</p>', text_body) is None
+
+    automation.template.render_row = lambda *args: ('<p>Hi</p>', text_body)
+    row = (0, 'Acme', 'Engineer', 'sam@acme.com', '', 'Sam', 'Hello')
+    payload = automation.render_payload(row)
+
+    # The MIME path picks a boundary of its own, so the body survives parsing intact
+    parsed = email.message_from_bytes(payload)
+    assert parsed.get_boundary() != automation.skeleton.boundary
+    plain, html = parsed.get_payload()
+    assert plain.get_payload().replace('\r\n', '\n') == text_body
+    assert html.get_payload() == '<p>Hi</p>'
@@ -0,0 +1,104 @@
+import os
+
+import pandas as pd
+import pytest
+
+from address_validation import valid_emails
+from contacts import FIELD_END, build_dataset, load_dataset
+from preflight import screen
+from preview import preview_page
+
+ROWS = [
+    ('Acme', 'Engineer', 'alice@acme.com'),
+    ('Acme', 'Designer', 'not-an-email'),
+    ('Globex', 'Engineer', 'bob@globex.com'),
+    ('Acme', 'Engineer', 'ALICE@acme.com'),
+    ('Initech', '', 'carol@initech.com'),
+    ('Umbrella', 'Engineer', 'dave@umbrella.com'),
+]
+
+
+def write_csv(path, rows):
+    pd.DataFrame(rows, columns=['company_name', 'role', 'recruiter_email']).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def source(tmp_path):
+    return build_dataset(write_csv(tmp_path / 'contacts.csv', ROWS))
+
+
+def test_pages_are_clamped_to_the_list(tmp_path):
+    source = build_dataset(write_csv(tmp_path / 'big.csv', [('Acme', 'Engineer', f'p{n}@acme.com')
+                                                            for n in range(25)]))
+    last = preview_page(source, page=99, page_size=10)
+    assert (last.page, last.pages, last.matches) == (3, 3, 25)
+    assert last.rows.index.tolist() == list(range(20, 25))
+    first = preview_page(source, page=-3, page_size=10)
+    assert first.page == 1
+    assert first.rows.index.tolist() == list(range(10))
+
+    searched = preview_page(source, page=5, query='p1', page_size=10)
+    assert (searched.page, searched.pages, searched.matches) == (2, 2, 11)
+    assert searched.rows.index.tolist() == [19]
+    nothing = preview_page(source, page=2, query='nobody', page_size=10)
+    assert (nothing.page, nothing.pages, nothing.matches, len(nothing.rows)) == (1, 1, 0, 0)
+
+
+def test_search_and_filters_keep_rows_that_will_be_skipped(source):
+    screening = screen(source)
+    assert screening.invalid.tolist() == [1]
+    assert screening.duplicates.tolist() == [3]
+
+    # The preview still lists skipped rows, so they can be found and fixed
+    page = preview_page(source, query='acme')
+    assert page.rows.index.tolist() == [0, 1, 3]
+    assert valid_emails(page.rows['recruiter_email']).tolist() == [True, False, True]
+
+    page = preview_page(source, query='ACME', filters={'role': 'engineer', 'email': 'alice'})
+    assert page.rows.index.tolist() == [0, 3]
+    assert page.matches == 2
+    page = preview_page(source, query='acme', filters={'company': 'globex'})
+    assert page.matches == 0
+
+
+def test_search_respects_value_boundaries(source):
+    # Hits at the very first and very last byte of a column
+    assert source.find('company_name', 'acme').tolist() == [0, 1, 3]
+    assert source.find('recruiter_email', 'umbrella.com').tolist() == [5]
+    # The end of one value and the start of the next never match together
+    assert source.find('recruiter_email', 'comb').tolist() == []
+    assert source.find('role', 'erengineer').tolist() == []
+    # FIELD_END in a query is ignored rather than matching a boundary
+    assert source.find('role', f'engineer{FIELD_END}').tolist() == [0, 2, 3, 5]
+    # An empty value is still its own row
+    assert source.take([4])['role'].tolist() == ['']
+    assert source.take([0, 5])['recruiter_email'].tolist() == ['alice@acme.com', 'dave@umbrella.com']
+    assert source.rows(4, 100).index.tolist() == [4, 5]
+    assert source.rows(-2, 1)['company_name'].tolist() == ['Acme']
+    assert source.rows(6, 9).empty
+
+
+@pytest.mark.parametrize('block_size', [1, 3, 7, 64])
+@pytest.mark.parametrize('text', ['acme', 'ACME.com', 'e', 'umbrella.com', 'comb', 'x'])
+def test_search_finds_matches_across_block_boundaries(source, block_size, text):
+    # Small blocks put matches across every possible split point
+    expected = [i for i, email in enumerate(email for _, _, email in ROWS) if text.lower() in email.lower()]
+    assert source.find('recruiter_email', text, block_size=block_size).tolist() == expected
+    assert source.find('recruiter_email', text).tolist() == expected
+
+
+def test_new_upload_replaces_the_dataset(tmp_path, source):
+    csv_path = str(tmp_path / 'contacts.csv')
+    assert load_dataset(csv_path) is not None
+    write_csv(csv_path, [('Hooli', 'Engineer', 'gavin@hooli.com')])
+    os.utime(csv_path, ns=(0, 0))
+    # The cached copy no longer matches the file
+    assert load_dataset(csv_path) is None
+
+    rebuilt = build_dataset(csv_path)
+    assert rebuilt.row_count == 1
+    assert load_dataset(csv_path).row_count == 1
+    assert rebuilt.find('company_name', 'acme').tolist() == []
+    page = preview_page(rebuilt, query='hooli')
+    assert page.rows['recruiter_email'].tolist() == ['gavin@hooli.com']
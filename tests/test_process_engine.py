@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+
+import pytest
+
+from demo import EmailAutomation
+from send_queue import ERROR, SendQueue
+from smtp_sink import SMTPSink
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('shard_by', ['domain', 'range'])
+def test_process_engine_delivers_every_message(contacts, shard_by):
+    csv_path = contacts(30)
+    with SMTPSink() as sink:
+        automation = EmailAutomation('me@example.com', 'password', 'Me', smtp_host=sink.host, smtp_port=sink.port,
+                                     use_tls=False)
+        stats = automation.send_bulk_emails(csv_path, delay_seconds=0, test_mode=False, workers=2, engine='process',
+                                            processes=2, shard_by=shard_by)
+        delivered = sink.message_count
+    assert stats['sent_successfully'] == 30
+    assert stats['failed_to_send'] == 0
+    assert delivered == 30
+
+
+def test_killed_shard_leaves_the_campaign_resumable(contacts, tmp_path):
+    csv_path = contacts(40)
+    send_queue = SendQueue(str(tmp_path / 'campaigns.db'))
+    campaign_id = send_queue.create_campaign(csv_path, {})
+
+    def kill_shard(processed, stats, current_email):
+        for process in multiprocessing.active_children():
+            if process.name == 'send-shard-0':
+                process.kill()
+
+    # Range sharding puts all 40 rows on shard 0; the sink's latency keeps it busy until it is killed
+    with SMTPSink(latency=0.05) as sink:
+        automation = EmailAutomation('me@example.com', 'password', 'Me', smtp_host=sink.host, smtp_port=sink.port,
+                                     use_tls=False)
+        stats = automation.send_bulk_emails(csv_path, delay_seconds=0, test_mode=False, workers=1, engine='process',
+                                            processes=2, shard_by='range', progress_callback=kill_shard,
+                                            send_queue=send_queue, campaign_id=campaign_id)
+    assert stats['shard_failures'] == 1
+    assert stats['sent_successfully'] < 40
+    assert send_queue.get_campaign(campaign_id)['status'] == ERROR
+    assert [campaign['id'] for campaign in send_queue.resumable_campaigns()] == [campaign_id]
+    send_queue.close()
+
+
+def test_importing_app_has_no_side_effects(tmp_path):
+    # Spawned shards re-import the script the server was started with
+    script = ('import threading, app; '
+              'print(threading.active_count(), app.send_queue, app.campaign_scheduler)')
+    result = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, capture_output=True, text=True,
+                            env={**os.environ, 'PYTHONPATH': ROOT}, check=True)
+    assert result.stdout.split() == ['1', 'None', 'None']
+    assert os.listdir(tmp_path) == []
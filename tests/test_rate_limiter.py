@@ -0,0 +1,166 @@
+import smtplib
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, SenderQuota, SenderQuotas, TokenBucket
+
+THROTTLED = smtplib.SMTPResponseException(421, b'4.7.0 Try again later')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock for the limiter; advance it by setting clock.now"""
+    class Clock:
+        now = 1000.0
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', lambda: Clock.now)
+    return Clock
+
+
+def take(bucket, now):
+    t = bucket.earliest(now)
+    bucket.commit(t)
+    return t
+
+
+def test_token_bucket_spaces_sends_at_the_rate():
+    bucket = TokenBucket(rate=10)
+    assert [take(bucket, 0.0) for _ in range(3)] == pytest.approx([0.0, 0.1, 0.2])
+    # Idle time is not banked beyond the burst
+    assert take(bucket, 5.0) == 5.0
+    assert take(bucket, 5.0) == pytest.approx(5.1)
+
+
+def test_gcra_burst_allows_back_to_back_sends():
+    bucket = TokenBucket(rate=1, burst=3)
+    assert [take(bucket, 0.0) for _ in range(4)] == pytest.approx([0.0, 0.0, 0.0, 1.0])
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket()
+    assert [take(bucket, 7.0) for _ in range(5)] == [7.0] * 5
+
+
+def test_one_throttling_event_slows_down_once():
+    bucket = TokenBucket(rate=8)
+    # Three sessions in flight when the provider starts throttling
+    for sent_at, now in ((9.5, 10.0), (9.6, 10.1), (9.7, 10.2)):
+        bucket.slow_down(now, min_rate=0.1, max_cooldown=60, sent_at=sent_at)
+    assert bucket.rate == 4
+    assert bucket.throttle_streak == 1
+    assert bucket.blocked_until == 12.0
+
+    # A send started after the slow-down that is throttled again is a new event
+    bucket.slow_down(13.0, min_rate=0.1, max_cooldown=60, sent_at=12.5)
+    assert bucket.rate == 2
+    assert bucket.throttle_streak == 2
+    assert bucket.blocked_until == 17.0
+
+
+def test_rate_recovers_after_successes():
+    bucket = TokenBucket(rate=8)
+    bucket.slow_down(0.0, min_rate=0.1, max_cooldown=60)
+    for _ in range(10):
+        bucket.speed_up(max_rate=50)
+    assert bucket.rate == 8
+    assert bucket.throttle_streak == 0
+
+
+def test_sender_quota_hourly_window():
+    quota = SenderQuota(hourly=2)
+    assert [quota.claim(0.0) for _ in range(3)] == [0.0, 0.0, 3600.0]
+    # Sends already due later keep their order
+    assert quota.claim(100.0) == 3600.0
+
+
+def test_sender_quota_daily_window():
+    quota = SenderQuota(hourly=2, daily=3)
+    assert [quota.claim(0.0) for _ in range(4)] == [0.0, 0.0, 3600.0, 86400.0]
+
+
+def test_sender_quota_usage_counts_the_current_windows(clock):
+    quota = SenderQuota(hourly=10, daily=10)
+    for t in (clock.now - 7200, clock.now - 60, clock.now):
+        quota.claim(t)
+    assert quota.usage() == {'hourly': 2, 'daily': 3}
+
+
+def test_released_quota_slot_is_reused():
+    quota = SenderQuota(hourly=1)
+    assert quota.claim(0.0) == 0.0
+    slot = quota.claim(0.0)
+    assert slot == 3600.0
+    quota.release(slot)
+    assert quota.claim(10.0) == 3600.0
+
+
+def test_released_slot_leaves_earlier_sends_in_the_window():
+    quota = SenderQuota(hourly=2)
+    assert [quota.claim(0.0), quota.claim(1.0)] == [0.0, 1.0]
+    # Two workers queue up for the next window, then the campaign is cancelled
+    waiting = [quota.claim(2.0), quota.claim(2.0)]
+    assert waiting == [3600.0, 3601.0]
+    for slot in waiting:
+        quota.release(slot)
+    # Both sends of the first hour still count
+    assert quota.claim(3.0) == 3600.0
+
+
+def test_limiter_gives_back_quota_of_a_cancelled_wait(clock):
+    limiter = RateLimiter(quota=SenderQuota(hourly=1))
+    assert limiter.reserve('example.com') == clock.now
+    slot = limiter.reserve('example.com')
+    assert slot == clock.now + 3600
+    # The campaign is cancelled during the wait
+    limiter.release(slot)
+    assert limiter.reserve('example.com') == clock.now + 3600
+
+
+def test_limiter_slows_down_once_per_throttling_event(clock):
+    limiter = RateLimiter(rate=8, burst=1)
+    sent_at = clock.now
+    clock.now += 0.5
+    for _ in range(4):
+        assert limiter.record_failure('example.com', THROTTLED, sent_at)
+    assert limiter.throttled == 4
+    assert limiter.global_bucket.rate == 4
+    # The domain had no rate of its own, so it starts over from one send per second
+    assert limiter.domains['example.com'].rate == 0.5
+    assert limiter.domains['example.com'].throttle_streak == 1
+    # The cooldown holds back the next send
+    assert limiter.reserve('example.com') == clock.now + 2
+
+
+def test_limiter_ignores_other_failures(clock):
+    limiter = RateLimiter(rate=8)
+    assert not limiter.record_failure('example.com', smtplib.SMTPDataError(554, b'5.7.1 Rejected'))
+    assert limiter.global_bucket.rate == 8
+
+
+def test_unlimited_sender_recovers_gradually_after_a_421(clock):
+    limiter = RateLimiter()
+    # Sending unthrottled at 150 messages per second
+    for _ in range(20):
+        limiter.reserve('example.com')
+        clock.now += 1 / 150
+    assert limiter.record_failure('example.com', THROTTLED, clock.now)
+    assert limiter.global_bucket.rate == pytest.approx(75)
+
+    rates = []
+    for _ in range(10):
+        limiter.record_success('example.com')
+        rates.append(limiter.global_bucket.rate)
+    # Each success adds 5% of the pre-throttle pace; the limit only lifts once that pace is reached
+    assert rates[:9] == pytest.approx([82.5 + 7.5 * n for n in range(9)])
+    assert rates[-1] is None
+
+
+def test_sender_quotas_seeded_from_earlier_sends(clock, monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, 'time', lambda: 50_000.0)
+    quotas = SenderQuotas(hourly=2, daily=3)
+    # One send yesterday, two in the last hour, all before a restart
+    quotas.seed([('Me@Example.com', 50_000.0 - 90_000), ('me@example.com', 50_000.0 - 1800),
+                 ('me@example.com', 50_000.0 - 60)])
+    assert quotas.usage() == {'me@example.com': {'hourly': 2, 'daily': 2}}
+    # The hourly cap is used up until the older of the two leaves the window
+    assert quotas.get('me@example.com').claim(clock.now) == clock.now + 1800
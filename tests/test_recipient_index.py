@@ -0,0 +1,62 @@
+import smtplib
+
+import pytest
+
+from demo import EmailAutomation
+from recipient_index import BOUNCED, RecipientIndex
+from retry import is_bounce
+from send_queue import SendQueue
+from smtp_sink import SMTPSink
+
+ENGINES = ['threaded', 'async']
+
+
+def run_campaign(tmp_path, csv_path, sink, engine):
+    db_path = str(tmp_path / 'campaigns.db')
+    send_queue = SendQueue(db_path)
+    index = RecipientIndex(db_path, suppress_contacted=False)
+    campaign_id = send_queue.create_campaign(csv_path, {})
+    automation = EmailAutomation('me@example.com', 'password', 'Me', smtp_host=sink.host, smtp_port=sink.port,
+                                 pool_size=2, use_tls=False)
+    stats = automation.send_bulk_emails(csv_path, delay_seconds=0, test_mode=False, workers=2, engine=engine,
+                                        send_queue=send_queue, campaign_id=campaign_id, recipient_index=index)
+    return stats, index.counts()
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_refused_recipients_are_suppressed(tmp_path, contacts, engine):
+    csv_path = contacts(4)
+    with SMTPSink(replies={'RCPT': '550 5.1.1 User unknown'}) as sink:
+        stats, counts = run_campaign(tmp_path, csv_path, sink, engine)
+    assert stats['failed_to_send'] == 4
+    assert counts == {BOUNCED: 4}
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_refused_sender_suppresses_nobody(tmp_path, contacts, engine):
+    csv_path = contacts(4)
+    with SMTPSink(replies={'MAIL': '553 5.7.1 Sender address rejected'}) as sink:
+        stats, counts = run_campaign(tmp_path, csv_path, sink, engine)
+    assert stats['failed_to_send'] == 4
+    assert counts == {}
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_blocked_content_suppresses_nobody(tmp_path, contacts, engine):
+    csv_path = contacts(4)
+    with SMTPSink(replies={'DATA': '554 5.7.1 Message rejected as spam'}) as sink:
+        stats, counts = run_campaign(tmp_path, csv_path, sink, engine)
+    assert stats['failed_to_send'] == 4
+    assert counts == {}
+
+
+@pytest.mark.parametrize('exc, bounce', [
+    (smtplib.SMTPRecipientsRefused({'a@example.com': (550, b'5.1.1 User unknown')}), True),
+    (smtplib.SMTPDataError(550, b'5.1.1 Mailbox unavailable'), True),
+    (smtplib.SMTPSenderRefused(553, b'5.7.1 Sender address rejected', 'me@example.com'), False),
+    (smtplib.SMTPDataError(550, b'5.4.5 Daily sending quota exceeded'), False),
+    (smtplib.SMTPDataError(554, b'5.7.1 Message rejected as spam'), False),
+    (smtplib.SMTPRecipientsRefused({'a@example.com': (450, b'4.2.1 Try again later')}), False),
+])
+def test_only_recipient_rejections_are_bounces(exc, bounce):
+    assert is_bounce(exc) == bounce
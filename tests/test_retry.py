@@ -0,0 +1,32 @@
+import socket
+import smtplib
+
+import pytest
+
+from retry import PERMANENT, TRANSIENT, classify
+
+
+@pytest.mark.parametrize('exc, expected', [
+    (smtplib.SMTPNotSupportedError('SMTPUTF8 not supported by server'), (PERMANENT, 'smtp')),
+    (smtplib.SMTPException('No suitable authentication method found.'), (PERMANENT, 'smtp')),
+    (smtplib.SMTPAuthenticationError(535, b'5.7.8 Bad credentials'), (PERMANENT, 'auth')),
+    (smtplib.SMTPRecipientsRefused({'a@example.com': (550, b'5.1.1 User unknown')}), (PERMANENT, '550')),
+    (smtplib.SMTPResponseException(421, b'4.7.0 Try again later'), (TRANSIENT, '421')),
+])
+def test_smtp_errors(exc, expected):
+    assert classify(exc) == expected
+
+
+@pytest.mark.parametrize('exc, expected', [
+    (smtplib.SMTPServerDisconnected('Connection unexpectedly closed'), (TRANSIENT, 'disconnected')),
+    (smtplib.SMTPConnectError(None, 'Connection refused'), (TRANSIENT, 'connection')),
+    (ConnectionResetError(), (TRANSIENT, 'disconnected')),
+    (socket.timeout('timed out'), (TRANSIENT, 'timeout')),
+    (socket.gaierror(-2, 'Name or service not known'), (TRANSIENT, 'connection')),
+])
+def test_connection_errors_are_transient(exc, expected):
+    assert classify(exc) == expected
+
+
+def test_other_errors_are_permanent():
+    assert classify(ValueError('bad header')) == (PERMANENT, 'error')
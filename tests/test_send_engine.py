@@ -0,0 +1,58 @@
+import sqlite3
+import threading
+
+from contacts import open_contacts
+from demo import EmailAutomation
+from rate_limiter import RateLimiter
+from send_engine import SendEngine
+from smtp_sink import SMTPSink
+
+
+def empty_stats(total):
+    return {'total_emails': total, 'sent_successfully': 0, 'failed_to_send': 0, 'retried': 0,
+            'failed_emails': [], 'failure_reasons': {}}
+
+
+def run_engine(engine, automation, csv_path, total):
+    """Run the engine on a thread so a hang fails the test instead of blocking it"""
+    stats = empty_stats(total)
+    rows = automation._campaign_rows(open_contacts(csv_path))
+    thread = threading.Thread(target=engine.run, args=(rows, stats), daemon=True)
+    thread.start()
+    thread.join(timeout=20)
+    assert not thread.is_alive(), 'send engine did not finish'
+    return stats
+
+
+def test_failing_checkpoint_does_not_stall_the_campaign(contacts):
+    csv_path = contacts(10)
+    automation = EmailAutomation('me@example.com', 'password', 'Me')
+
+    def checkpoint(index, recruiter_email, state, error):
+        if index % 3 == 0:
+            raise sqlite3.OperationalError('database is locked')
+
+    engine = SendEngine(automation, workers=2, test_mode=True, checkpoint=checkpoint)
+    stats = run_engine(engine, automation, csv_path, 10)
+    assert stats['sent_successfully'] == 10
+
+
+def test_unexpected_send_error_fails_only_that_row(contacts):
+    csv_path = contacts(9)
+
+    class BrokenLimiter(RateLimiter):
+        def reserve(self, domain=''):
+            if domain == 'company1.com':
+                raise RuntimeError('limiter bug')
+            return super().reserve(domain)
+
+    with SMTPSink() as sink:
+        automation = EmailAutomation('me@example.com', 'password', 'Me', smtp_host=sink.host, smtp_port=sink.port,
+                                     pool_size=2, use_tls=False)
+        engine = SendEngine(automation, workers=2, rate_limiter=BrokenLimiter(), test_mode=False)
+        stats = run_engine(engine, automation, csv_path, 9)
+        delivered = sink.message_count
+    assert stats['sent_successfully'] == 6
+    assert stats['failed_to_send'] == 3
+    assert stats['failure_reasons'] == {'error': 3}
+    assert delivered == 6
@@ -0,0 +1,86 @@
+import pytest
+
+from demo import EmailAutomation
+from send_queue import COMPLETED, FAILED, PENDING, REJECTED, RETRYING, SENT, SendQueue
+from smtp_sink import SMTPSink
+
+
+@pytest.fixture
+def send_queue(tmp_path):
+    queue = SendQueue(str(tmp_path / 'campaigns.db'), batch_size=3, flush_interval=3600)
+    yield queue
+    queue.close()
+
+
+def states(send_queue, campaign_id):
+    return dict(send_queue._conn.execute(
+        'SELECT row_index, state FROM recipients WHERE campaign_id = ?', (campaign_id,)).fetchall())
+
+
+def test_enqueue_keeps_the_state_of_known_rows(send_queue):
+    campaign_id = send_queue.create_campaign('a.csv', {})
+    send_queue.enqueue(campaign_id, [0, 1, 2], ['a@x.com', 'b@x.com', 'c@x.com'])
+    send_queue.record(campaign_id, 1, 'b@x.com', SENT)
+    send_queue.flush()
+    # A resumed campaign enqueues every chunk again
+    send_queue.enqueue(campaign_id, [0, 1, 2, 3], ['a@x.com', 'b@x.com', 'c@x.com', 'd@x.com'])
+    assert states(send_queue, campaign_id) == {0: PENDING, 1: SENT, 2: PENDING, 3: PENDING}
+
+
+def test_progress_counts_each_state(send_queue):
+    campaign_id = send_queue.create_campaign('a.csv', {})
+    send_queue.enqueue(campaign_id, range(6), [f'{n}@x.com' for n in range(6)])
+    for index, state in ((0, SENT), (1, SENT), (2, FAILED), (3, REJECTED), (4, RETRYING)):
+        send_queue.record(campaign_id, index, f'{index}@x.com', state, None if state == SENT else 'error')
+    send_queue.flush()
+    assert send_queue.progress(campaign_id) == {
+        'pending': 1, 'sent': 2, 'failed': 2, 'retrying': 1, 'failed_emails': ['2@x.com', '3@x.com'],
+    }
+    assert sorted(send_queue.finished_rows(campaign_id).tolist()) == [0, 1, 2, 3]
+
+
+def test_results_are_written_in_batches(send_queue, tmp_path):
+    campaign_id = send_queue.create_campaign('a.csv', {})
+    reader = SendQueue(str(tmp_path / 'campaigns.db'))
+    send_queue.record(campaign_id, 0, 'a@x.com', SENT)
+    send_queue.record(campaign_id, 1, 'b@x.com', SENT)
+    assert reader.progress(campaign_id)['sent'] == 0
+    # The third record fills the batch and commits all three
+    send_queue.record(campaign_id, 2, 'c@x.com', SENT)
+    assert reader.progress(campaign_id)['sent'] == 3
+    send_queue.record(campaign_id, 3, 'd@x.com', FAILED, 'error')
+    assert reader.progress(campaign_id)['failed'] == 0
+    send_queue.flush()
+    assert reader.progress(campaign_id)['failed'] == 1
+    reader.close()
+
+
+def test_resume_skips_rows_already_finished(send_queue, contacts):
+    csv_path = contacts(10)
+    campaign_id = send_queue.create_campaign(csv_path, {})
+    # An earlier run reached the first four recipients before it was interrupted
+    for index in range(4):
+        send_queue.record(campaign_id, index, f'person{index}@company{index % 3}.com', SENT)
+    send_queue.flush()
+    with SMTPSink() as sink:
+        automation = EmailAutomation('me@example.com', 'password', 'Me', smtp_host=sink.host, smtp_port=sink.port,
+                                     use_tls=False)
+        stats = automation.send_bulk_emails(csv_path, delay_seconds=0, test_mode=False, send_queue=send_queue,
+                                            campaign_id=campaign_id)
+        recipients = sorted(rcpt for message in sink.messages for rcpt in message.rcpt_tos)
+    assert recipients == sorted(f'<person{i}@company{i % 3}.com>' for i in range(4, 10))
+    assert stats['sent_successfully'] == 10
+    assert send_queue.get_campaign(campaign_id)['status'] == COMPLETED
+    assert send_queue.progress(campaign_id)['sent'] == 10
+
+
+def test_sent_times_cover_real_sends_only(send_queue):
+    real = send_queue.create_campaign('a.csv', {'test_mode': False, 'sender_email': 'me@example.com'})
+    dry_run = send_queue.create_campaign('a.csv', {'test_mode': True, 'sender_email': 'me@example.com'})
+    legacy = send_queue.create_campaign('a.csv', {'test_mode': False})
+    for campaign_id in (real, dry_run, legacy):
+        send_queue.record(campaign_id, 0, 'a@example.com', SENT)
+        send_queue.record(campaign_id, 1, 'b@example.com', FAILED)
+    send_queue.flush()
+    sent = send_queue.sent_times(0)
+    assert [sender for sender, _ in sent] == ['me@example.com']
@@ -0,0 +1,136 @@
+import time
+
+import pytest
+
+import smtp_pool
+from smtp_pool import SMTPConnectionPool, close_all_pools, get_pool
+from smtp_sink import SMTPSink
+
+PAYLOAD = b'Subject: Hi\r\n\r\nHello\r\n'
+
+
+class Clock:
+    """Stands in for the time module inside smtp_pool so tests can step monotonic time"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.perf_counter = time.perf_counter
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(smtp_pool, 'time', clock)
+    return clock
+
+
+def make_pool(sink, **kwargs):
+    return SMTPConnectionPool(sink.host, sink.port, 'me@example.com', 'password', use_tls=False, **kwargs)
+
+
+def restart(sink):
+    # Hang up on every open session, then listen on the same port again
+    sink.stop()
+    return SMTPSink(port=sink.port).start()
+
+
+def test_idle_connections_are_evicted_on_acquire(clock):
+    with SMTPSink() as sink:
+        pool = make_pool(sink, idle_timeout=60, health_check_interval=600)
+        first = pool.acquire()
+        pool.release(first)
+
+        clock.now += 30
+        conn = pool.acquire()
+        assert conn is first
+        pool.release(conn)
+
+        clock.now += 61
+        conn = pool.acquire()
+        assert conn is not first
+        assert first.smtp is None
+        assert pool.stats['evicted'] == 1
+        assert pool.stats['connects'] == 2
+        pool.release(conn)
+        pool.close()
+
+
+def test_noop_health_check_replaces_dead_sessions(clock):
+    sink = SMTPSink().start()
+    try:
+        pool = make_pool(sink, idle_timeout=None, health_check_interval=10)
+        conn = pool.acquire()
+        pool.release(conn)
+
+        # A live session answers NOOP and is handed out as is
+        clock.now += 11
+        assert pool.acquire() is conn
+        assert pool.stats['reconnects'] == 0
+        pool.release(conn)
+
+        sink = restart(sink)
+        # Within the check interval the session is trusted without a NOOP
+        assert conn.smtp is not None
+        clock.now += 11
+        conn = pool.acquire()
+        assert pool.stats['reconnects'] == 1
+        assert conn.is_alive()
+        assert sink.connections == 1
+        pool.release(conn)
+        pool.close()
+    finally:
+        sink.stop()
+
+
+def test_sendmail_reconnects_after_the_server_hangs_up(clock):
+    sink = SMTPSink().start()
+    try:
+        pool = make_pool(sink, health_check_interval=600)
+        with pool.connection() as conn:
+            conn.sendmail('me@example.com', ['a@example.com'], PAYLOAD)
+
+        sink = restart(sink)
+        with pool.connection() as conn:
+            conn.sendmail('me@example.com', ['b@example.com'], PAYLOAD)
+        assert pool.stats['reconnects'] == 1
+        assert [message.rcpt_tos for message in sink.messages] == [['<b@example.com>']]
+        pool.close()
+    finally:
+        sink.stop()
+
+
+def test_acquire_times_out_when_every_connection_is_borrowed():
+    with SMTPSink() as sink:
+        pool = make_pool(sink, pool_size=1)
+        conn = pool.acquire()
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            pool.acquire(timeout=0.2)
+        assert time.monotonic() - started >= 0.2
+
+        # Giving the connection back frees the slot
+        pool.release(conn)
+        assert pool.acquire(timeout=0.2) is conn
+        pool.release(conn)
+        pool.close()
+
+
+def test_close_all_pools_closes_shared_pools():
+    with SMTPSink() as sink:
+        pool = get_pool(sink.host, sink.port, 'close-all@example.com', 'password', use_tls=False)
+        assert get_pool(sink.host, sink.port, 'close-all@example.com', 'password') is pool
+        assert pool.check()
+        conn = pool.acquire()
+        pool.release(conn)
+
+        close_all_pools()
+        assert conn.smtp is None
+        with pytest.raises(RuntimeError, match='closed'):
+            pool.acquire()
+        # The next caller gets a fresh pool
+        fresh = get_pool(sink.host, sink.port, 'close-all@example.com', 'password', use_tls=False)
+        assert fresh is not pool
+        fresh.close()
@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+from demo import EmailAutomation
+from retry import RetryPolicy
+from send_queue import SENT, SendQueue
+from smtp_sink import SMTPSink
+
+ENGINES = ['threaded', 'async']
+
+
+def send(sink, csv_path, engine, retry_policy=None, **kwargs):
+    automation = EmailAutomation('me@example.com', 'password', 'Me', smtp_host=sink.host, smtp_port=sink.port,
+                                 pool_size=2, use_tls=False)
+    return automation.send_bulk_emails(csv_path, delay_seconds=0, test_mode=False, workers=2, engine=engine,
+                                       retry_policy=retry_policy, **kwargs)
+
+
+class FlakySendQueue(SendQueue):
+    """SendQueue whose checkpoint write fails for every third row"""
+
+    def record(self, campaign_id, row_index, email, state, error=None):
+        if row_index % 3 == 0:
+            raise sqlite3.OperationalError('database is locked')
+        super().record(campaign_id, row_index, email, state, error)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_every_message_reaches_the_sink(contacts, engine):
+    csv_path = contacts(12)
+    with SMTPSink() as sink:
+        stats = send(sink, csv_path, engine)
+        recipients = sorted(rcpt for message in sink.messages for rcpt in message.rcpt_tos)
+    assert stats['sent_successfully'] == 12
+    assert stats['failed_to_send'] == 0
+    assert recipients == sorted(f'<person{i}@company{i % 3}.com>' for i in range(12))
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_permanent_rejections_fail_without_retry(contacts, engine):
+    csv_path = contacts(6)
+    with SMTPSink(error_rate=1.0, seed=0) as sink:
+        stats = send(sink, csv_path, engine, RetryPolicy(max_attempts=3, base_delay=0.01))
+        rejected = sink.rejected
+    assert stats['sent_successfully'] == 0
+    assert stats['failed_to_send'] == 6
+    assert stats['retried'] == 0
+    assert rejected == 6
+    assert stats['failure_reasons'] == {'550': 6}
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_throttled_sends_are_retried(contacts, engine):
+    csv_path = contacts(8)
+    # Four messages per second, then 421 until the window passes
+    with SMTPSink(max_rate=4) as sink:
+        stats = send(sink, csv_path, engine, RetryPolicy(max_attempts=6, base_delay=0.2, max_delay=1))
+        throttled = sink.throttled
+    assert stats['sent_successfully'] == 8
+    assert stats['failed_to_send'] == 0
+    assert stats['retried'] >= 1
+    assert throttled >= 1
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_failing_checkpoint_does_not_stop_the_campaign(contacts, tmp_path, engine):
+    csv_path = contacts(12)
+    send_queue = FlakySendQueue(str(tmp_path / 'campaigns.db'))
+    campaign_id = send_queue.create_campaign(csv_path, {})
+    with SMTPSink() as sink:
+        stats = send(sink, csv_path, engine, send_queue=send_queue, campaign_id=campaign_id)
+        delivered = sink.message_count
+    assert stats['sent_successfully'] == 12
+    assert stats['failed_to_send'] == 0
+    assert delivered == 12
+    # Only the rows whose checkpoint failed are missing from the queue
+    assert len(send_queue.results(campaign_id, SENT)) == 8
+    send_queue.close()
@@ -0,0 +1,43 @@
+import pytest
+
+from template_engine import ROW_ARGS, CompiledTemplate, EmailTemplate
+
+CSS = '<style>p {{ margin: 0; color: #333; }}</style>'
+
+
+def test_css_with_doubled_braces_renders_single_braces():
+    template = EmailTemplate('{role} at {company_name}', CSS + '<p>Hi {recruiter_name}</p>', 'Hi {recruiter_name}')
+    template.validate()
+    subject, html, text = template.render({'role': 'Engineer', 'company_name': 'Acme', 'recruiter_name': 'Sam'})
+    assert html == '<style>p { margin: 0; color: #333; }</style><p>Hi Sam</p>'
+    assert template.fields == {'role', 'company_name', 'recruiter_name'}
+
+
+@pytest.mark.parametrize('source', [
+    '<style>p { margin: 0; color: #333; }</style>',
+    '<style>p { margin: 0 }}</style>',
+    '<style>p {color:red}</style>',
+])
+def test_single_braces_in_css_point_at_escaping(source):
+    with pytest.raises(ValueError, match='write {{ and }}'):
+        EmailTemplate('Hi', source, 'Hi').validate()
+
+
+@pytest.mark.parametrize('source', ['{role!z}', "{role!'}"])
+def test_unknown_conversions_are_rejected(source):
+    with pytest.raises(ValueError, match='Unsupported conversion'):
+        CompiledTemplate(source)
+
+
+def test_render_row_matches_render():
+    template = EmailTemplate('{role} at {company_name}', '<p>Hi {recruiter_name}, {signature}</p>',
+                             '{recruiter_email} from {sender_name} <{sender_email}>', constants={'signature': 'S'})
+    values = {'company_name': 'Acme', 'role': 'Engineer', 'recruiter_email': 'sam@acme.com',
+              'recruiter_first_name': '', 'recruiter_name': 'Sam', 'sender_name': 'Me', 'sender_email': 'me@x.com'}
+    assert template.render_row(*(values[arg] for arg in ROW_ARGS)) == template.render(values)[1:]
+
+
+def test_render_row_needs_fields_outside_the_row_by_keyword():
+    template = EmailTemplate('Hi', 'Hi {nickname}', 'Hi')
+    with pytest.raises(TypeError, match='nickname'):
+        template.render_row('Acme', 'Engineer', 'sam@acme.com', '', 'Sam', 'Me', 'me@x.com')